@@ -1,12 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session as FlaskSession
+import click
+from sqlalchemy import bindparam, case, create_engine, delete, event, exists, insert, literal, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
 import os
+import atexit
+import cProfile
+import csv
+import contextvars
+import hmac
+import itertools
+import io
+import fcntl
+import json
 import logging
+import math
+import pstats
 import re
-from datetime import datetime
+import sqlite3
+import resource
+import sys
+import tempfile
+import queue
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него сжатие только gzip
+    brotli = None
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -23,12 +60,176 @@ app = Flask(__name__)
 
 # Конфигурация базы данных
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "blog.db")}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f'sqlite:///{os.path.join(basedir, "blog.db")}'
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Групповая фиксация комментариев (выключена по умолчанию)
+app.config['COMMENT_GROUP_COMMIT'] = os.environ.get('COMMENT_GROUP_COMMIT', '0') == '1'
+app.config['COMMENT_GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('COMMENT_GROUP_COMMIT_WINDOW_MS', '5'))
+app.config['COMMENT_GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('COMMENT_GROUP_COMMIT_MAX_BATCH', '100'))
+
+# Контроль допуска запросов: лимиты на клиента и общий предел параллельности
+app.config['ADMISSION_CONTROL_ENABLED'] = os.environ.get('ADMISSION_CONTROL_ENABLED', '0') == '1'
+app.config['RATE_LIMIT_READ_PER_SEC'] = float(os.environ.get('RATE_LIMIT_READ_PER_SEC', '20'))
+app.config['RATE_LIMIT_READ_BURST'] = int(os.environ.get('RATE_LIMIT_READ_BURST', '40'))
+app.config['RATE_LIMIT_WRITE_PER_SEC'] = float(os.environ.get('RATE_LIMIT_WRITE_PER_SEC', '5'))
+app.config['RATE_LIMIT_WRITE_BURST'] = int(os.environ.get('RATE_LIMIT_WRITE_BURST', '10'))
+app.config['RATE_LIMIT_IDLE_SECONDS'] = float(os.environ.get('RATE_LIMIT_IDLE_SECONDS', '300'))
+app.config['MAX_CONCURRENT_REQUESTS'] = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '64'))
+
+# Метрики в формате Prometheus
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Каталог для обмена метриками между процессами (например, воркерами gunicorn)
+app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('METRICS_MULTIPROC_DIR')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Инструментирование SQL: заголовки X-DB-* (всегда в режиме отладки) и журнал медленных запросов
+app.config['SQL_DEBUG_HEADERS'] = os.environ.get('SQL_DEBUG_HEADERS', '0') == '1'
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', os.path.join(basedir, 'slow_queries.log'))
+app.config['SQL_WARN_FULL_SCANS'] = os.environ.get('SQL_WARN_FULL_SCANS', '0') == '1'
+# Бюджет SQL-запросов маршрутов: off - не проверять (продакшен), log - предупреждение
+# в журнале (staging), raise - исключение (тесты)
+app.config['QUERY_BUDGET_MODE'] = os.environ.get('QUERY_BUDGET_MODE', 'off')
+
+# Профилирование отдельных запросов: cProfile включается только при PROFILING_ENABLED
+# и заголовке X-Profile с секретом PROFILING_SECRET
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+app.config['PROFILING_SECRET'] = os.environ.get('PROFILING_SECRET')
+app.config['PROFILING_DIR'] = os.environ.get('PROFILING_DIR', os.path.join(basedir, 'profiles'))
+
+# Токен служебных эндпоинтов /admin/* (заголовок X-Admin-Token); без токена они недоступны
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+# Профилирование памяти через tracemalloc: глубина стека и число хранимых снимков
+app.config['MEMORY_TRACE_FRAMES'] = int(os.environ.get('MEMORY_TRACE_FRAMES', '10'))
+app.config['MEMORY_SNAPSHOTS_LIMIT'] = int(os.environ.get('MEMORY_SNAPSHOTS_LIMIT', '10'))
+
+# Массовое удаление комментариев: строк в одной транзакции и пауза между транзакциями,
+# чтобы блокировка записи SQLite не удерживалась долго
+app.config['BULK_DELETE_CHUNK_SIZE'] = int(os.environ.get('BULK_DELETE_CHUNK_SIZE', '1000'))
+app.config['BULK_DELETE_PAUSE_MS'] = float(os.environ.get('BULK_DELETE_PAUSE_MS', '5'))
+
+# Мягкое удаление: строки помечаются deleted_at, фоновый поток удаляет их физически
+# небольшими пачками, когда сервис простаивает COMPACTION_IDLE_SECONDS
+app.config['COMPACTION_ENABLED'] = os.environ.get('COMPACTION_ENABLED', '1') == '1'
+app.config['COMPACTION_INTERVAL_SECONDS'] = float(os.environ.get('COMPACTION_INTERVAL_SECONDS', '5'))
+app.config['COMPACTION_IDLE_SECONDS'] = float(os.environ.get('COMPACTION_IDLE_SECONDS', '2'))
+app.config['COMPACTION_BATCH_SIZE'] = int(os.environ.get('COMPACTION_BATCH_SIZE', '500'))
+app.config['COMPACTION_VACUUM_PAGES'] = int(os.environ.get('COMPACTION_VACUUM_PAGES', '1000'))
+
+# Мульти-выборка GET /posts?ids=... и GET /comments?ids=...: максимум идентификаторов в запросе
+app.config['MULTI_GET_MAX_IDS'] = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+
+# Поток событий комментариев поста (SSE): пульс для прокси, максимальная длительность
+# соединения (клиент переподключается с Last-Event-ID), очередь событий на подписчика
+app.config['SSE_HEARTBEAT_SECONDS'] = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+app.config['SSE_MAX_STREAM_SECONDS'] = float(os.environ.get('SSE_MAX_STREAM_SECONDS', '300'))
+app.config['SSE_QUEUE_SIZE'] = int(os.environ.get('SSE_QUEUE_SIZE', '100'))
+app.config['SSE_RETRY_MS'] = int(os.environ.get('SSE_RETRY_MS', '3000'))
+
+# Страницы комментариев поста: размер первой страницы, которая хранится готовым JSON
+# в таблице comment_pages, и максимальный ?limit= в GET /posts/<id>/comments
+app.config['COMMENT_PAGE_SIZE'] = int(os.environ.get('COMMENT_PAGE_SIZE', '20'))
+app.config['COMMENTS_MAX_LIMIT'] = int(os.environ.get('COMMENTS_MAX_LIMIT', '100'))
+
+# Горячие посты GET /posts/hot: период полураспада вклада комментария в рейтинг
+# (после изменения нужен пересчет flask hot-scores) и размеры списка
+app.config['HOT_HALF_LIFE_HOURS'] = float(os.environ.get('HOT_HALF_LIFE_HOURS', '24'))
+app.config['HOT_DEFAULT_LIMIT'] = int(os.environ.get('HOT_DEFAULT_LIMIT', '10'))
+app.config['HOT_MAX_LIMIT'] = int(os.environ.get('HOT_MAX_LIMIT', '100'))
+
+# Журнал изменений GET /changes: размер страницы по умолчанию и максимальный
+app.config['CHANGES_DEFAULT_LIMIT'] = int(os.environ.get('CHANGES_DEFAULT_LIMIT', '100'))
+app.config['CHANGES_MAX_LIMIT'] = int(os.environ.get('CHANGES_MAX_LIMIT', '1000'))
+
+# Выгрузка всех данных (GET /export, flask export): строк за одну выборку и уровень gzip
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+app.config['EXPORT_GZIP_LEVEL'] = int(os.environ.get('EXPORT_GZIP_LEVEL', '6'))
+
+# Горячее резервное копирование (flask backup и фоновое задание): страниц SQLite за шаг
+# backup API и пауза между шагами, за которую писатели успевают зафиксировать изменения.
+# BACKUP_INTERVAL_SECONDS > 0 включает копирование по расписанию с хранением BACKUP_KEEP копий
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', os.path.join(basedir, 'backups'))
+app.config['BACKUP_PAGES_PER_STEP'] = int(os.environ.get('BACKUP_PAGES_PER_STEP', '100'))
+app.config['BACKUP_STEP_PAUSE_MS'] = float(os.environ.get('BACKUP_STEP_PAUSE_MS', '10'))
+app.config['BACKUP_INTERVAL_SECONDS'] = float(os.environ.get('BACKUP_INTERVAL_SECONDS', '0'))
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', '7'))
+# После стольких перезапусков из-за записей копия снимается одним шагом
+app.config['BACKUP_MAX_RESTARTS'] = int(os.environ.get('BACKUP_MAX_RESTARTS', '5'))
+
+# Пакетные запросы POST /batch: максимум операций в одном пакете
+app.config['BATCH_MAX_OPERATIONS'] = int(os.environ.get('BATCH_MAX_OPERATIONS', '25'))
+
+# Сжатие ответов по Accept-Encoding: gzip всегда, brotli - если установлен пакет brotli
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+app.config['COMPRESSION_GZIP_LEVEL'] = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+app.config['COMPRESSION_BROTLI_LEVEL'] = int(os.environ.get('COMPRESSION_BROTLI_LEVEL', '4'))
+app.config['COMPRESSION_MIMETYPES'] = (
+    'application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/event-stream'
+)
+
 # Инициализация расширений
 db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# SQLite не умеет ALTER TABLE для ограничений, миграции пересоздают таблицы (batch)
+migrate = Migrate(app, db, directory=os.path.join(basedir, 'migrations'), render_as_batch=True)
+
+# Рейтинг горячих постов. Вклад комментария убывает вдвое за HOT_HALF_LIFE_HOURS;
+# вместо суммы вкладов на текущий момент хранится log2 суммы 2^((t - HOT_EPOCH) / T½):
+# все посты стареют одинаково, поэтому порядок по хранимому значению не меняется со
+# временем, и оно обновляется только при добавлении и удалении комментариев
+HOT_EPOCH = datetime(2026, 1, 1)
+
+def hot_units(moment):
+    """Момент времени в периодах полураспада от HOT_EPOCH"""
+    return (moment - HOT_EPOCH).total_seconds() / 3600 / app.config['HOT_HALF_LIFE_HOURS']
+
+def _hot_add(score, units):
+    """log2(2^score + 2^units) без переполнения; score NULL - комментариев нет"""
+    if score is None:
+        return units
+    high, low = max(score, units), min(score, units)
+    return high + math.log2(1 + 2 ** (low - high))
+
+def _hot_remove(score, units):
+    """log2(2^score - 2^units); NULL, если остальные вклады за пределами точности"""
+    if score is None:
+        return None
+    rest = 1 - 2 ** (units - score)
+    if rest <= 1e-12:
+        return None
+    return score + math.log2(rest)
+
+class _HotSum:
+    """Агрегат hot_sum(units) для полного пересчета рейтинга"""
+    def __init__(self):
+        self.score = None
+    
+    def step(self, units):
+        if units is not None:
+            self.score = _hot_add(self.score, units)
+    
+    def finalize(self):
+        return self.score
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """SQLite проверяет внешние ключи и выполняет ON DELETE CASCADE только с PRAGMA foreign_keys=ON.
+
+    auto_vacuum=INCREMENTAL действует только для новой базы (до создания таблиц);
+    существующую базу нужно один раз перестроить командой VACUUM. Функции
+    hot_add, hot_remove и hot_sum пересчитывают рейтинг горячих постов в SQL.
+    """
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.close()
+        dbapi_connection.create_function('hot_add', 2, _hot_add, deterministic=True)
+        dbapi_connection.create_function('hot_remove', 2, _hot_remove, deterministic=True)
+        dbapi_connection.create_aggregate('hot_sum', 1, _HotSum)
 
 # Модель Post
 class Post(db.Model):
@@ -39,9 +240,20 @@ class Post(db.Model):
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Отметка мягкого удаления; строку физически удаляет фоновый компактор
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # log2 суммы вкладов живых комментариев (см. HOT_EPOCH); NULL - комментариев нет
+    hot_score = db.Column(db.Float, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_posts_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL')),
+        db.Index('ix_posts_hot_score', 'hot_score', sqlite_where=db.text('deleted_at IS NULL AND hot_score IS NOT NULL')),
+    )
     
-    # Связь с комментариями (один-ко-многим)
-    comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan')
+    # Связь с комментариями (один-ко-многим); комментарии удаляет сама база (ON DELETE CASCADE),
+    # ORM не загружает их при удалении поста
+    comments = db.relationship('Comment', backref='post', lazy=True, cascade='all, delete-orphan',
+                               passive_deletes=True)
     
     def __repr__(self):
         return f'<Post {self.title}>'
@@ -60,10 +272,20 @@ class Comment(db.Model):
     __tablename__ = 'comments'
     
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE', name='fk_comments_post_id_posts'),
+                        nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
     author = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Частичные индексы: список живых комментариев поста и поиск отметок для компактора
+        db.Index('ix_comments_post_id_live', 'post_id', 'created_at', sqlite_where=db.text('deleted_at IS NULL')),
+        db.Index('ix_comments_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL')),
+        # Комментарии автора новыми первыми: GET /authors/<author>/comments и массовое удаление по автору
+        db.Index('ix_comments_author_live', 'author', 'created_at', sqlite_where=db.text('deleted_at IS NULL')),
+    )
     
     def __repr__(self):
         return f'<Comment {self.id} by {self.author}>'
@@ -77,6 +299,418 @@ class Comment(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# Быстрый путь чтения списков: кортежи столбцов через Core вместо ORM-объектов
+# (без identity map, отслеживания состояния и вызова to_dict на каждую строку)
+POST_COLUMNS = (Post.__table__.c.id, Post.__table__.c.title, Post.__table__.c.content,
+                Post.__table__.c.created_at, Post.__table__.c.updated_at)
+COMMENT_COLUMNS = (Comment.__table__.c.id, Comment.__table__.c.post_id, Comment.__table__.c.content,
+                   Comment.__table__.c.author, Comment.__table__.c.created_at)
+
+def post_rows_to_dicts(rows):
+    """Посты в формате Post.to_dict() из кортежей POST_COLUMNS"""
+    return [{
+        'id': post_id,
+        'title': title,
+        'content': content,
+        'created_at': created_at.isoformat(),
+        'updated_at': updated_at.isoformat()
+    } for post_id, title, content, created_at, updated_at in rows]
+
+def comment_rows_to_dicts(rows):
+    """Комментарии в формате Comment.to_dict() из кортежей COMMENT_COLUMNS"""
+    return [{
+        'id': comment_id,
+        'post_id': post_id,
+        'content': content,
+        'author': author,
+        'created_at': created_at.isoformat()
+    } for comment_id, post_id, content, author, created_at in rows]
+
+# Журнал изменений для синхронизации клиентов
+class Change(db.Model):
+    """Запись журнала изменений; пишется в той же транзакции, что и само изменение.
+
+    seq назначается под блокировкой записи SQLite, поэтому порядок seq совпадает
+    с порядком фиксации; AUTOINCREMENT не дает повторно использовать номера.
+    """
+    __tablename__ = 'changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    post_id = db.Column(db.Integer, nullable=True)
+    op = db.Column(db.String(10), nullable=False)
+    # Состояние объекта после изменения (JSON как у to_dict); для удаления - NULL
+    data = db.Column(db.Text, nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Change {self.seq} {self.op} {self.entity} {self.entity_id}>'
+    
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'op': self.op,
+            'id': self.entity_id,
+            'post_id': self.post_id,
+            'data': json.loads(self.data) if self.data is not None else None,
+            'changed_at': self.changed_at.isoformat()
+        }
+
+class CommentPage(db.Model):
+    """Первая страница комментариев поста в готовом виде.
+
+    items - JSON новейших комментариев в порядке ответа, по одному на строку
+    (JSON не содержит переводов строк), total - число живых комментариев поста.
+    Если total равно числу элементов, страница содержит все комментарии.
+    """
+    __tablename__ = 'comment_pages'
+    
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE', name='fk_comment_pages_post_id_posts'),
+                        primary_key=True)
+    items = db.Column(db.Text, nullable=False)
+    total = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<CommentPage {self.post_id}: {self.total}>'
+
+class AuthorStats(db.Model):
+    """Сводка по автору комментариев, обновляется в транзакциях записи комментариев.
+
+    comment_count - число живых комментариев автора к живым постам; first_seen и
+    last_seen - время первого и последнего комментария автора за всю историю,
+    удаление комментариев их не сдвигает (NULL, если время комментариев неизвестно:
+    строки, вставленные в обход модели без created_at).
+    """
+    __tablename__ = 'author_stats'
+    
+    author = db.Column(db.String(100), primary_key=True)
+    comment_count = db.Column(db.Integer, nullable=False)
+    first_seen = db.Column(db.DateTime, nullable=True)
+    last_seen = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<AuthorStats {self.author}: {self.comment_count}>'
+    
+    def to_dict(self):
+        return {
+            'author': self.author,
+            'comment_count': self.comment_count,
+            'first_seen': self.first_seen.isoformat() if self.first_seen else None,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+        }
+
+def change_row(entity, op, entity_id, post_id=None, data=None):
+    """Значения строки журнала изменений"""
+    return {
+        'entity': entity,
+        'entity_id': entity_id,
+        'post_id': post_id,
+        'op': op,
+        'data': json.dumps(data, ensure_ascii=False) if data is not None else None,
+        'changed_at': datetime.utcnow()
+    }
+
+def comment_values_dict(comment_id, values):
+    """Комментарий в формате Comment.to_dict() из значений вставки"""
+    return {
+        'id': comment_id,
+        'post_id': values['post_id'],
+        'content': values['content'],
+        'author': values['author'],
+        'created_at': values['created_at'].isoformat()
+    }
+
+def record_change(executor, entity, op, entity_id, post_id=None, data=None):
+    """Запись в журнал изменений в текущей транзакции `executor` (сессии или соединения); возвращает seq"""
+    result = executor.execute(insert(Change.__table__), change_row(entity, op, entity_id, post_id, data))
+    return result.inserted_primary_key[0]
+
+# Выборка строк, не помеченных удаленными. Горячие выражения строятся один раз при
+# импорте с именованными параметрами: в запросе не создаются новые объекты выражения,
+# а ключ кэша компиляции движка у готового выражения вычисляется однажды
+LIVE_POST_BY_ID = select(Post).where(Post.id == bindparam('post_id'), Post.deleted_at.is_(None))
+LIVE_COMMENT_BY_ID = (
+    select(Comment).join(Post, Comment.post_id == Post.id)
+    .where(Comment.id == bindparam('comment_id'), Comment.deleted_at.is_(None), Post.deleted_at.is_(None))
+)
+LIVE_COMMENT_ROWS_BY_POST = (
+    select(*COMMENT_COLUMNS)
+    .where(Comment.__table__.c.post_id == bindparam('post_id'), Comment.__table__.c.deleted_at.is_(None))
+    .order_by(Comment.__table__.c.created_at.desc(), Comment.__table__.c.id.desc())
+)
+# Новейшие комментарии поста и число живых комментариев отдельными запросами: оконный
+# count(*) OVER () заставил бы SQLite прочитать и отсортировать все комментарии поста
+LIVE_COMMENT_PAGE_BY_POST = LIVE_COMMENT_ROWS_BY_POST.limit(bindparam('limit'))
+LIVE_COMMENT_COUNT_BY_POST = select(db.func.count()).select_from(Comment.__table__).where(
+    Comment.__table__.c.post_id == bindparam('post_id'), Comment.__table__.c.deleted_at.is_(None)
+)
+# Следующая страница: комментарии старше комментария `before`
+LIVE_COMMENT_ROWS_BEFORE = (
+    select(*COMMENT_COLUMNS)
+    .where(Comment.__table__.c.post_id == bindparam('post_id'), Comment.__table__.c.deleted_at.is_(None),
+           tuple_(Comment.__table__.c.created_at, Comment.__table__.c.id) < tuple_(
+               select(Comment.__table__.c.created_at).where(Comment.__table__.c.id == bindparam('before'))
+               .scalar_subquery(),
+               bindparam('before')
+           ))
+    .order_by(Comment.__table__.c.created_at.desc(), Comment.__table__.c.id.desc())
+    .limit(bindparam('limit'))
+)
+COMMENT_PAGE_BY_POST = select(CommentPage.items, CommentPage.total).where(CommentPage.post_id == bindparam('post_id'))
+# Имена параметров INSERT и UPDATE не должны совпадать с именами столбцов
+COMMENT_PAGE_UPDATE = update(CommentPage.__table__).where(CommentPage.post_id == bindparam('page_post_id')).values(
+    items=bindparam('page_items'), total=bindparam('page_total')
+)
+COMMENT_PAGE_REPLACE = insert(CommentPage.__table__).prefix_with('OR REPLACE').values(
+    post_id=bindparam('page_post_id'), items=bindparam('page_items'), total=bindparam('page_total')
+)
+
+def get_live_post(post_id):
+    """Пост по ID или None, если его нет или он помечен удаленным"""
+    return db.session.execute(LIVE_POST_BY_ID, {'post_id': post_id}).scalar_one_or_none()
+
+def get_live_comment(comment_id):
+    """Комментарий по ID или None, если он или его пост помечены удаленными"""
+    return db.session.execute(LIVE_COMMENT_BY_ID, {'comment_id': comment_id}).scalar_one_or_none()
+
+def live_comment_rows(post_id):
+    """Кортежи COMMENT_COLUMNS живых комментариев поста, новые первыми"""
+    return db.session.execute(LIVE_COMMENT_ROWS_BY_POST, {'post_id': post_id})
+
+# Готовая первая страница комментариев (таблица comment_pages)
+_JSON_DATA_PLACEHOLDER = '\x00'
+
+def render_json(obj):
+    """JSON в том же виде, что и тело ответа jsonify: компактный, ключи по алфавиту"""
+    return app.json.dumps(obj, separators=(',', ':'))
+
+def json_response_with_items(payload, items):
+    """Ответ jsonify(payload) с полем data из уже сериализованных элементов, без повторной сериализации.
+
+    Готовые элементы компактны, поэтому с отступами (режим отладки, app.json.compact
+    = False) ответ собирается обычным jsonify из разобранных элементов.
+    """
+    if not (app.json.compact or (app.json.compact is None and not app.debug)):
+        return jsonify({**payload, 'data': [json.loads(item) for item in items]})
+    body = render_json({**payload, 'data': _JSON_DATA_PLACEHOLDER}).replace(
+        render_json(_JSON_DATA_PLACEHOLDER), '[' + ','.join(items) + ']', 1)
+    return app.response_class(f'{body}\n', mimetype=app.json.mimetype)
+
+def first_comment_page(post_id, limit):
+    """Первые `limit` (None - все) комментариев поста: (список JSON комментариев, всего живых
+    комментариев) или None, если поста нет.
+
+    Если страница из comment_pages содержит ответ, это единственный запрос. Иначе
+    (страницы нет или нужно больше комментариев, чем в ней) ответ читается из
+    таблицы comments; страница при чтении не пишется - ее ведут транзакции записи.
+    """
+    page = db.session.execute(COMMENT_PAGE_BY_POST, {'post_id': post_id}).first()
+    if page is not None:
+        items = page.items.split('\n') if page.items else []
+        if page.total == len(items) or (limit is not None and limit <= len(items)):
+            return items[:limit], page.total
+    
+    if get_live_post(post_id) is None:
+        return None
+    if limit is None:
+        items = [render_json(comment) for comment in comment_rows_to_dicts(live_comment_rows(post_id))]
+        return items, len(items)
+    rows = db.session.execute(LIVE_COMMENT_PAGE_BY_POST, {'post_id': post_id, 'limit': limit})
+    items = [render_json(comment) for comment in comment_rows_to_dicts(rows)]
+    return items, db.session.execute(LIVE_COMMENT_COUNT_BY_POST, {'post_id': post_id}).scalar()
+
+def build_comment_page(executor, post_id):
+    """Страница поста заново из таблицы comments в транзакции записи `executor`"""
+    rows = executor.execute(LIVE_COMMENT_PAGE_BY_POST, {'post_id': post_id, 'limit': app.config['COMMENT_PAGE_SIZE']})
+    items = [render_json(comment) for comment in comment_rows_to_dicts(rows)]
+    total = executor.execute(LIVE_COMMENT_COUNT_BY_POST, {'post_id': post_id}).scalar()
+    executor.execute(COMMENT_PAGE_REPLACE, {'page_post_id': post_id, 'page_items': '\n'.join(items), 'page_total': total})
+
+def update_comment_page(executor, op, comment):
+    """Правка готовой страницы поста при записи комментария в транзакции `executor`.
+
+    op - insert (новый комментарий в начало, последний вытесняется), update
+    (замена на месте) или delete (удаление; хвост дочитывается из таблицы
+    comments). Вызывается после записи самого комментария: транзакция уже держит
+    блокировку записи, чтение и правка страницы не пересекаются с другими
+    писателями. Страница содержит min(COMMENT_PAGE_SIZE, total) новейших
+    комментариев; если ее нет, она строится целиком.
+    """
+    page = executor.execute(COMMENT_PAGE_BY_POST, {'post_id': comment['post_id']}).first()
+    if page is None:
+        build_comment_page(executor, comment['post_id'])
+        return
+    size = app.config['COMMENT_PAGE_SIZE']
+    items = page.items.split('\n') if page.items else []
+    total = page.total
+    ids = [json.loads(item)['id'] for item in items]
+    if op == 'insert':
+        items = [render_json(comment)] + items[:size - 1]
+        total += 1
+    elif op == 'delete':
+        if comment['id'] in ids:
+            del items[ids.index(comment['id'])]
+        total -= 1
+        if not items and total:
+            build_comment_page(executor, comment['post_id'])
+            return
+        if len(items) < min(size, total):
+            # Место удаленного занимает следующий по возрасту комментарий
+            rows = executor.execute(LIVE_COMMENT_ROWS_BEFORE, {'post_id': comment['post_id'],
+                                                               'before': json.loads(items[-1])['id'],
+                                                               'limit': min(size, total) - len(items)})
+            items += [render_json(row) for row in comment_rows_to_dicts(rows)]
+    elif comment['id'] in ids:
+        items[ids.index(comment['id'])] = render_json(comment)
+    else:
+        return
+    executor.execute(COMMENT_PAGE_UPDATE,
+                     {'page_post_id': comment['post_id'], 'page_items': '\n'.join(items), 'page_total': total})
+
+def rebuild_comment_pages(executor, *conditions):
+    """Построение страниц живых постов, отобранных `conditions`, заново; возвращает число страниц.
+    Нужен после вставки или удаления комментариев в обход API (flask seed, массовое удаление)."""
+    posts, comments = Post.__table__, Comment.__table__
+    pages = {post_id: [] for post_id in executor.execute(
+        select(posts.c.id).where(posts.c.deleted_at.is_(None), *conditions)).scalars()}
+    totals = dict.fromkeys(pages, 0)
+    # Одна выборка на все посты: номер комментария и число живых комментариев в окне поста.
+    # Окно считается по частичному индексу (post_id, created_at) без текстов комментариев,
+    # строки страницы дочитываются по первичному ключу
+    ranked = (
+        select(comments.c.id,
+               db.func.row_number().over(partition_by=comments.c.post_id,
+                                         order_by=(comments.c.created_at.desc(), comments.c.id.desc())).label('position'),
+               db.func.count().over(partition_by=comments.c.post_id).label('total'))
+        .join(posts, comments.c.post_id == posts.c.id)
+        .where(comments.c.deleted_at.is_(None), posts.c.deleted_at.is_(None), *conditions)
+        .subquery()
+    )
+    rows = executor.execute(
+        select(*COMMENT_COLUMNS, ranked.c.total)
+        .join(ranked, ranked.c.id == comments.c.id)
+        .where(ranked.c.position <= app.config['COMMENT_PAGE_SIZE'])
+        .order_by(comments.c.post_id, ranked.c.position)
+    ).all()
+    for comment, row in zip(comment_rows_to_dicts(row[:-1] for row in rows), rows):
+        pages[comment['post_id']].append(render_json(comment))
+        totals[comment['post_id']] = row.total
+    if pages:
+        executor.execute(COMMENT_PAGE_REPLACE, [
+            {'page_post_id': post_id, 'page_items': '\n'.join(items), 'page_total': totals[post_id]}
+            for post_id, items in pages.items()
+        ])
+    return len(pages)
+
+# Рейтинг горячих постов: правка hot_score одним UPDATE без чтения (updated_at не меняется)
+HOT_SCORE_ADD = update(Post.__table__).where(Post.__table__.c.id == bindparam('hot_post_id')).values(
+    hot_score=db.func.hot_add(Post.__table__.c.hot_score, bindparam('hot_units')),
+    updated_at=Post.__table__.c.updated_at
+)
+HOT_SCORE_REMOVE = update(Post.__table__).where(Post.__table__.c.id == bindparam('hot_post_id')).values(
+    hot_score=db.func.hot_remove(Post.__table__.c.hot_score, bindparam('hot_units')),
+    updated_at=Post.__table__.c.updated_at
+)
+HOT_POSTS = (
+    select(*POST_COLUMNS, Post.__table__.c.hot_score)
+    .where(Post.__table__.c.deleted_at.is_(None), Post.__table__.c.hot_score.isnot(None))
+    .order_by(Post.__table__.c.hot_score.desc())
+    .limit(bindparam('limit'))
+)
+
+def adjust_hot_score(executor, post_id, created_at, added):
+    """Учесть в рейтинге поста добавленный (added) или удаленный комментарий с временем created_at"""
+    executor.execute(HOT_SCORE_ADD if added else HOT_SCORE_REMOVE,
+                     {'hot_post_id': post_id, 'hot_units': hot_units(created_at)})
+
+def rebuild_hot_scores(executor, *conditions):
+    """Полный пересчет hot_score постов, отобранных `conditions`, по их живым комментариям;
+    возвращает число постов. Нужен после миграции 0006, flask seed и смены HOT_HALF_LIFE_HOURS."""
+    posts, comments = Post.__table__, Comment.__table__
+    units = (db.func.julianday(comments.c.created_at) - db.func.julianday(literal(HOT_EPOCH, db.DateTime))) \
+        * 24.0 / app.config['HOT_HALF_LIFE_HOURS']
+    score = select(db.func.hot_sum(units)).where(
+        comments.c.post_id == posts.c.id, comments.c.deleted_at.is_(None)
+    ).scalar_subquery()
+    return executor.execute(
+        update(posts).where(*conditions).values(hot_score=score, updated_at=posts.c.updated_at)
+    ).rowcount
+
+# Сводка по авторам: новый комментарий - upsert строки автора, удаление - вычитание без чтения
+_author_stats = AuthorStats.__table__
+_author_stats_insert = sqlite_insert(_author_stats).values(
+    author=bindparam('stats_author'), comment_count=1,
+    first_seen=bindparam('stats_created_at'), last_seen=bindparam('stats_created_at')
+)
+AUTHOR_STATS_ADD = _author_stats_insert.on_conflict_do_update(
+    index_elements=[_author_stats.c.author],
+    set_={
+        'comment_count': _author_stats.c.comment_count + 1,
+        # Многоаргументные min и max SQLite возвращают NULL, если хотя бы один аргумент NULL
+        'first_seen': db.func.min(db.func.coalesce(_author_stats.c.first_seen, _author_stats_insert.excluded.first_seen),
+                                  _author_stats_insert.excluded.first_seen),
+        'last_seen': db.func.max(db.func.coalesce(_author_stats.c.last_seen, _author_stats_insert.excluded.last_seen),
+                                 _author_stats_insert.excluded.last_seen)
+    }
+)
+AUTHOR_STATS_REMOVE = update(_author_stats).where(_author_stats.c.author == bindparam('stats_author')).values(
+    comment_count=_author_stats.c.comment_count - 1
+)
+AUTHOR_STATS = select(AuthorStats).where(AuthorStats.author == bindparam('author'))
+# Страницы комментариев автора к живым постам: поиск по ix_comments_author_live, пост - по ключу
+AUTHOR_COMMENT_ROWS = (
+    select(*COMMENT_COLUMNS)
+    .join(Post.__table__, Comment.__table__.c.post_id == Post.__table__.c.id)
+    .where(Comment.__table__.c.author == bindparam('author'), Comment.__table__.c.deleted_at.is_(None),
+           Post.__table__.c.deleted_at.is_(None))
+    .order_by(Comment.__table__.c.created_at.desc(), Comment.__table__.c.id.desc())
+    .limit(bindparam('limit'))
+)
+AUTHOR_COMMENT_ROWS_BEFORE = AUTHOR_COMMENT_ROWS.where(
+    tuple_(Comment.__table__.c.created_at, Comment.__table__.c.id) < tuple_(
+        select(Comment.__table__.c.created_at).where(Comment.__table__.c.id == bindparam('before')).scalar_subquery(),
+        bindparam('before')
+    )
+)
+
+def adjust_author_stats(executor, author, created_at, added):
+    """Учесть в сводке автора добавленный (added) или удаленный комментарий с временем created_at"""
+    if added:
+        executor.execute(AUTHOR_STATS_ADD, {'stats_author': author, 'stats_created_at': created_at})
+    else:
+        executor.execute(AUTHOR_STATS_REMOVE, {'stats_author': author})
+
+def remove_author_comments(executor, *conditions):
+    """Вычесть из сводок авторов живые комментарии, отобранные `conditions`, одним UPDATE ... FROM"""
+    comments = Comment.__table__
+    removed = (
+        select(comments.c.author, db.func.count().label('removed'))
+        .where(comments.c.deleted_at.is_(None), *conditions)
+        .group_by(comments.c.author)
+        .subquery()
+    )
+    executor.execute(
+        update(_author_stats).where(_author_stats.c.author == removed.c.author)
+        .values(comment_count=_author_stats.c.comment_count - removed.c.removed)
+    )
+
+def rebuild_author_stats(executor):
+    """Полный пересчет сводки по всем авторам; возвращает число авторов.
+    Нужен после вставки комментариев в обход API (flask seed)."""
+    posts, comments = Post.__table__, Comment.__table__
+    live = case((comments.c.deleted_at.is_(None) & posts.c.deleted_at.is_(None), 1), else_=0)
+    executor.execute(delete(_author_stats))
+    return executor.execute(insert(_author_stats).from_select(
+        ['author', 'comment_count', 'first_seen', 'last_seen'],
+        select(comments.c.author, db.func.sum(live), db.func.min(comments.c.created_at),
+               db.func.max(comments.c.created_at))
+        .join(posts, comments.c.post_id == posts.c.id)
+        .group_by(comments.c.author)
+    )).rowcount
+
 # Декоратор для логирования запросов
 def log_request(f):
     @wraps(f)
@@ -84,13 +718,847 @@ def log_request(f):
         logger.info(f"Запрос: {request.method} {request.url} от {request.remote_addr}")
         try:
             result = f(*args, **kwargs)
-            logger.info(f"Ответ: {request.method} {request.url} - Успешно")
+            stats = current_request_stats()
+            sql_summary = f" (SQL: {stats.db_queries} запросов, {stats.db_time * 1000:.1f} мс)" if stats else ''
+            logger.info(f"Ответ: {request.method} {request.url} - Успешно{sql_summary}")
             return result
         except Exception as e:
             logger.error(f"Ошибка в {request.method} {request.url}: {str(e)}")
             raise
     return decorated_function
 
+# Декоратор для служебных эндпоинтов
+def require_admin(f):
+    """Доступ только с верным X-Admin-Token; без настроенного ADMIN_TOKEN эндпоинт скрыт"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = app.config['ADMIN_TOKEN']
+        header = request.headers.get('X-Admin-Token')
+        if not token or not header or not hmac.compare_digest(header.encode('utf-8'), token.encode('utf-8')):
+            logger.warning(f"Отказ в доступе к служебному эндпоинту: {request.method} {request.url} от {request.remote_addr}")
+            return jsonify({
+                'success': False,
+                'error': 'Ресурс не найден',
+                'message': 'Запрашиваемый ресурс не существует'
+            }), 404
+        return f(*args, **kwargs)
+    return decorated_function
+
+# Метрики запросов
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsRegistry:
+    """Счетчики и гистограммы запросов процесса с выводом в текстовом формате Prometheus.
+
+    Гистограмма хранится как список некумулятивных счетчиков по корзинам
+    (последняя - +Inf), сумма и количество. При работе в нескольких процессах
+    каждый процесс периодически сбрасывает свой снимок в METRICS_MULTIPROC_DIR,
+    а /metrics суммирует снимки всех процессов.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.latency = {}
+            self.db_time = {}
+            self.in_flight = 0
+
+    def _observe_histogram(self, histograms, key, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def observe(self, endpoint, method, status, duration, db_time):
+        """Учесть завершенный запрос"""
+        key = (endpoint, method)
+        with self._lock:
+            status_key = (endpoint, method, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self._observe_histogram(self.latency, key, duration)
+            self._observe_histogram(self.db_time, key, db_time)
+
+    def snapshot(self):
+        """Снимок метрик в виде, пригодном для JSON"""
+        with self._lock:
+            return {
+                'requests': [list(key) + [count] for key, count in self.requests.items()],
+                'latency': [list(key) + [list(h[0]), h[1], h[2]] for key, h in self.latency.items()],
+                'db_time': [list(key) + [list(h[0]), h[1], h[2]] for key, h in self.db_time.items()],
+                'in_flight': self.in_flight
+            }
+
+    def maybe_flush(self, directory, interval):
+        """Сбросить снимок процесса в каталог, если с прошлого сброса прошло `interval` секунд"""
+        now = time.monotonic()
+        if now - self._last_flush < interval:
+            return
+        first_flush = self._last_flush == 0.0
+        self._last_flush = now
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        if first_flush and os.path.exists(path):
+            # PID достался от завершившегося процесса: его счетчики переносим в
+            # общий агрегат, иначе перезапись файла обнулила бы их
+            with _metrics_dir_lock(directory):
+                self._fold_into_aggregate(directory, [path])
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_snapshot(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def _fold_into_aggregate(cls, directory, paths):
+        """Добавить снимки завершившихся процессов в aggregate.json и удалить их файлы"""
+        aggregate_path = os.path.join(directory, METRICS_AGGREGATE_FILE)
+        snapshots = [snapshot for snapshot in map(cls._read_snapshot, [aggregate_path] + paths) if snapshot]
+        totals = _merge_snapshots(snapshots)
+        tmp_path = f'{aggregate_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(_totals_to_snapshot(totals), f)
+        os.replace(tmp_path, aggregate_path)
+        for path in paths:
+            os.remove(path)
+
+    def collect(self, directory=None):
+        """Сумма снимков всех процессов (или только текущего, если каталог не задан)"""
+        snapshots = [self.snapshot()]
+        if directory:
+            own = f'{os.getpid()}.json'
+            with _metrics_dir_lock(directory):
+                dead = []
+                for name in os.listdir(directory):
+                    if not name.endswith('.json') or name in (own, METRICS_AGGREGATE_FILE):
+                        continue
+                    path = os.path.join(directory, name)
+                    if not _pid_alive(int(name[:-5])):
+                        dead.append(path)
+                        continue
+                    snapshot = self._read_snapshot(path)
+                    if snapshot:
+                        snapshots.append(snapshot)
+                if dead:
+                    self._fold_into_aggregate(directory, dead)
+                aggregate = self._read_snapshot(os.path.join(directory, METRICS_AGGREGATE_FILE))
+                if aggregate:
+                    snapshots.append(aggregate)
+        return _merge_snapshots(snapshots)
+
+    def render(self, directory=None):
+        """Текстовый формат экспозиции Prometheus"""
+        totals = self.collect(directory)
+        lines = [
+            '# HELP blog_api_requests_total Количество обработанных запросов',
+            '# TYPE blog_api_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(totals['requests'].items()):
+            lines.append(f'blog_api_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        
+        for name, metric, help_text in (
+            ('latency', 'blog_api_request_duration_seconds', 'Время обработки запроса'),
+            ('db_time', 'blog_api_request_db_seconds', 'Время работы с БД за запрос')
+        ):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (endpoint, method), (counts, total, count) in sorted(totals[name].items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{metric}_sum{{{labels}}} {total}')
+                lines.append(f'{metric}_count{{{labels}}} {count}')
+        
+        lines.append('# HELP blog_api_requests_in_flight Запросы в обработке')
+        lines.append('# TYPE blog_api_requests_in_flight gauge')
+        lines.append(f"blog_api_requests_in_flight {totals['in_flight']}")
+        return '\n'.join(lines) + '\n'
+
+# Счетчики завершившихся процессов накапливаются в одном файле, а не по PID
+METRICS_AGGREGATE_FILE = 'aggregate.json'
+
+def _merge_snapshots(snapshots):
+    """Сумма снимков; запросы в обработке у агрегата завершившихся процессов всегда 0"""
+    totals = {'requests': {}, 'latency': {}, 'db_time': {}, 'in_flight': 0}
+    for snapshot in snapshots:
+        for endpoint, method, status, count in snapshot['requests']:
+            key = (endpoint, method, status)
+            totals['requests'][key] = totals['requests'].get(key, 0) + count
+        for name in ('latency', 'db_time'):
+            for endpoint, method, counts, total, count in snapshot[name]:
+                histogram = totals[name].setdefault((endpoint, method), [[0] * len(counts), 0.0, 0])
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+                histogram[2] += count
+        totals['in_flight'] += snapshot['in_flight']
+    return totals
+
+def _totals_to_snapshot(totals):
+    return {
+        'requests': [list(key) + [count] for key, count in totals['requests'].items()],
+        'latency': [list(key) + [h[0], h[1], h[2]] for key, h in totals['latency'].items()],
+        'db_time': [list(key) + [h[0], h[1], h[2]] for key, h in totals['db_time'].items()],
+        'in_flight': 0
+    }
+
+@contextmanager
+def _metrics_dir_lock(directory):
+    """Межпроцессная блокировка каталога метрик"""
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+metrics = MetricsRegistry()
+
+@atexit.register
+def _flush_metrics_at_exit():
+    # Последние счетчики воркера не должны теряться при его остановке
+    directory = app.config['METRICS_MULTIPROC_DIR']
+    if directory and app.config['METRICS_ENABLED']:
+        metrics.maybe_flush(directory, 0)
+
+# Инструментирование SQL-запросов
+slow_query_logger = logging.getLogger('slow_queries')
+# Отдельный файл без дублирования в blog_api.log; создается при первой записи
+slow_query_logger.addHandler(logging.FileHandler(app.config['SLOW_QUERY_LOG'], delay=True))
+slow_query_logger.propagate = False
+
+# Признак полного просмотра таблицы в выводе EXPLAIN QUERY PLAN (SCAN без индекса)
+FULL_SCAN_RE = re.compile(r'^SCAN (?!.*\bUSING (?:COVERING )?INDEX\b)')
+_explained_statements = set()
+EXPLAINED_STATEMENTS_LIMIT = 1000
+
+def explain_query_plan(conn, statement, parameters):
+    """Строки EXPLAIN QUERY PLAN для выполненного выражения (только SQLite)"""
+    if conn.dialect.name != 'sqlite' or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+        return []
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'не удалось получить план: {str(e)}']
+    finally:
+        cursor.close()
+
+class QueryBudgetExceeded(Exception):
+    """Блок кода выполнил больше SQL-выражений, чем разрешено бюджетом"""
+    def __init__(self, name, limit, statements):
+        self.name = name
+        self.limit = limit
+        self.statements = statements
+        super().__init__(
+            f"{name}: {len(statements)} SQL-запросов при бюджете {limit}:\n"
+            + '\n'.join(f'  {statement}' for statement in statements)
+        )
+
+_query_budgets = threading.local()
+
+class query_budget:
+    """Ограничение числа SQL-выражений: контекстный менеджер и декоратор маршрутов.
+
+    Считаются выражения, выполненные в текущем потоке внутри блока. Реакция на
+    превышение задается `mode` или QUERY_BUDGET_MODE: в staging - предупреждение
+    в журнале (log), в тестах - исключение QueryBudgetExceeded (raise).
+
+        @app.route('/posts')
+        @log_request
+        @query_budget(1)
+        def get_posts(): ...
+
+        with query_budget(2, mode='raise'):
+            client.get('/posts/1/comments')
+    """
+    def __init__(self, limit, name=None, mode=None):
+        self.limit = limit
+        self.name = name
+        self.mode = mode
+        self.statements = []
+        self._active = False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _resolve_mode(self):
+        return self.mode or app.config['QUERY_BUDGET_MODE']
+
+    def __enter__(self):
+        self.statements = []
+        # В режиме off выражения не собираются вовсе
+        self._active = self._resolve_mode() != 'off'
+        if self._active:
+            if not hasattr(_query_budgets, 'active'):
+                _query_budgets.active = []
+            _query_budgets.active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._active:
+            return False
+        _query_budgets.active.remove(self)
+        if exc_type is not None or self.count <= self.limit:
+            return False
+        error = QueryBudgetExceeded(self.name or 'блок', self.limit,
+                                    [' '.join(statement.split()) for statement in self.statements])
+        if self._resolve_mode() == 'raise':
+            raise error
+        logger.warning(f"Превышен бюджет SQL-запросов. {str(error)}")
+        return False
+
+    @staticmethod
+    def extend(count):
+        """Разрешить активным бюджетам потока еще `count` выражений.
+
+        Для маршрутов, число выражений которых пропорционально объему работы
+        (удаление пачками): каждая пачка объявляет свою стоимость, и лишние
+        выражения внутри пачки по-прежнему считаются превышением.
+        """
+        for budget in getattr(_query_budgets, 'active', ()):
+            budget.limit += count
+
+    def __call__(self, f):
+        limit, mode = self.limit, self.mode
+        name = self.name or f.__name__
+        
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (mode or app.config['QUERY_BUDGET_MODE']) == 'off':
+                return f(*args, **kwargs)
+            with query_budget(limit, name, mode):
+                return f(*args, **kwargs)
+        decorated_function.query_budget = limit
+        return decorated_function
+
+class RequestStats:
+    """Счетчики текущего запроса: время начала, число SQL-выражений и время БД"""
+    __slots__ = ('started', 'db_queries', 'db_time', 'in_flight')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.in_flight = False
+
+# Доступ через ContextVar дешевле прокси g и request в горячем пути хуков SQL
+_request_stats = ContextVar('request_stats', default=None)
+
+def current_request_stats():
+    """Счетчики текущего запроса или None вне запроса (CLI, фоновые потоки)"""
+    return _request_stats.get()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_time += elapsed
+        stats.db_queries += 1
+    for budget in getattr(_query_budgets, 'active', ()):
+        budget.statements.append(statement)
+    
+    if elapsed * 1000 >= app.config['SLOW_QUERY_THRESHOLD_MS']:
+        # Для executemany план строится по первому набору параметров
+        plan_parameters = parameters[0] if executemany and parameters else parameters
+        plan = explain_query_plan(conn, statement, plan_parameters)
+        kind = f'executemany, {len(parameters)} наборов параметров' if executemany else 'запрос'
+        slow_query_logger.warning(
+            f"Медленный {kind} ({elapsed * 1000:.1f} мс): {statement} параметры={plan_parameters}"
+            + ''.join(f"\n    {'[полный просмотр] ' if FULL_SCAN_RE.match(line) else ''}{line}" for line in plan)
+        )
+    elif (app.config['SQL_WARN_FULL_SCANS'] and statement not in _explained_statements
+          and len(_explained_statements) < EXPLAINED_STATEMENTS_LIMIT):
+        # Каждое уникальное выражение проверяется один раз за время жизни процесса
+        _explained_statements.add(statement)
+        plan_parameters = parameters[0] if executemany and parameters else parameters
+        scans = [line for line in explain_query_plan(conn, statement, plan_parameters) if FULL_SCAN_RE.match(line)]
+        if scans:
+            slow_query_logger.warning(f"Полный просмотр таблицы ({'; '.join(scans)}): {statement}")
+
+@app.before_request
+def start_request_metrics():
+    stats = RequestStats()
+    _request_stats.set(stats)
+    if app.config['METRICS_ENABLED']:
+        metrics.request_started()
+        stats.in_flight = True
+
+@app.after_request
+def add_sql_debug_headers(response):
+    stats = _request_stats.get()
+    if (app.debug or app.config['SQL_DEBUG_HEADERS']) and stats is not None:
+        response.headers['X-DB-Queries'] = str(stats.db_queries)
+        response.headers['X-DB-Time-Ms'] = f'{stats.db_time * 1000:.2f}'
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    stats = _request_stats.get()
+    if stats is not None and stats.in_flight:
+        metrics.observe(request.endpoint or 'unmatched', request.method, response.status_code,
+                        time.perf_counter() - stats.started, stats.db_time)
+        if request.environ.get('blog_api.streaming'):
+            # Долгий поток отдается после ответа: запросом в обработке он больше не считается
+            stats.in_flight = False
+            metrics.request_finished()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    stats = _request_stats.get()
+    _request_stats.set(None)
+    if stats is not None and stats.in_flight:
+        stats.in_flight = False
+        metrics.request_finished()
+        # Снимок пишется после вычета текущего запроса из запросов в обработке
+        directory = app.config['METRICS_MULTIPROC_DIR']
+        if directory:
+            metrics.maybe_flush(directory, app.config['METRICS_FLUSH_INTERVAL'])
+
+# Контроль допуска запросов
+class TokenBucketLimiter:
+    """Ограничитель частоты запросов по алгоритму token bucket.
+
+    Для каждого ключа хранится пара [токены, время обновления]. Корзины лежат
+    в OrderedDict в порядке последнего обращения, поэтому простаивающие корзины
+    вытесняются с начала словаря за амортизированное O(1).
+    """
+    def __init__(self, rate, burst, idle_seconds):
+        self.rate = rate
+        self.burst = burst
+        # Корзина, простоявшая дольше burst / rate, уже полна - ее можно забыть
+        self.idle_seconds = max(idle_seconds, burst / rate if rate > 0 else 0)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, now=None):
+        """Списать токен; возвращает 0, если запрос разрешен, иначе секунды до появления токена"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(self.burst), now]
+                self._buckets[key] = bucket
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+                self._buckets.move_to_end(key)
+            self._evict_idle(now)
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            if self.rate <= 0:
+                return self.idle_seconds or 1.0
+            return (1 - bucket[0]) / self.rate
+
+    def _evict_idle(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket[1] < self.idle_seconds:
+                break
+            buckets.popitem(last=False)
+
+class AdmissionController:
+    """Лимиты на клиента и маршрут (отдельно для чтения и записи) и общий предел параллельности"""
+    READ_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+    def __init__(self, config):
+        self.reset(config)
+
+    def reset(self, config):
+        """Пересоздать лимиты по текущей конфигурации"""
+        idle = config['RATE_LIMIT_IDLE_SECONDS']
+        self.read_limiter = TokenBucketLimiter(config['RATE_LIMIT_READ_PER_SEC'], config['RATE_LIMIT_READ_BURST'], idle)
+        self.write_limiter = TokenBucketLimiter(config['RATE_LIMIT_WRITE_PER_SEC'], config['RATE_LIMIT_WRITE_BURST'], idle)
+        self.slots = threading.BoundedSemaphore(config['MAX_CONCURRENT_REQUESTS']) \
+            if config['MAX_CONCURRENT_REQUESTS'] > 0 else None
+
+    def check_rate(self, remote_addr, endpoint, method):
+        """Секунды до следующей попытки, если клиент превысил лимит, иначе 0"""
+        limiter = self.read_limiter if method in self.READ_METHODS else self.write_limiter
+        return limiter.acquire((remote_addr, endpoint))
+
+    def acquire_slot(self):
+        """Занять слот параллельности; False, если все слоты заняты (0 в конфиге - без предела)"""
+        return self.slots is None or self.slots.acquire(blocking=False)
+
+    def release_slot(self):
+        if self.slots is not None:
+            self.slots.release()
+
+admission = AdmissionController(app.config)
+
+def _rejection(status, error, message, retry_after):
+    response = jsonify({
+        'success': False,
+        'error': error,
+        'message': message
+    })
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@app.before_request
+def admit_request():
+    """Быстрый отказ до валидации, запросов к БД и логирования"""
+    if not app.config['ADMISSION_CONTROL_ENABLED']:
+        return None
+    
+    retry_after = admission.check_rate(request.remote_addr, request.endpoint, request.method)
+    if retry_after:
+        return _rejection(429, 'Слишком много запросов',
+                          'Превышен лимит запросов, повторите попытку позже', retry_after)
+    
+    if not admission.acquire_slot():
+        return _rejection(503, 'Сервер перегружен',
+                          'Сервер временно перегружен, повторите попытку позже', 1)
+    request.environ['blog_api.admission_slot'] = True
+    return None
+
+@app.teardown_request
+def release_admission_slot(exc):
+    if request.environ.pop('blog_api.admission_slot', False):
+        admission.release_slot()
+
+def detach_streaming_request():
+    """Отпустить слот параллельности и снять запрос из обработки до отдачи долгого потока.
+
+    У ответа со stream_with_context teardown_request выполняется только при
+    закрытии потока, и открытые подписки иначе занимали бы слоты
+    MAX_CONCURRENT_REQUESTS на все время потока.
+    """
+    if request.environ.pop('blog_api.admission_slot', False):
+        admission.release_slot()
+    request.environ['blog_api.streaming'] = True
+
+# Профилирование отдельных запросов
+def collapsed_stacks(stats, min_microseconds=1):
+    """Свертка pstats в формат collapsed stacks (`a;b;c <мкс>`) для flamegraph.pl и speedscope.
+
+    cProfile хранит только пары вызывающий -> вызываемый, поэтому стеки
+    восстанавливаются обходом графа от корней: время ребра делится между
+    путями пропорционально, собственное время функции приписывается стеку.
+    """
+    entries = stats.stats
+    children = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    
+    def label(func):
+        filename, line, name = func
+        location = '~' if filename == '~' else f'{os.path.basename(filename)}:{line}'
+        return f'{name} ({location})'.replace(';', ':')
+    
+    totals = {}
+    roots = [func for func, entry in entries.items() if not entry[4]]
+    stack = [(func, (label(func),), entries[func][3], frozenset([func])) for func in roots]
+    while stack:
+        func, path, weight, seen = stack.pop()
+        _, _, own_time, cumulative, _ = entries[func]
+        scale = weight / cumulative if cumulative else 0.0
+        self_time = own_time * scale * 1e6
+        if self_time >= min_microseconds:
+            key = ';'.join(path)
+            totals[key] = totals.get(key, 0.0) + self_time
+        for child, edge_time in children.get(func, ()):
+            child_weight = edge_time * scale
+            # Рекурсия не разворачивается, слишком мелкие поддеревья отбрасываются
+            if child in seen or child_weight * 1e6 < min_microseconds:
+                continue
+            stack.append((child, path + (label(child),), child_weight, seen | {child}))
+    return [f'{key} {round(value)}' for key, value in sorted(totals.items()) if round(value) > 0]
+
+def profiling_requested():
+    """Запрос просит профилирование и предъявил верный секрет"""
+    secret = app.config['PROFILING_SECRET']
+    header = request.headers.get('X-Profile')
+    return bool(app.config['PROFILING_ENABLED'] and secret and header
+                and hmac.compare_digest(header.encode('utf-8'), secret.encode('utf-8')))
+
+@app.before_request
+def start_profiling():
+    # Просмотр сохраненных профилей сам не профилируется
+    if not app.config['PROFILING_ENABLED'] or request.endpoint == 'get_profile' or not profiling_requested():
+        return None
+    profiler = cProfile.Profile()
+    request.environ['blog_api.profiler'] = profiler
+    profiler.enable()
+    return None
+
+@app.after_request
+def finish_profiling(response):
+    profiler = request.environ.pop('blog_api.profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    
+    profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:8]}"
+    directory = app.config['PROFILING_DIR']
+    os.makedirs(directory, exist_ok=True)
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(os.path.join(directory, f'{profile_id}.pstats'))
+    with open(os.path.join(directory, f'{profile_id}.collapsed'), 'w') as f:
+        f.write('\n'.join(collapsed_stacks(stats)) + '\n')
+    
+    logger.info(f"Профиль запроса {request.method} {request.url} сохранен: {profile_id}")
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+# Профилирование памяти
+class MemoryProfiler:
+    """Снимки tracemalloc и пиковое потребление памяти по маршрутам.
+
+    Пик считается от начала запроса через tracemalloc.reset_peak(); счетчик
+    общий на процесс, поэтому при параллельных запросах в потоках пик
+    одного маршрута может включать чужие выделения.
+    """
+    
+    # Выделения самого tracemalloc и загрузчика модулей не интересны
+    FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    )
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self._snapshots = OrderedDict()
+            self._next_id = 1
+            self._endpoints = {}
+    
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+    
+    def start(self, frames):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+    
+    def stop(self):
+        """Остановка трассировки; снимки и статистика по маршрутам сохраняются"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    
+    def take_snapshot(self, limit):
+        """Новый снимок; самые старые вытесняются сверх `limit`"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (datetime.utcnow(), snapshot)
+            while len(self._snapshots) > limit:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+    
+    def get_snapshot(self, snapshot_id):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        return entry[1] if entry else None
+    
+    def snapshots(self):
+        with self._lock:
+            return [{'id': snapshot_id, 'taken_at': taken_at.isoformat(),
+                     'size_bytes': sum(stat.size for stat in snapshot.statistics('filename'))}
+                    for snapshot_id, (taken_at, snapshot) in self._snapshots.items()]
+    
+    @staticmethod
+    def top(snapshot, key_type='lineno', limit=20):
+        """Крупнейшие места выделения памяти в снимке"""
+        return [{'site': _format_traceback(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics(key_type)[:limit]]
+    
+    @staticmethod
+    def diff(base, compare, key_type='lineno', limit=20):
+        """Места с наибольшим ростом памяти между двумя снимками"""
+        return [{'site': _format_traceback(stat.traceback), 'size_bytes': stat.size, 'size_diff_bytes': stat.size_diff,
+                 'count': stat.count, 'count_diff': stat.count_diff}
+                for stat in compare.compare_to(base, key_type)[:limit]]
+    
+    def request_started(self):
+        """Текущий объем памяти на начало запроса или None без трассировки"""
+        if not tracemalloc.is_tracing():
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+    
+    def request_finished(self, endpoint, method, started):
+        if not tracemalloc.is_tracing():
+            return
+        peak = max(0, tracemalloc.get_traced_memory()[1] - started)
+        with self._lock:
+            stats = self._endpoints.setdefault((endpoint, method), [0, 0, 0])
+            stats[0] += 1
+            stats[1] = max(stats[1], peak)
+            stats[2] += peak
+    
+    def endpoint_report(self):
+        with self._lock:
+            items = sorted(self._endpoints.items(), key=lambda item: item[1][1], reverse=True)
+        return [{'endpoint': endpoint, 'method': method, 'requests': count,
+                 'peak_bytes': peak, 'avg_peak_bytes': round(total / count)}
+                for (endpoint, method), (count, peak, total) in items]
+
+def _format_traceback(traceback):
+    """Стек места выделения от вызывающего к выделению: `app.py:42`"""
+    return [f'{frame.filename}:{frame.lineno}' for frame in reversed(traceback)]
+
+def _max_rss_bytes():
+    """Пиковый RSS процесса; ru_maxrss в Linux задан в КБ, в macOS - в байтах"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+memory_profiler = MemoryProfiler()
+
+@app.before_request
+def start_memory_tracking():
+    started = memory_profiler.request_started()
+    if started is not None:
+        request.environ['blog_api.memory_started'] = started
+    return None
+
+@app.teardown_request
+def finish_memory_tracking(exc):
+    started = request.environ.pop('blog_api.memory_started', None)
+    if started is not None:
+        memory_profiler.request_finished(request.endpoint or 'unmatched', request.method, started)
+
+# Сжатие ответов
+class _GzipStream:
+    """Потоковое сжатие gzip: каждый фрагмент сбрасывается (Z_SYNC_FLUSH) и сразу уходит клиенту"""
+    
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+    
+    def compress_all(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+    
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class _BrotliStream:
+    """Потоковое сжатие brotli с принудительным сбросом после каждого фрагмента"""
+    
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+    
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+    
+    def compress_all(self, data):
+        return self._compressor.process(data) + self._compressor.finish()
+    
+    def finish(self):
+        return self._compressor.finish()
+
+def _compressor(encoding):
+    if encoding == 'br':
+        return _BrotliStream(app.config['COMPRESSION_BROTLI_LEVEL'])
+    return _GzipStream(app.config['COMPRESSION_GZIP_LEVEL'])
+
+def negotiate_encoding(accept_encodings):
+    """Кодировка сжатия по Accept-Encoding: br при равном с gzip приоритете, иначе gzip"""
+    gzip_quality = accept_encodings.quality('gzip')
+    if brotli is not None and accept_encodings.quality('br') and accept_encodings.quality('br') >= gzip_quality:
+        return 'br'
+    return 'gzip' if gzip_quality else None
+
+def _compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        # Генератор ответа должен узнать об обрыве соединения, как без сжатия
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+@app.after_request
+def compress_response(response):
+    """Сжатие ответа, если клиент его поддерживает.
+
+    Обычные ответы сжимаются целиком начиная с COMPRESSION_MIN_SIZE байт,
+    потоковые - по мере генерации без буферизации. Ответы с уже заданным
+    Content-Encoding (например, заранее сжатые тела из кэша) и файлы
+    (direct_passthrough) не трогаются.
+    """
+    if not app.config['COMPRESSION_ENABLED'] or response.mimetype not in app.config['COMPRESSION_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    if ('Content-Encoding' in response.headers or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD'):
+        return response
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, _compressor(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESSION_MIN_SIZE']:
+            return response
+        response.set_data(_compressor(encoding).compress_all(data))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
 # Обработчики ошибок
 @app.errorhandler(400)
 def bad_request(error):
@@ -277,34 +1745,594 @@ def validate_post_data(data):
     
     return errors
 
-def validate_comment_data(data):
-    """Комплексная валидация данных для комментария"""
-    errors = []
-    
-    if not data:
-        errors.append("Данные не предоставлены")
-        return errors
-    
-    # Валидация содержимого
-    if 'content' in data:
-        content_errors = validate_comment_content(data['content'])
-        errors.extend(content_errors)
-    else:
-        errors.append("Поле 'content' обязательно")
-    
-    # Валидация автора
-    if 'author' in data:
-        author_errors = validate_author(data['author'])
-        errors.extend(author_errors)
-    else:
-        errors.append("Поле 'author' обязательно")
-    
-    return errors
+def validate_comment_data(data):
+    """Комплексная валидация данных для комментария"""
+    errors = []
+    
+    if not data:
+        errors.append("Данные не предоставлены")
+        return errors
+    
+    # Валидация содержимого
+    if 'content' in data:
+        content_errors = validate_comment_content(data['content'])
+        errors.extend(content_errors)
+    else:
+        errors.append("Поле 'content' обязательно")
+    
+    # Валидация автора
+    if 'author' in data:
+        author_errors = validate_author(data['author'])
+        errors.extend(author_errors)
+    else:
+        errors.append("Поле 'author' обязательно")
+    
+    return errors
+
+# Групповая фиксация комментариев
+class _PendingComment:
+    """Комментарий, ожидающий фиксации в общей транзакции"""
+    def __init__(self, values):
+        self.values = values
+        self.id = None
+        self.seq = None
+        self.error = None
+        self.done = threading.Event()
+
+class CommentGroupCommitter:
+    """Собирает вставки комментариев из параллельных запросов и фиксирует их одной транзакцией.
+
+    Фоновый поток ждет первый комментарий, затем в течение окна `window_ms`
+    добирает остальные (не больше `max_batch`) и выполняет один COMMIT.
+    Запрос получает ответ только после того, как его строка зафиксирована.
+    Строка вставляется через INSERT ... SELECT ... WHERE EXISTS, поэтому пост,
+    удаленный между проверкой в запросе и фиксацией, не оставит сиротский комментарий.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._engine = None
+        self.window = 0.005
+        self.max_batch = 100
+        # Число выполненных групповых транзакций (для тестов и диагностики)
+        self.batches = 0
+
+    def start(self, engine, window_ms, max_batch):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._engine = engine
+            self.window = window_ms / 1000.0
+            self.max_batch = max(1, max_batch)
+            self._thread = threading.Thread(target=self._run, name='comment-group-commit', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Остановка потока после фиксации всех уже поставленных в очередь комментариев"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def submit(self, values):
+        """Поставить комментарий в очередь и дождаться фиксации.
+
+        Возвращает ID строки или None, если пост к моменту фиксации уже удален.
+        """
+        pending = _PendingComment(values)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.id
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stopping:
+                return
+
+    @staticmethod
+    def _insert(conn, values):
+        """Вставка комментария, правка готовой страницы и рейтинга поста и запись журнала
+        изменений, только если пост еще существует; возвращает (ID, seq) или (None, None)"""
+        posts = Post.__table__
+        source = select(
+            literal(values['post_id'], db.Integer),
+            literal(values['content'], db.Text),
+            literal(values['author'], db.String),
+            literal(values['created_at'], db.DateTime)
+        ).where(exists().where(posts.c.id == values['post_id'], posts.c.deleted_at.is_(None)))
+        result = conn.execute(insert(Comment.__table__).from_select(
+            ['post_id', 'content', 'author', 'created_at'], source
+        ))
+        if not result.rowcount:
+            return None, None
+        comment_id = result.lastrowid
+        comment_data = comment_values_dict(comment_id, values)
+        update_comment_page(conn, 'insert', comment_data)
+        adjust_hot_score(conn, values['post_id'], values['created_at'], True)
+        adjust_author_stats(conn, values['author'], values['created_at'], True)
+        return comment_id, record_change(conn, 'comment', 'insert', comment_id, values['post_id'], comment_data)
+
+    def _commit(self, batch):
+        self.batches += 1
+        try:
+            with self._engine.begin() as conn:
+                for item in batch:
+                    item.id, item.seq = self._insert(conn, item.values)
+        except Exception as e:
+            # Одна ошибочная строка не должна ронять всю группу: повторяем по одной
+            logger.warning(f"Групповая фиксация {len(batch)} комментариев не удалась ({str(e)}), повтор по одному")
+            for item in batch:
+                item.id = item.seq = None
+                try:
+                    with self._engine.begin() as conn:
+                        item.id, item.seq = self._insert(conn, item.values)
+                except Exception as item_error:
+                    item.error = item_error
+        for item in batch:
+            if item.id is not None:
+                comment_events.publish(item.values['post_id'], CommentEvent(
+                    item.seq, 'comment_created', comment_values_dict(item.id, item.values)))
+            item.done.set()
+
+comment_committer = CommentGroupCommitter()
+
+# Физическое удаление строк, помеченных удаленными
+class TombstoneCompactor:
+    """Фоновое физическое удаление помеченных строк небольшими пачками.
+
+    Поток просыпается раз в `interval` секунд и работает, только если
+    последний запрос пришел не менее `idle_seconds` назад; между пачками
+    простой проверяется снова, поэтому пришедший трафик прерывает очистку.
+    Порядок: комментарии удаленных постов, удаленные комментарии, затем сами
+    посты, у которых не осталось комментариев. Каждая пачка - короткая
+    транзакция, блокировка записи не удерживается долго. После очистки
+    свободные страницы возвращаются через PRAGMA incremental_vacuum.
+    """
+    PURGE_STATEMENTS = (
+        ('comments_of_deleted_posts',
+         'DELETE FROM comments WHERE id IN (SELECT comments.id FROM comments JOIN posts ON posts.id = comments.post_id '
+         'WHERE posts.deleted_at IS NOT NULL LIMIT :limit)'),
+        ('comments',
+         'DELETE FROM comments WHERE id IN (SELECT id FROM comments WHERE deleted_at IS NOT NULL LIMIT :limit)'),
+        ('posts',
+         'DELETE FROM posts WHERE id IN (SELECT id FROM posts WHERE deleted_at IS NOT NULL '
+         'AND NOT EXISTS (SELECT 1 FROM comments WHERE comments.post_id = posts.id) LIMIT :limit)'),
+    )
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.last_activity = time.monotonic()
+        # Число удаленных строк по видам (для тестов и диагностики)
+        self.purged = {name: 0 for name, _ in self.PURGE_STATEMENTS}
+    
+    def start(self, engine, interval, idle_seconds, batch_size, vacuum_pages):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(engine, interval, idle_seconds, batch_size, vacuum_pages),
+                name='tombstone-compactor', daemon=True
+            )
+            self._thread.start()
+    
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._stop_event.set()
+        thread.join()
+    
+    def note_activity(self):
+        self.last_activity = time.monotonic()
+    
+    def idle(self, idle_seconds):
+        return time.monotonic() - self.last_activity >= idle_seconds
+    
+    def _run(self, engine, interval, idle_seconds, batch_size, vacuum_pages):
+        while not self._stop_event.wait(interval):
+            if not self.idle(idle_seconds):
+                continue
+            try:
+                self.run_once(engine, batch_size, vacuum_pages, idle_seconds)
+            except Exception as e:
+                logger.error(f"Ошибка компактора удаленных строк: {str(e)}")
+    
+    def run_once(self, engine, batch_size, vacuum_pages, idle_seconds=None):
+        """Очистка до конца или до прихода запросов; возвращает число удаленных строк по видам"""
+        purged = {name: 0 for name, _ in self.PURGE_STATEMENTS}
+        for name, statement in self.PURGE_STATEMENTS:
+            while idle_seconds is None or self.idle(idle_seconds):
+                with engine.begin() as conn:
+                    count = conn.execute(db.text(statement), {'limit': batch_size}).rowcount
+                purged[name] += count
+                if count < batch_size:
+                    break
+        with self._lock:
+            for name, count in purged.items():
+                self.purged[name] += count
+        if any(purged.values()):
+            logger.info(f"Компактор удалил помеченные строки: {purged}")
+            if engine.dialect.name == 'sqlite' and (idle_seconds is None or self.idle(idle_seconds)):
+                with engine.connect() as conn:
+                    if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+                        # execute() в pysqlite делает один шаг выражения - одну страницу;
+                        # executescript выполняет PRAGMA до конца
+                        conn.connection.driver_connection.executescript(
+                            f'PRAGMA incremental_vacuum({int(vacuum_pages)})')
+        return purged
+
+compactor = TombstoneCompactor()
+
+def start_compactor():
+    """Ленивый запуск компактора при первом мягком удалении"""
+    if app.config['COMPACTION_ENABLED']:
+        compactor.start(db.engine, app.config['COMPACTION_INTERVAL_SECONDS'], app.config['COMPACTION_IDLE_SECONDS'],
+                        app.config['COMPACTION_BATCH_SIZE'], app.config['COMPACTION_VACUUM_PAGES'])
+
+@app.before_request
+def note_request_activity():
+    compactor.note_activity()
+
+# События комментариев для потоков SSE
+CommentEvent = namedtuple('CommentEvent', ('seq', 'name', 'data'))
+
+# Имя события SSE по записи журнала изменений
+COMMENT_EVENT_NAMES = {
+    ('comment', 'insert'): 'comment_created',
+    ('comment', 'update'): 'comment_updated',
+    ('comment', 'delete'): 'comment_deleted',
+    ('post', 'delete'): 'post_deleted',
+}
+
+class _Subscriber:
+    """Очередь событий одного потока SSE"""
+    __slots__ = ('queue', 'overflowed')
+    
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+class CommentEventBroker:
+    """Публикация событий комментариев подписчикам поста внутри процесса.
+
+    Маршруты публикуют событие после фиксации транзакции, номер события - seq
+    записи журнала изменений. Публикация не блокируется: подписчик, очередь
+    которого заполнена, отключается и догоняет пропущенное по Last-Event-ID
+    из журнала изменений.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, post_id, maxsize):
+        subscriber = _Subscriber(maxsize)
+        with self._lock:
+            self._subscribers.setdefault(post_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, post_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(post_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[post_id]
+
+    def subscribers(self, post_id):
+        with self._lock:
+            return len(self._subscribers.get(post_id, ()))
+
+    def publish(self, post_id, event):
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(post_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                subscriber.overflowed = True
+                self.unsubscribe(post_id, subscriber)
+
+comment_events = CommentEventBroker()
+
+def publish_comment_event(post_id, event):
+    """Публикация события после фиксации транзакции маршрута.
+
+    В атомарном пакете commit() маршрута только сбрасывает изменения, и пакет
+    еще может откатиться (вместе с seq и id): события копятся в сессии и
+    публикуются после фиксации пакета (publish_pending_comment_events).
+    """
+    if in_batch_transaction():
+        db.session.info.setdefault('pending_comment_events', []).append((post_id, event))
+    else:
+        comment_events.publish(post_id, event)
+
+def publish_pending_comment_events(session):
+    """Публикация событий, отложенных до фиксации атомарного пакета"""
+    for post_id, event in session.info.pop('pending_comment_events', ()):
+        comment_events.publish(post_id, event)
+
+def format_sse(event):
+    """Событие в формате text/event-stream"""
+    return f"id: {event.seq}\nevent: {event.name}\ndata: {json.dumps(event.data, ensure_ascii=False)}\n\n"
+
+def replay_comment_events(post_id, after_seq):
+    """События комментариев поста после `after_seq` из журнала изменений (для Last-Event-ID)"""
+    changes = db.session.execute(
+        select(Change).where(Change.seq > after_seq, Change.post_id == post_id,
+                             (Change.entity == 'comment') | (Change.op == 'delete'))
+        .order_by(Change.seq).execution_options(yield_per=500)
+    ).scalars()
+    for change in changes:
+        data = json.loads(change.data) if change.data is not None else {'id': change.entity_id, 'post_id': post_id}
+        yield CommentEvent(change.seq, COMMENT_EVENT_NAMES[change.entity, change.op], data)
+
+def comment_event_stream(post_id, last_event_id):
+    """Поток SSE: пропущенные события из журнала, затем новые по мере публикации.
+
+    Подписка оформляется до чтения журнала, поэтому событие не теряется между
+    ними; повторы отсекаются по seq. Соединение с базой возвращается в пул до
+    ожидания событий. Поток завершается при удалении поста, переполнении
+    очереди или через SSE_MAX_STREAM_SECONDS - клиент переподключается сам.
+    """
+    subscriber = comment_events.subscribe(post_id, app.config['SSE_QUEUE_SIZE'])
+    try:
+        yield f"retry: {app.config['SSE_RETRY_MS']}\n\n"
+        replayed = last_event_id
+        if last_event_id is not None:
+            for event in replay_comment_events(post_id, last_event_id):
+                yield format_sse(event)
+                replayed = event.seq
+                if event.name == 'post_deleted':
+                    return
+        db.session.close()
+        
+        heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+        deadline = time.monotonic() + app.config['SSE_MAX_STREAM_SECONDS']
+        while not subscriber.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = subscriber.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if replayed is not None and event.seq <= replayed:
+                continue
+            yield format_sse(event)
+            if event.name == 'post_deleted':
+                return
+    finally:
+        comment_events.unsubscribe(post_id, subscriber)
+
+# Эндпоинт метрик (без log_request: опрашивается Prometheus каждые несколько секунд)
+@app.route('/metrics', methods=['GET'])
+@query_budget(0)
+def prometheus_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    # Текущий процесс учитывается по памяти, остальные - по снимкам в каталоге
+    return Response(metrics.render(app.config['METRICS_MULTIPROC_DIR']), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@log_request
+@query_budget(0)
+def get_profile(profile_id):
+    """Сохраненный профиль запроса: ?format=text (по умолчанию), collapsed или pstats"""
+    if not profiling_requested():
+        return jsonify({
+            'success': False,
+            'error': 'Ресурс не найден',
+            'message': 'Профилирование выключено или секрет неверен'
+        }), 404
+    
+    output = request.args.get('format', 'text')
+    if not re.match(r'^[\w\-]+$', profile_id) or output not in ('text', 'collapsed', 'pstats'):
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': 'Неверный идентификатор профиля или формат'
+        }), 400
+    
+    extension = 'collapsed' if output == 'collapsed' else 'pstats'
+    path = os.path.join(app.config['PROFILING_DIR'], f'{profile_id}.{extension}')
+    if not os.path.exists(path):
+        return jsonify({
+            'success': False,
+            'error': 'Профиль не найден',
+            'message': f'Профиль не найден: {profile_id}'
+        }), 404
+    
+    if output == 'pstats':
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True)
+    if output == 'collapsed':
+        return send_file(path, mimetype='text/plain')
+    buffer = io.StringIO()
+    pstats.Stats(path, stream=buffer).sort_stats('cumulative').print_stats(50)
+    return Response(buffer.getvalue(), content_type='text/plain; charset=utf-8')
+
+# Служебные эндпоинты профилирования памяти (только с X-Admin-Token)
+def _memory_limit_arg():
+    """Число строк отчета из ?limit= (1..200)"""
+    return max(1, min(request.args.get('limit', 20, type=int), 200))
+
+def _memory_key_type_arg():
+    key_type = request.args.get('group_by', 'lineno')
+    return key_type if key_type in ('lineno', 'filename', 'traceback') else None
+
+@app.route('/admin/memory', methods=['GET'])
+@log_request
+@require_admin
+@query_budget(0)
+def memory_status():
+    """Состояние трассировки, список снимков и пиковая память по маршрутам"""
+    current, peak = tracemalloc.get_traced_memory()
+    return jsonify({
+        'success': True,
+        'data': {
+            'tracing': memory_profiler.tracing,
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'max_rss_bytes': _max_rss_bytes(),
+            'pid': os.getpid(),
+            'snapshots': memory_profiler.snapshots(),
+            'endpoints': memory_profiler.endpoint_report(),
+        }
+    })
+
+@app.route('/admin/memory/start', methods=['POST'])
+@log_request
+@require_admin
+@query_budget(0)
+def start_memory_tracing():
+    """Запуск tracemalloc; ?frames= - глубина сохраняемого стека"""
+    frames = request.args.get('frames', app.config['MEMORY_TRACE_FRAMES'], type=int)
+    memory_profiler.start(max(1, min(frames, 100)))
+    logger.info(f"Трассировка памяти запущена (глубина стека {tracemalloc.get_traceback_limit()})")
+    return jsonify({'success': True, 'data': {'tracing': True, 'frames': tracemalloc.get_traceback_limit()}})
+
+@app.route('/admin/memory/stop', methods=['POST'])
+@log_request
+@require_admin
+@query_budget(0)
+def stop_memory_tracing():
+    """Остановка tracemalloc; снимки остаются доступными"""
+    memory_profiler.stop()
+    logger.info("Трассировка памяти остановлена")
+    return jsonify({'success': True, 'data': {'tracing': False}})
+
+@app.route('/admin/memory/snapshots', methods=['POST'])
+@log_request
+@require_admin
+@query_budget(0)
+def take_memory_snapshot():
+    """Снимок памяти и крупнейшие места выделения в нем"""
+    key_type = _memory_key_type_arg()
+    if not memory_profiler.tracing or key_type is None:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': 'Трассировка памяти не запущена' if key_type else 'Неверный параметр group_by'
+        }), 400
+    snapshot_id = memory_profiler.take_snapshot(app.config['MEMORY_SNAPSHOTS_LIMIT'])
+    return jsonify({
+        'success': True,
+        'data': {
+            'id': snapshot_id,
+            'top': memory_profiler.top(memory_profiler.get_snapshot(snapshot_id), key_type, _memory_limit_arg()),
+        }
+    }), 201
+
+@app.route('/admin/memory/snapshots/<int:snapshot_id>', methods=['GET'])
+@log_request
+@require_admin
+@query_budget(0)
+def get_memory_snapshot(snapshot_id):
+    """Крупнейшие места выделения в сохраненном снимке"""
+    snapshot = memory_profiler.get_snapshot(snapshot_id)
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'error': 'Снимок не найден',
+            'message': f'Снимок памяти с ID {snapshot_id} не существует'
+        }), 404
+    key_type = _memory_key_type_arg()
+    if key_type is None:
+        return jsonify({'success': False, 'error': 'Неверный запрос', 'message': 'Неверный параметр group_by'}), 400
+    return jsonify({
+        'success': True,
+        'data': {'id': snapshot_id, 'top': memory_profiler.top(snapshot, key_type, _memory_limit_arg())}
+    })
+
+@app.route('/admin/memory/diff', methods=['GET'])
+@log_request
+@require_admin
+@query_budget(0)
+def diff_memory_snapshots():
+    """Разница между снимками ?base= и ?compare= (по умолчанию - два последних)"""
+    ids = [snapshot['id'] for snapshot in memory_profiler.snapshots()]
+    base_id = request.args.get('base', ids[-2] if len(ids) >= 2 else None, type=int)
+    compare_id = request.args.get('compare', ids[-1] if ids else None, type=int)
+    key_type = _memory_key_type_arg()
+    base = memory_profiler.get_snapshot(base_id) if base_id is not None else None
+    compare = memory_profiler.get_snapshot(compare_id) if compare_id is not None else None
+    if base is None or compare is None or key_type is None:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': 'Нужны два существующих снимка (base и compare) и верный group_by'
+        }), 400
+    return jsonify({
+        'success': True,
+        'data': {
+            'base': base_id,
+            'compare': compare_id,
+            'top': memory_profiler.diff(base, compare, key_type, _memory_limit_arg()),
+        }
+    })
+
+def parse_ids_arg(limit):
+    """Идентификаторы из параметра ?ids=1,2,3 без повторов, в порядке запроса"""
+    ids = []
+    for part in request.args['ids'].split(','):
+        part = part.strip()
+        if not part.isdigit():
+            raise ValidationError("Параметр 'ids' должен быть списком целых чисел через запятую", 'ids')
+        ids.append(int(part))
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > limit:
+        raise ValidationError(f"В параметре 'ids' не больше {limit} идентификаторов", 'ids')
+    return ids
+
+def multi_get_response(ids, rows):
+    """Ответ мульти-выборки: найденные объекты в порядке запроса и список ненайденных ID"""
+    found = {row.id: row for row in rows}
+    return jsonify({
+        'success': True,
+        'data': [found[i].to_dict() for i in ids if i in found],
+        'count': len(found),
+        'missing': [i for i in ids if i not in found]
+    }), 200
+
+def invalid_ids_response(error):
+    return jsonify({
+        'success': False,
+        'error': 'Неверный запрос',
+        'message': error.message
+    }), 400
 
 # API Эндпоинты для постов
 
 @app.route('/')
 @log_request
+@query_budget(0)
 def index():
     """Базовый маршрут для проверки работы API"""
     return {
@@ -324,14 +2352,19 @@ def index():
 
 @app.route('/posts', methods=['GET'])
 @log_request
+@query_budget(1)
 def get_posts():
-    """Получить все посты"""
+    """Получить все посты; с ?ids=1,2,3 - только указанные, одним запросом"""
+    if 'ids' in request.args:
+        return get_posts_by_ids()
     try:
-        posts = Post.query.all()
+        posts = post_rows_to_dicts(db.session.execute(
+            select(*POST_COLUMNS).where(Post.__table__.c.deleted_at.is_(None))
+        ))
         logger.info(f"Получено {len(posts)} постов")
         return jsonify({
             'success': True,
-            'data': [post.to_dict() for post in posts],
+            'data': posts,
             'count': len(posts)
         }), 200
     except Exception as e:
@@ -342,12 +2375,68 @@ def get_posts():
             'message': 'Не удалось получить список постов'
         }), 500
 
+def get_posts_by_ids():
+    """Посты по списку ID одним запросом WHERE id IN (...)"""
+    try:
+        ids = parse_ids_arg(app.config['MULTI_GET_MAX_IDS'])
+    except ValidationError as e:
+        return invalid_ids_response(e)
+    try:
+        posts = Post.query.filter(Post.id.in_(ids), Post.deleted_at.is_(None)).all() if ids else []
+        logger.info(f"Получено {len(posts)} из {len(ids)} запрошенных постов")
+        return multi_get_response(ids, posts)
+    except Exception as e:
+        logger.error(f"Ошибка при получении постов по списку ID: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при получении постов',
+            'message': 'Не удалось получить посты'
+        }), 500
+
+@app.route('/posts/hot', methods=['GET'])
+@log_request
+@query_budget(1)
+def get_hot_posts():
+    """Горячие посты: рейтинг по активности комментариев с затуханием во времени.
+
+    Порядок берется из индекса по hot_score, комментарии не просматриваются;
+    hot_score в ответе - сумма вкладов комментариев на текущий момент (свежий
+    комментарий дает 1, вчерашний при T½ = 24 ч - 0.5).
+    """
+    limit = request.args.get('limit', str(app.config['HOT_DEFAULT_LIMIT']))
+    if not limit.isdigit() or not 1 <= int(limit) <= app.config['HOT_MAX_LIMIT']:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': f"Параметр 'limit' должен быть числом от 1 до {app.config['HOT_MAX_LIMIT']}"
+        }), 400
+    try:
+        rows = db.session.execute(HOT_POSTS, {'limit': int(limit)}).all()
+        now = hot_units(datetime.utcnow())
+        posts = post_rows_to_dicts(row[:-1] for row in rows)
+        for post, row in zip(posts, rows):
+            post['hot_score'] = round(2 ** (row[-1] - now), 6)
+        logger.info(f"Получено {len(posts)} горячих постов")
+        return jsonify({
+            'success': True,
+            'data': posts,
+            'count': len(posts)
+        }), 200
+    except Exception as e:
+        logger.error(f"Ошибка при получении горячих постов: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при получении горячих постов',
+            'message': 'Не удалось получить горячие посты'
+        }), 500
+
 @app.route('/posts/<int:post_id>', methods=['GET'])
 @log_request
+@query_budget(1)
 def get_post(post_id):
     """Получить пост по ID"""
     try:
-        post = Post.query.get(post_id)
+        post = get_live_post(post_id)
         if not post:
             logger.warning(f"Пост с ID {post_id} не найден")
             return jsonify({
@@ -371,6 +2460,7 @@ def get_post(post_id):
 
 @app.route('/posts', methods=['POST'])
 @log_request
+@query_budget(2)
 def create_post():
     """Создать новый пост"""
     try:
@@ -404,12 +2494,15 @@ def create_post():
         )
         
         db.session.add(post)
+        db.session.flush()
+        post_data = post.to_dict()
+        record_change(db.session, 'post', 'insert', post.id, post.id, post_data)
         db.session.commit()
         
-        logger.info(f"Создан новый пост с ID {post.id}: {post.title}")
+        logger.info(f"Создан новый пост с ID {post_data['id']}: {post_data['title']}")
         return jsonify({
             'success': True,
-            'data': post.to_dict(),
+            'data': post_data,
             'message': 'Пост успешно создан'
         }), 201
         
@@ -424,10 +2517,11 @@ def create_post():
 
 @app.route('/posts/<int:post_id>', methods=['PUT'])
 @log_request
+@query_budget(3)
 def update_post(post_id):
     """Обновить пост"""
     try:
-        post = Post.query.get(post_id)
+        post = get_live_post(post_id)
         if not post:
             logger.warning(f"Попытка обновить несуществующий пост с ID {post_id}")
             return jsonify({
@@ -465,14 +2559,24 @@ def update_post(post_id):
             post.title = sanitize_text(data['title'])
         if 'content' in data:
             post.content = sanitize_text(data['content'])
+        if not db.session.is_modified(post):
+            # Те же значения: updated_at не сдвигается, ни записи в журнал, ни транзакции записи
+            logger.info(f"Пост с ID {post_id} не изменился")
+            return jsonify({
+                'success': True,
+                'data': post.to_dict(),
+                'message': 'Пост успешно обновлен'
+            }), 200
         
         post.updated_at = datetime.utcnow()
+        post_data = post.to_dict()
+        record_change(db.session, 'post', 'update', post_id, post_id, post_data)
         db.session.commit()
         
-        logger.info(f"Обновлен пост с ID {post_id}: {post.title}")
+        logger.info(f"Обновлен пост с ID {post_id}: {post_data['title']}")
         return jsonify({
             'success': True,
-            'data': post.to_dict(),
+            'data': post_data,
             'message': 'Пост успешно обновлен'
         }), 200
         
@@ -487,21 +2591,30 @@ def update_post(post_id):
 
 @app.route('/posts/<int:post_id>', methods=['DELETE'])
 @log_request
+@query_budget(4)
 def delete_post(post_id):
-    """Удалить пост"""
+    """Удалить пост: пометка deleted_at одним UPDATE, строки удаляет компактор"""
     try:
-        post = Post.query.get(post_id)
-        if not post:
+        post_title = db.session.execute(
+            update(Post).where(Post.id == post_id, Post.deleted_at.is_(None))
+            .values(deleted_at=datetime.utcnow(), updated_at=Post.updated_at).returning(Post.title),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+        if post_title is None:
+            db.session.rollback()
             logger.warning(f"Попытка удалить несуществующий пост с ID {post_id}")
             return jsonify({
                 'success': False,
                 'error': 'Пост не найден',
                 'message': f'Пост с ID {post_id} не существует'
             }), 404
-        
-        post_title = post.title
-        db.session.delete(post)
+        # Одна запись на пост: его комментарии удалены вместе с ним
+        seq = record_change(db.session, 'post', 'delete', post_id, post_id)
+        db.session.execute(delete(CommentPage).where(CommentPage.post_id == post_id))
+        remove_author_comments(db.session, Comment.__table__.c.post_id == post_id)
         db.session.commit()
+        publish_comment_event(post_id, CommentEvent(seq, 'post_deleted', {'id': post_id}))
+        start_compactor()
         
         logger.info(f"Удален пост с ID {post_id}: {post_title}")
         return jsonify({
@@ -520,14 +2633,53 @@ def delete_post(post_id):
 
 # API Эндпоинты для комментариев
 
+def comment_page_args():
+    """Параметры страницы комментариев: limit и before (ID последнего полученного комментария).
+
+    Без обоих параметров возвращает (None, None) - нужен весь список.
+    """
+    limit = request.args.get('limit')
+    before = request.args.get('before')
+    if limit is None and before is None:
+        return None, None
+    if limit is None:
+        limit = str(app.config['COMMENT_PAGE_SIZE'])
+    if not limit.isdigit() or not 1 <= int(limit) <= app.config['COMMENTS_MAX_LIMIT']:
+        raise ValidationError(f"Параметр 'limit' должен быть числом от 1 до {app.config['COMMENTS_MAX_LIMIT']}", 'limit')
+    if before is not None and not before.isdigit():
+        raise ValidationError("Параметр 'before' должен быть ID комментария", 'before')
+    return int(limit), int(before) if before is not None else None
+
 @app.route('/posts/<int:post_id>/comments', methods=['GET'])
 @log_request
+@query_budget(4)
 def get_comments(post_id):
-    """Получить все комментарии к посту"""
+    """Получить комментарии к посту, новые первыми: все или страницу (?limit=, ?before=).
+
+    Первая страница (и весь список, если он в нее помещается) отдается из
+    comment_pages одним запросом по ключу, без сортировки и сериализации.
+    """
     try:
-        # Проверяем существование поста
-        post = Post.query.get(post_id)
-        if not post:
+        limit, before = comment_page_args()
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': e.message
+        }), 400
+    try:
+        # (JSON комментариев, сколько их есть начиная с первого) или None, если поста нет
+        if before is None:
+            page = first_comment_page(post_id, limit)
+        elif get_live_post(post_id) is None:
+            page = None
+        else:
+            # Лишняя строка показывает, есть ли следующая страница
+            rows = db.session.execute(LIVE_COMMENT_ROWS_BEFORE,
+                                      {'post_id': post_id, 'before': before, 'limit': limit + 1})
+            items = [render_json(comment) for comment in comment_rows_to_dicts(rows)]
+            page = items[:limit], len(items)
+        if page is None:
             logger.warning(f"Попытка получить комментарии к несуществующему посту {post_id}")
             return jsonify({
                 'success': False,
@@ -535,17 +2687,20 @@ def get_comments(post_id):
                 'message': f'Пост не найден: ID {post_id}'
             }), 404
         
-        comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
-        logger.info(f"Получено {len(comments)} комментариев для поста {post_id}")
-        
-        return jsonify({
+        items, available = page
+        logger.info(f"Получено {len(items)} комментариев для поста {post_id}")
+        payload = {
             'success': True,
-            'data': [comment.to_dict() for comment in comments],
-            'count': len(comments),
+            'count': len(items),
             'post_id': post_id
-        }), 200
+        }
+        if limit is not None:
+            has_more = available > len(items)
+            payload.update(has_more=has_more, next_before=json.loads(items[-1])['id'] if has_more else None)
+        return json_response_with_items(payload, items), 200
         
     except Exception as e:
+        db.session.rollback()
         logger.error(f"Ошибка при получении комментариев для поста {post_id}: {str(e)}")
         return jsonify({
             'success': False,
@@ -553,13 +2708,49 @@ def get_comments(post_id):
             'message': 'Не удалось получить комментарии'
         }), 500
 
+@app.route('/posts/<int:post_id>/comments/stream', methods=['GET'])
+@log_request
+@query_budget(1)
+def stream_comments(post_id):
+    """Поток Server-Sent Events о новых, измененных и удаленных комментариях поста.
+
+    Заголовок Last-Event-ID (или параметр ?last_event_id=) возобновляет поток:
+    сначала отдаются пропущенные события из журнала изменений.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    if last_event_id is not None:
+        if not last_event_id.strip().isdigit():
+            return jsonify({
+                'success': False,
+                'error': 'Неверный запрос',
+                'message': 'Last-Event-ID должен быть неотрицательным целым числом'
+            }), 400
+        last_event_id = int(last_event_id)
+    
+    post = get_live_post(post_id)
+    if not post:
+        logger.warning(f"Попытка подписаться на комментарии несуществующего поста {post_id}")
+        return jsonify({
+            'success': False,
+            'error': 'Пост не найден',
+            'message': f'Пост не найден: ID {post_id}'
+        }), 404
+    
+    logger.info(f"Открыт поток комментариев поста {post_id}"
+                + (f" с события {last_event_id}" if last_event_id is not None else ''))
+    detach_streaming_request()
+    return Response(stream_with_context(comment_event_stream(post_id, last_event_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/posts/<int:post_id>/comments', methods=['POST'])
 @log_request
+@query_budget(9)
 def create_comment(post_id):
     """Создать новый комментарий к посту"""
     try:
         # Проверяем существование поста
-        post = Post.query.get(post_id)
+        post = get_live_post(post_id)
         if not post:
             logger.warning(f"Попытка создать комментарий к несуществующему посту {post_id}")
             return jsonify({
@@ -597,14 +2788,45 @@ def create_comment(post_id):
             content=content,
             author=author
         )
-        
-        db.session.add(comment)
-        db.session.commit()
-        
-        logger.info(f"Создан новый комментарий с ID {comment.id} к посту {post_id} от {comment.author}")
+
+        if app.config['COMMENT_GROUP_COMMIT'] and not in_batch_transaction():
+            # Строка вставляется фоновым потоком в общей транзакции;
+            # объект остается вне сессии и нужен только для ответа
+            comment.created_at = datetime.utcnow()
+            comment_committer.start(
+                db.engine,
+                app.config['COMMENT_GROUP_COMMIT_WINDOW_MS'],
+                app.config['COMMENT_GROUP_COMMIT_MAX_BATCH']
+            )
+            comment.id = comment_committer.submit({
+                'post_id': post_id,
+                'content': content,
+                'author': author,
+                'created_at': comment.created_at
+            })
+            if comment.id is None:
+                logger.warning(f"Пост {post_id} удален до фиксации комментария")
+                return jsonify({
+                    'success': False,
+                    'error': 'Пост не найден',
+                    'message': f'Пост не найден: ID {post_id}'
+                }), 404
+            comment_data = comment.to_dict()
+        else:
+            db.session.add(comment)
+            db.session.flush()
+            comment_data = comment.to_dict()
+            update_comment_page(db.session, 'insert', comment_data)
+            adjust_hot_score(db.session, post_id, comment.created_at, True)
+            adjust_author_stats(db.session, author, comment.created_at, True)
+            seq = record_change(db.session, 'comment', 'insert', comment.id, post_id, comment_data)
+            db.session.commit()
+            publish_comment_event(post_id, CommentEvent(seq, 'comment_created', comment_data))
+
+        logger.info(f"Создан новый комментарий с ID {comment_data['id']} к посту {post_id} от {comment_data['author']}")
         return jsonify({
             'success': True,
-            'data': comment.to_dict(),
+            'data': comment_data,
             'message': 'Комментарий успешно создан'
         }), 201
         
@@ -619,10 +2841,11 @@ def create_comment(post_id):
 
 @app.route('/comments/<int:comment_id>', methods=['GET'])
 @log_request
+@query_budget(1)
 def get_comment(comment_id):
     """Получить комментарий по ID"""
     try:
-        comment = Comment.query.get(comment_id)
+        comment = get_live_comment(comment_id)
         if not comment:
             logger.warning(f"Комментарий с ID {comment_id} не найден")
             return jsonify({
@@ -645,12 +2868,38 @@ def get_comment(comment_id):
             'message': 'Не удалось получить комментарий'
         }), 500
 
+@app.route('/comments', methods=['GET'])
+@log_request
+@query_budget(1)
+def get_comments_by_ids():
+    """Комментарии по списку ID (?ids=1,2,3) одним запросом WHERE id IN (...)"""
+    if 'ids' not in request.args:
+        return invalid_ids_response(ValidationError("Нужен параметр 'ids' со списком ID комментариев", 'ids'))
+    try:
+        ids = parse_ids_arg(app.config['MULTI_GET_MAX_IDS'])
+    except ValidationError as e:
+        return invalid_ids_response(e)
+    try:
+        comments = Comment.query.join(Post).filter(
+            Comment.id.in_(ids), Comment.deleted_at.is_(None), Post.deleted_at.is_(None)
+        ).all() if ids else []
+        logger.info(f"Получено {len(comments)} из {len(ids)} запрошенных комментариев")
+        return multi_get_response(ids, comments)
+    except Exception as e:
+        logger.error(f"Ошибка при получении комментариев по списку ID: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при получении комментариев',
+            'message': 'Не удалось получить комментарии'
+        }), 500
+
 @app.route('/comments/<int:comment_id>', methods=['PUT'])
 @log_request
+@query_budget(9)
 def update_comment(comment_id):
     """Обновить комментарий"""
     try:
-        comment = Comment.query.get(comment_id)
+        comment = get_live_comment(comment_id)
         if not comment:
             logger.warning(f"Попытка обновить несуществующий комментарий с ID {comment_id}")
             return jsonify({
@@ -684,17 +2933,34 @@ def update_comment(comment_id):
                 }), 400
         
         # Обновление полей с очисткой
+        previous_author = comment.author
         if 'content' in data:
             comment.content = sanitize_text(data['content'])
         if 'author' in data:
             comment.author = sanitize_text(data['author'])
+        if not db.session.is_modified(comment):
+            # Те же значения: ни записи в журнал, ни транзакции записи
+            logger.info(f"Комментарий с ID {comment_id} не изменился")
+            return jsonify({
+                'success': True,
+                'data': comment.to_dict(),
+                'message': 'Комментарий успешно обновлен'
+            }), 200
+        if comment.author != previous_author:
+            # Комментарий переходит в сводку нового автора
+            adjust_author_stats(db.session, previous_author, comment.created_at, False)
+            adjust_author_stats(db.session, comment.author, comment.created_at, True)
         
+        comment_data = comment.to_dict()
+        seq = record_change(db.session, 'comment', 'update', comment_id, comment_data['post_id'], comment_data)
+        update_comment_page(db.session, 'update', comment_data)
         db.session.commit()
+        publish_comment_event(comment_data['post_id'], CommentEvent(seq, 'comment_updated', comment_data))
         
-        logger.info(f"Обновлен комментарий с ID {comment_id} от {comment.author}")
+        logger.info(f"Обновлен комментарий с ID {comment_id} от {comment_data['author']}")
         return jsonify({
             'success': True,
-            'data': comment.to_dict(),
+            'data': comment_data,
             'message': 'Комментарий успешно обновлен'
         }), 200
         
@@ -709,22 +2975,34 @@ def update_comment(comment_id):
 
 @app.route('/comments/<int:comment_id>', methods=['DELETE'])
 @log_request
+@query_budget(8)
 def delete_comment(comment_id):
-    """Удалить комментарий"""
+    """Удалить комментарий: пометка deleted_at одним UPDATE, строку удаляет компактор"""
     try:
-        comment = Comment.query.get(comment_id)
-        if not comment:
+        posts = Post.__table__
+        deleted = db.session.execute(
+            update(Comment).where(
+                Comment.id == comment_id, Comment.deleted_at.is_(None),
+                exists().where(posts.c.id == Comment.post_id, posts.c.deleted_at.is_(None))
+            ).values(deleted_at=datetime.utcnow()).returning(Comment.author, Comment.post_id, Comment.created_at),
+            execution_options={'synchronize_session': False}
+        ).first()
+        if deleted is None:
+            db.session.rollback()
             logger.warning(f"Попытка удалить несуществующий комментарий с ID {comment_id}")
             return jsonify({
                 'success': False,
                 'error': 'Комментарий не найден',
                 'message': f'Комментарий не найден: ID {comment_id}'
             }), 404
-        
-        comment_author = comment.author
-        post_id = comment.post_id
-        db.session.delete(comment)
+        comment_author, post_id, created_at = deleted
+        seq = record_change(db.session, 'comment', 'delete', comment_id, post_id)
+        update_comment_page(db.session, 'delete', {'id': comment_id, 'post_id': post_id})
+        adjust_hot_score(db.session, post_id, created_at, False)
+        adjust_author_stats(db.session, comment_author, created_at, False)
         db.session.commit()
+        publish_comment_event(post_id, CommentEvent(seq, 'comment_deleted', {'id': comment_id, 'post_id': post_id}))
+        start_compactor()
         
         logger.info(f"Удален комментарий с ID {comment_id} от {comment_author} к посту {post_id}")
         return jsonify({
@@ -741,6 +3019,914 @@ def delete_comment(comment_id):
             'message': 'Не удалось удалить комментарий'
         }), 500
 
+@app.route('/authors/<author>/comments', methods=['GET'])
+@log_request
+@query_budget(2)
+def get_author_comments(author):
+    """Комментарии автора к живым постам, новые первыми, страницами (?limit=, ?before=),
+    и сводка по автору: число комментариев, первое и последнее появление.
+
+    Сводка читается по ключу из author_stats, страница - по индексу
+    ix_comments_author_live без просмотра комментариев других авторов.
+    """
+    try:
+        limit, before = comment_page_args()
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': e.message
+        }), 400
+    limit = limit or app.config['COMMENT_PAGE_SIZE']
+    author = author.strip()
+    try:
+        stats = db.session.execute(AUTHOR_STATS, {'author': author}).scalar_one_or_none()
+        if stats is None:
+            logger.warning(f"Попытка получить комментарии несуществующего автора {author}")
+            return jsonify({
+                'success': False,
+                'error': 'Автор не найден',
+                'message': f'Автор не найден: {author}'
+            }), 404
+        # Лишняя строка показывает, есть ли следующая страница
+        params = {'author': author, 'limit': limit + 1}
+        if before is None:
+            rows = db.session.execute(AUTHOR_COMMENT_ROWS, params)
+        else:
+            rows = db.session.execute(AUTHOR_COMMENT_ROWS_BEFORE, dict(params, before=before))
+        comments = comment_rows_to_dicts(rows)
+        has_more = len(comments) > limit
+        comments = comments[:limit]
+        logger.info(f"Получено {len(comments)} комментариев автора {author}")
+        return jsonify({
+            'success': True,
+            'data': comments,
+            'count': len(comments),
+            'author': stats.to_dict(),
+            'has_more': has_more,
+            'next_before': comments[-1]['id'] if has_more else None
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при получении комментариев автора {author}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при получении комментариев',
+            'message': 'Не удалось получить комментарии автора'
+        }), 500
+
+def _parse_datetime_arg(name):
+    """Момент времени из ISO 8601 параметра запроса; с часовым поясом - переводится в UTC"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValidationError(f"Параметр '{name}' должен быть датой в формате ISO 8601", name)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def bulk_comment_filters():
+    """Условия отбора комментариев для массового удаления из параметров запроса"""
+    conditions = []
+    filters = {}
+    if 'author' in request.args:
+        author = request.args['author'].strip()
+        if not author:
+            raise ValidationError("Параметр 'author' не может быть пустым", 'author')
+        conditions.append(Comment.author == author)
+        filters['author'] = author
+    if 'post_id' in request.args:
+        post_id = request.args.get('post_id', type=int)
+        if post_id is None:
+            raise ValidationError("Параметр 'post_id' должен быть целым числом", 'post_id')
+        conditions.append(Comment.post_id == post_id)
+        filters['post_id'] = post_id
+    for name, compare in (('before', Comment.created_at.__lt__), ('after', Comment.created_at.__ge__)):
+        moment = _parse_datetime_arg(name)
+        if moment is not None:
+            conditions.append(compare(moment))
+            filters[name] = moment.isoformat()
+    if not conditions:
+        raise ValidationError("Нужен хотя бы один фильтр: author, post_id, before или after")
+    # Только живые комментарии живых постов: помеченные удаленными уже в журнале и ждут компактора
+    posts = Post.__table__
+    conditions += [Comment.deleted_at.is_(None),
+                   exists().where(posts.c.id == Comment.post_id, posts.c.deleted_at.is_(None))]
+    return conditions, filters
+
+def delete_comments_in_chunks(conditions, chunk_size, pause):
+    """Удаление отобранных комментариев пачками по `chunk_size` строк.
+
+    Каждая пачка - отдельная короткая транзакция: выборка идентификаторов по
+    возрастанию id после предыдущей пачки (без повторного просмотра уже
+    пройденных строк), вычитание из сводок авторов, одно выражение DELETE,
+    удаление готовых страниц и пересчет рейтинга затронутых постов и записи
+    журнала изменений одним executemany. Между пачками блокировка записи освобождается на `pause`
+    секунд для других писателей.
+    """
+    deleted = 0
+    chunks = 0
+    last_id = 0
+    while True:
+        query_budget.extend(8)
+        rows = db.session.execute(
+            select(Comment.id, Comment.post_id).where(Comment.id > last_id, *conditions)
+            .order_by(Comment.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            db.session.commit()
+            return deleted, chunks
+        ids = [comment_id for comment_id, _ in rows]
+        # Комментарии удаленных постов уже вычтены из сводок при удалении поста
+        posts = Post.__table__
+        remove_author_comments(db.session, Comment.__table__.c.id.in_(ids),
+                               exists().where(posts.c.id == Comment.__table__.c.post_id, posts.c.deleted_at.is_(None)))
+        db.session.execute(delete(Comment).where(Comment.id.in_(ids)), execution_options={'synchronize_session': False})
+        # Готовые страницы и рейтинг затронутых постов строятся заново - без сотен правок
+        # по одному комментарию и без накопления ошибки от вычитаний
+        post_ids = {post_id for _, post_id in rows}
+        rebuild_comment_pages(db.session, Post.__table__.c.id.in_(post_ids))
+        rebuild_hot_scores(db.session, Post.__table__.c.id.in_(post_ids))
+        # RETURNING без сортировки по параметрам - одно выражение на пачку; seq сопоставляется по id
+        changes_table = Change.__table__
+        seqs = dict(db.session.execute(
+            insert(changes_table).returning(changes_table.c.entity_id, changes_table.c.seq),
+            [change_row('comment', 'delete', comment_id, post_id) for comment_id, post_id in rows]
+        ).all())
+        db.session.commit()
+        for comment_id, post_id in rows:
+            comment_events.publish(post_id, CommentEvent(seqs[comment_id], 'comment_deleted',
+                                                         {'id': comment_id, 'post_id': post_id}))
+        deleted += len(ids)
+        chunks += 1
+        last_id = ids[-1]
+        if len(ids) < chunk_size:
+            return deleted, chunks
+        if pause:
+            time.sleep(pause)
+
+@app.route('/comments', methods=['DELETE'])
+@log_request
+@require_admin
+@query_budget(1)
+def bulk_delete_comments():
+    """Массовое удаление комментариев по автору, посту и/или времени создания.
+
+    ?dry_run=1 возвращает только число комментариев, которые будут удалены.
+    """
+    try:
+        conditions, filters = bulk_comment_filters()
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': e.message
+        }), 400
+    
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        if dry_run:
+            count = db.session.execute(select(db.func.count(Comment.id)).where(*conditions)).scalar()
+            return jsonify({
+                'success': True,
+                'data': {'dry_run': True, 'matched': count, 'filters': filters}
+            }), 200
+        
+        started = time.perf_counter()
+        deleted, chunks = delete_comments_in_chunks(conditions, app.config['BULK_DELETE_CHUNK_SIZE'],
+                                                    app.config['BULK_DELETE_PAUSE_MS'] / 1000)
+        logger.info(f"Массовое удаление комментариев {filters}: удалено {deleted} "
+                    f"за {chunks} транзакций, {time.perf_counter() - started:.2f} с")
+        return jsonify({
+            'success': True,
+            'data': {'dry_run': False, 'deleted': deleted, 'chunks': chunks, 'filters': filters},
+            'message': f'Удалено комментариев: {deleted}'
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при массовом удалении комментариев {filters}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при удалении комментариев',
+            'message': 'Не удалось удалить комментарии; уже удаленные пачки не восстанавливаются'
+        }), 500
+
+# Журнал изменений
+def changes_page_args():
+    """Параметры страницы журнала изменений: since (номер последней полученной записи) и limit"""
+    since = request.args.get('since', '0')
+    limit = request.args.get('limit', str(app.config['CHANGES_DEFAULT_LIMIT']))
+    if not since.isdigit():
+        raise ValidationError("Параметр 'since' должен быть неотрицательным целым числом", 'since')
+    if not limit.isdigit() or not 1 <= int(limit) <= app.config['CHANGES_MAX_LIMIT']:
+        raise ValidationError(f"Параметр 'limit' должен быть числом от 1 до {app.config['CHANGES_MAX_LIMIT']}", 'limit')
+    return int(since), int(limit)
+
+@app.route('/changes', methods=['GET'])
+@log_request
+@query_budget(1)
+def get_changes():
+    """Изменения постов и комментариев после записи с номером since, по порядку.
+
+    Клиент сохраняет next_since и запрашивает следующую страницу, пока has_more.
+    Удаление поста - одна запись: все его комментарии удалены вместе с ним.
+    """
+    try:
+        since, limit = changes_page_args()
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': e.message
+        }), 400
+    try:
+        # Лишняя строка показывает, есть ли следующая страница
+        changes = Change.query.filter(Change.seq > since).order_by(Change.seq).limit(limit + 1).all()
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        logger.info(f"Получено {len(changes)} изменений после {since}")
+        return jsonify({
+            'success': True,
+            'data': [change.to_dict() for change in changes],
+            'count': len(changes),
+            'next_since': changes[-1].seq if changes else since,
+            'has_more': has_more
+        }), 200
+    except Exception as e:
+        logger.error(f"Ошибка при получении журнала изменений после {since}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при получении изменений',
+            'message': 'Не удалось получить журнал изменений'
+        }), 500
+
+# Пакетные запросы
+# Маршруты, доступные операциям пакета: посты и комментарии, без служебных и самого /batch
+BATCH_ENDPOINTS = frozenset((
+    'get_posts', 'get_hot_posts', 'get_post', 'create_post', 'update_post', 'delete_post',
+    'get_comments', 'create_comment', 'get_comments_by_ids', 'get_comment', 'update_comment', 'delete_comment',
+    'get_author_comments',
+    'get_changes',
+))
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+class _ConnectionSession(FlaskSession):
+    """Сессия, все выражения которой идут через одно соединение (транзакцию пакета)"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return self.bind
+
+def in_batch_transaction():
+    """Выполняется ли текущий запрос внутри атомарного пакета"""
+    return db.session.info.get('batch_transaction', False)
+
+@contextmanager
+def batch_transaction():
+    """Одна транзакция на все операции пакета.
+
+    Сессия запроса временно заменяется сессией, привязанной к соединению с
+    открытой транзакцией в режиме rollback_only: commit() маршрутов только
+    сбрасывает изменения в базу, rollback() отменяет всю транзакцию. Фиксирует
+    или отменяет транзакцию вызывающий код через возвращенный объект.
+    """
+    previous = db.session()
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    session = _ConnectionSession(**dict(db.session.session_factory.kw, bind=connection,
+                                        join_transaction_mode='rollback_only', info={'batch_transaction': True}))
+    db.session.registry.set(session)
+    try:
+        yield transaction
+    finally:
+        session.close()
+        if transaction.is_active:
+            transaction.rollback()
+        connection.close()
+        db.session.registry.set(previous)
+
+def parse_batch_operations(data, limit):
+    """Проверка тела POST /batch: список операций {method, path, body}"""
+    if not isinstance(data, dict) or not isinstance(data.get('operations'), list):
+        raise ValidationError("Тело запроса должно содержать список 'operations'", 'operations')
+    operations = data['operations']
+    if not operations:
+        raise ValidationError("Список 'operations' не может быть пустым", 'operations')
+    if len(operations) > limit:
+        raise ValidationError(f"В пакете не больше {limit} операций", 'operations')
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise ValidationError(f"Операция {index} должна быть объектом", 'operations')
+        if str(operation.get('method', '')).upper() not in BATCH_METHODS:
+            raise ValidationError(f"Операция {index}: метод должен быть одним из {', '.join(BATCH_METHODS)}", 'method')
+        if not isinstance(operation.get('path'), str) or not operation['path'].startswith('/'):
+            raise ValidationError(f"Операция {index}: 'path' должен быть путем, начинающимся с /", 'path')
+        if operation.get('body') is not None and not isinstance(operation['body'], (dict, list)):
+            raise ValidationError(f"Операция {index}: 'body' должен быть JSON объектом", 'body')
+    if not isinstance(data.get('atomic', False), bool):
+        raise ValidationError("Параметр 'atomic' должен быть true или false", 'atomic')
+    return operations
+
+def run_batch_operation(method, path, body, remote_addr):
+    """Выполнение одной операции пакета маршрутом приложения; возвращает ответ маршрута.
+
+    Операция получает собственный контекст запроса в копии контекста переменных:
+    хуки завершения вложенного запроса не трогают счетчики пакета, а SQL-выражения
+    операции добавляются к ним после выполнения. Бюджет SQL-запросов пакета растет
+    на бюджет маршрута операции.
+    """
+    stats = RequestStats()
+    
+    def dispatch():
+        _request_stats.set(stats)
+        with app.test_request_context(path, method=method, json=body, environ_base={'REMOTE_ADDR': remote_addr}):
+            if request.routing_exception is not None:
+                return app.make_response(app.handle_user_exception(request.routing_exception))
+            endpoint = request.url_rule.endpoint
+            if endpoint not in BATCH_ENDPOINTS:
+                return app.make_response((jsonify({
+                    'success': False,
+                    'error': 'Неверный запрос',
+                    'message': f'Маршрут {method} {request.path} недоступен в пакете'
+                }), 400))
+            if app.config['ADMISSION_CONTROL_ENABLED']:
+                retry_after = admission.check_rate(remote_addr, endpoint, method)
+                if retry_after:
+                    return _rejection(429, 'Слишком много запросов',
+                                      'Превышен лимит запросов, повторите попытку позже', retry_after)
+            view = app.view_functions[endpoint]
+            query_budget.extend(view.query_budget)
+            return app.make_response(view(**request.view_args))
+    
+    response = contextvars.copy_context().run(dispatch)
+    outer = _request_stats.get()
+    if outer is not None:
+        outer.db_queries += stats.db_queries
+        outer.db_time += stats.db_time
+    return response
+
+@app.route('/batch', methods=['POST'])
+@log_request
+@query_budget(0)
+def batch():
+    """Несколько операций над постами и комментариями в одном HTTP запросе.
+
+    Операции выполняются по порядку, у каждой свой код ответа. С "atomic": true
+    все операции идут в одной транзакции: первая неудачная операция отменяет
+    пакет, оставшиеся не выполняются.
+    """
+    try:
+        data = request.get_json(silent=True)
+        operations = parse_batch_operations(data, app.config['BATCH_MAX_OPERATIONS'])
+    except ValidationError as e:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный пакет',
+            'message': e.message
+        }), 400
+    
+    atomic = data.get('atomic', False)
+    results = []
+    
+    def run_all():
+        for operation in operations:
+            method = operation['method'].upper()
+            response = run_batch_operation(method, operation['path'], operation.get('body'), request.remote_addr)
+            results.append({'method': method, 'path': operation['path'], 'status': response.status_code,
+                            'body': response.get_json(silent=True)})
+            if atomic and response.status_code >= 400:
+                return False
+        return True
+    
+    try:
+        if atomic:
+            with batch_transaction() as transaction:
+                committed = run_all()
+                if committed:
+                    transaction.commit()
+                    publish_pending_comment_events(db.session)
+        else:
+            committed = run_all()
+    except QueryBudgetExceeded:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при выполнении пакета из {len(operations)} операций: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Ошибка при выполнении пакета',
+            'message': 'Не удалось выполнить пакет' + ('; изменения отменены' if atomic else '')
+        }), 500
+    
+    for operation in operations[len(results):]:
+        results.append({'method': operation['method'].upper(), 'path': operation['path'], 'status': None,
+                        'body': None})
+    logger.info(f"Выполнен пакет из {len(operations)} операций"
+                + (f", транзакция {'зафиксирована' if committed else 'отменена'}" if atomic else ''))
+    if not committed:
+        failed = len([result for result in results if result['status'] is not None]) - 1
+        return jsonify({
+            'success': False,
+            'error': 'Пакет отменен',
+            'message': f'Операция {failed} завершилась с ошибкой, изменения пакета отменены',
+            'data': results,
+            'atomic': True
+        }), 409
+    return jsonify({
+        'success': True,
+        'data': results,
+        'count': len(results),
+        'atomic': atomic
+    }), 200
+
+# Выгрузка данных из согласованного снимка
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_CSV_FIELDS = ('type', 'id', 'post_id', 'title', 'content', 'author', 'created_at', 'updated_at')
+
+@contextmanager
+def export_snapshot(engine):
+    """Соединение, все чтения которого видят один снимок базы, не блокируя писателей.
+
+    В режиме WAL это одна транзакция чтения: писатели работают параллельно,
+    а соединение видит базу на момент первого чтения. Без WAL долгое чтение
+    удерживало бы блокировку SHARED и не давало бы писателям зафиксировать
+    изменения, поэтому база сначала копируется во временный файл по шагам
+    backup_database (писатели фиксируют изменения между шагами), и выгрузка
+    читает копию.
+    """
+    with engine.connect() as conn:
+        wal = conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        if wal:
+            # pysqlite сам не начинает транзакцию перед SELECT
+            conn.exec_driver_sql('BEGIN')
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+            return
+    fd, path = tempfile.mkstemp(prefix='blog_export_', suffix='.db')
+    os.close(fd)
+    try:
+        backup_database(engine, path, app.config['BACKUP_PAGES_PER_STEP'], app.config['BACKUP_STEP_PAUSE_MS'],
+                        max_restarts=app.config['BACKUP_MAX_RESTARTS'])
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    copy = create_engine(f'sqlite:///{path}', poolclass=NullPool)
+    try:
+        with copy.connect() as conn:
+            yield conn
+    finally:
+        copy.dispose()
+        os.remove(path)
+
+def export_records(conn, batch_size, counts):
+    """Живые посты, затем комментарии живых постов: пары (тип, словарь как в ответах API).
+
+    Строки читаются пачками по `batch_size`, память не растет с размером базы.
+    """
+    posts, comments = Post.__table__, Comment.__table__
+    result = conn.execution_options(yield_per=batch_size).execute(
+        select(*POST_COLUMNS).where(posts.c.deleted_at.is_(None)).order_by(posts.c.id))
+    for rows in result.partitions():
+        for post in post_rows_to_dicts(rows):
+            counts['posts'] += 1
+            yield 'post', post
+    result = conn.execution_options(yield_per=batch_size).execute(
+        select(*COMMENT_COLUMNS).join(posts, posts.c.id == comments.c.post_id)
+        .where(comments.c.deleted_at.is_(None), posts.c.deleted_at.is_(None)).order_by(comments.c.id))
+    for rows in result.partitions():
+        for comment in comment_rows_to_dicts(rows):
+            counts['comments'] += 1
+            yield 'comment', comment
+
+def export_lines(records, export_format):
+    """Записи выгрузки в виде строк NDJSON или CSV (с заголовком)"""
+    if export_format == 'ndjson':
+        for kind, record in records:
+            yield json.dumps({'type': kind, **record}, ensure_ascii=False) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_FIELDS)
+    for kind, record in records:
+        record = dict(record, type=kind)
+        writer.writerow([record.get(field, '') for field in EXPORT_CSV_FIELDS])
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def gzip_chunks(lines, level):
+    """Сжатие потока строк в gzip; zlib сам копит данные до заполнения блока"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for line in lines:
+        chunk = compressor.compress(line.encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+def export_stream(engine, export_format, compress, batch_size, level, counts=None):
+    """Поток байтов выгрузки; снимок открывается при чтении первого фрагмента"""
+    counts = counts if counts is not None else {'posts': 0, 'comments': 0}
+    with export_snapshot(engine) as conn:
+        lines = export_lines(export_records(conn, batch_size, counts), export_format)
+        if compress:
+            yield from gzip_chunks(lines, level)
+        else:
+            for line in lines:
+                yield line.encode('utf-8')
+
+def export_filename(export_format, compress):
+    return f"blog-export-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}" + ('.gz' if compress else '')
+
+@app.route('/export', methods=['GET'])
+@log_request
+@require_admin
+# До начала потока маршрут к базе не обращается. Выражения выгрузки (режим журнала, снимок
+# и две выборки) выполняются при отдаче ответа, уже после выхода из декоратора, и бюджетом
+# не проверяются
+@query_budget(0)
+def export_data():
+    """Выгрузка всех живых постов и комментариев одним потоком (NDJSON или CSV, по умолчанию gzip).
+
+    Выборка идет при отдаче ответа из согласованного снимка базы.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': 'Неверный запрос',
+            'message': f"Параметр 'format' должен быть одним из: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+    compress = request.args.get('gzip', '1').lower() not in ('0', 'false', 'no')
+    
+    logger.info(f"Выгрузка данных в формате {export_format}{' (gzip)' if compress else ''}")
+    stream = export_stream(db.engine, export_format, compress, app.config['EXPORT_BATCH_SIZE'],
+                           app.config['EXPORT_GZIP_LEVEL'])
+    return Response(stream, mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={export_filename(export_format, compress)}'})
+
+@app.cli.command('export')
+@click.option('--format', 'export_format', type=click.Choice(tuple(EXPORT_FORMATS)), default='ndjson',
+              show_default=True, help='Формат выгрузки')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Файл выгрузки (по умолчанию blog-export-<время>.<формат>[.gz])')
+@click.option('--gzip/--no-gzip', 'compress', default=True, show_default=True, help='Сжимать gzip')
+def export_command(export_format, output, compress):
+    """Выгрузить все посты и комментарии из согласованного снимка базы"""
+    output = output or export_filename(export_format, compress)
+    started = time.perf_counter()
+    counts = {'posts': 0, 'comments': 0}
+    with open(output, 'wb') as f:
+        for chunk in export_stream(db.engine, export_format, compress, app.config['EXPORT_BATCH_SIZE'],
+                                   app.config['EXPORT_GZIP_LEVEL'], counts):
+            f.write(chunk)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Выгрузка {output}: {counts['posts']} постов, {counts['comments']} комментариев за {elapsed:.1f} с")
+    click.echo(f"Выгружено {counts['posts']} постов и {counts['comments']} комментариев в {output} за {elapsed:.1f} с")
+
+# Горячее резервное копирование (flask backup и задание по расписанию)
+class BackupFailed(Exception):
+    """Копия не прошла проверку целостности и удалена"""
+
+class _BackupRestartLimit(Exception):
+    pass
+
+BackupResult = namedtuple('BackupResult', ('path', 'pages', 'size', 'seconds', 'steps', 'restarts'))
+
+def backup_database(engine, path, pages_per_step, pause_ms, progress=None, max_restarts=5):
+    """Копия базы SQLite backup API по `pages_per_step` страниц за шаг с паузой между шагами.
+
+    Блокировка чтения источника держится только на время шага, поэтому
+    писатели фиксируют изменения между шагами. Изменение источника другим
+    соединением перезапускает копирование с начала (SQLite делает это сам);
+    при постоянной записи копия могла бы не закончиться никогда, поэтому
+    после `max_restarts` перезапусков она снимается одним шагом (в режиме
+    WAL писатели при этом не ждут, без WAL - ждут до конца шага).
+
+    Копия пишется во временный файл рядом с `path`, проверяется PRAGMA
+    integrity_check и только затем переименовывается, так что по пути `path`
+    не бывает недописанной копии. `progress(скопировано, всего)` вызывается
+    после каждого шага.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, partial = tempfile.mkstemp(prefix='.backup-', suffix='.db', dir=directory)
+    os.close(fd)
+    state = {'steps': 0, 'restarts': 0, 'remaining': None, 'total': 0}
+    
+    def step(status, remaining, total):
+        # Шаг без перезапуска всегда уменьшает число оставшихся страниц
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+        state.update(steps=state['steps'] + 1, remaining=remaining, total=total)
+        if progress:
+            progress(total - remaining, total)
+        if remaining and state['restarts'] > max_restarts:
+            # Исключение из progress прерывает копирование
+            raise _BackupRestartLimit()
+        if remaining and pause_ms:
+            time.sleep(pause_ms / 1000)
+    
+    started = time.perf_counter()
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            with engine.connect() as conn:
+                source = conn.connection.driver_connection
+                try:
+                    source.backup(target, pages=pages_per_step, progress=step)
+                except _BackupRestartLimit:
+                    logger.warning(f"Резервное копирование перезапущено {state['restarts']} раз из-за записей, "
+                                   f"копия снимается одним шагом")
+                    source.backup(target, pages=-1, progress=step)
+            integrity = target.execute('PRAGMA integrity_check').fetchall()
+        finally:
+            target.close()
+        if integrity != [('ok',)]:
+            raise BackupFailed(f"Копия {path} повреждена: " + '; '.join(row[0] for row in integrity[:10]))
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return BackupResult(path, state['total'], os.path.getsize(path), time.perf_counter() - started,
+                        state['steps'], state['restarts'])
+
+def backup_filename(directory):
+    return os.path.join(directory, f"blog-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.db")
+
+def prune_backups(directory, keep):
+    """Удаление старых копий blog-*.db сверх `keep` последних; возвращает удаленные пути"""
+    backups = sorted(name for name in os.listdir(directory) if name.startswith('blog-') and name.endswith('.db'))
+    removed = [os.path.join(directory, name) for name in backups[:max(len(backups) - keep, 0)]]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+class BackupScheduler:
+    """Фоновое резервное копирование раз в `interval` секунд с ротацией копий.
+
+    Копия снимается по шагам с паузами (backup_database), поэтому задание
+    можно оставлять включенным под нагрузкой. Ошибка одного прогона
+    пишется в журнал и не останавливает расписание.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        # Последняя успешная копия (для тестов и диагностики)
+        self.last_result = None
+    
+    @property
+    def running(self):
+        return self._thread is not None
+    
+    def start(self, engine, interval, directory, keep, pages_per_step, pause_ms, max_restarts):
+        """Запуск фонового потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(engine, interval, directory, keep, pages_per_step, pause_ms, max_restarts),
+                name='backup-scheduler', daemon=True
+            )
+            self._thread.start()
+    
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._stop_event.set()
+        thread.join()
+    
+    def _run(self, engine, interval, directory, keep, pages_per_step, pause_ms, max_restarts):
+        while not self._stop_event.wait(interval):
+            try:
+                self.run_once(engine, directory, keep, pages_per_step, pause_ms, max_restarts)
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования: {str(e)}")
+    
+    def run_once(self, engine, directory, keep, pages_per_step, pause_ms, max_restarts=5):
+        """Одна копия в `directory` и удаление старых сверх `keep`"""
+        result = backup_database(engine, backup_filename(directory), pages_per_step, pause_ms,
+                                 max_restarts=max_restarts)
+        removed = prune_backups(directory, keep)
+        self.last_result = result
+        logger.info(f"Резервная копия {result.path}: {result.pages} страниц за {result.seconds:.1f} с, "
+                    f"перезапусков {result.restarts}, удалено старых копий {len(removed)}")
+        return result
+
+backup_scheduler = BackupScheduler()
+
+@app.before_request
+def start_backup_scheduler():
+    """Запуск копирования по расписанию с первым запросом, если задан BACKUP_INTERVAL_SECONDS"""
+    if app.config['BACKUP_INTERVAL_SECONDS'] > 0 and not backup_scheduler.running:
+        backup_scheduler.start(db.engine, app.config['BACKUP_INTERVAL_SECONDS'], app.config['BACKUP_DIR'],
+                               app.config['BACKUP_KEEP'], app.config['BACKUP_PAGES_PER_STEP'],
+                               app.config['BACKUP_STEP_PAUSE_MS'], app.config['BACKUP_MAX_RESTARTS'])
+
+@app.cli.command('backup')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Файл копии (по умолчанию BACKUP_DIR/blog-<время>.db)')
+@click.option('--pages', type=click.IntRange(min=1), default=None,
+              help='Страниц за шаг (по умолчанию BACKUP_PAGES_PER_STEP)')
+@click.option('--pause-ms', type=click.FloatRange(min=0), default=None,
+              help='Пауза между шагами, мс (по умолчанию BACKUP_STEP_PAUSE_MS)')
+def backup_command(output, pages, pause_ms):
+    """Горячая резервная копия базы без остановки API с проверкой целостности"""
+    output = output or backup_filename(app.config['BACKUP_DIR'])
+    reported = [-1]
+    
+    def progress(copied, total):
+        # Не чаще одной строки на 10%
+        percent = copied * 100 // total if total else 100
+        if percent // 10 > reported[0] // 10:
+            reported[0] = percent
+            click.echo(f'Скопировано {percent}% ({copied}/{total} страниц)')
+    
+    try:
+        result = backup_database(db.engine, output,
+                                 pages or app.config['BACKUP_PAGES_PER_STEP'],
+                                 app.config['BACKUP_STEP_PAUSE_MS'] if pause_ms is None else pause_ms, progress,
+                                 app.config['BACKUP_MAX_RESTARTS'])
+    except BackupFailed as e:
+        raise click.ClickException(str(e))
+    logger.info(f"Резервная копия {result.path}: {result.pages} страниц за {result.seconds:.1f} с")
+    click.echo(f"Резервная копия {result.path}: {result.pages} страниц, {result.size / 1024 / 1024:.1f} МБ, "
+               f"{result.steps} шагов за {result.seconds:.1f} с, перезапусков {result.restarts}; "
+               f"целостность проверена")
+
+# Генерация тестовых данных (flask seed)
+SEED_WORDS = (
+    'архитектура', 'база', 'данных', 'запрос', 'индекс', 'кэширование', 'производительность', 'сервер',
+    'клиент', 'задержка', 'пропускная', 'способность', 'транзакция', 'журнал', 'таблица', 'строка',
+    'нагрузка', 'мониторинг', 'метрика', 'профилирование', 'память', 'процессор', 'очередь', 'поток',
+    'блокировка', 'репликация', 'резервная', 'копия', 'миграция', 'схема', 'версия', 'релиз',
+    'тестирование', 'отладка', 'ошибка', 'исправление', 'оптимизация', 'алгоритм', 'структура', 'список',
+    'словарь', 'функция', 'модуль', 'пакет', 'библиотека', 'фреймворк', 'маршрут', 'эндпоинт',
+    'ответ', 'статус', 'заголовок', 'сжатие', 'сессия', 'соединение', 'пул', 'конфигурация',
+    'окружение', 'контейнер', 'развертывание', 'команда', 'проект', 'задача', 'решение', 'результат',
+    'пример', 'вопрос', 'опыт', 'подход', 'практика', 'статья', 'обзор', 'сравнение',
+)
+SEED_FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Елена', 'Алексей', 'Ольга', 'Дмитрий', 'Наталья',
+                    'Сергей', 'Татьяна', 'Андрей', 'Юлия', 'Михаил', 'Ирина', 'Николай', 'Alex', 'Maria')
+SEED_LAST_NAMES = ('Иванов', 'Петрова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова', 'Лебедев', 'Козлова',
+                   'Новиков', 'Морозова', 'Волков', 'Павлова', 'Smith', 'Brown')
+
+def _seed_text(rng, min_words, max_words):
+    """Текст из предложений по 5-12 слов; слова берутся выборками без повторов,
+    поэтому ни одно слово не превышает порог спама validate_content"""
+    count = rng.randint(min_words, max_words)
+    words = []
+    while len(words) < count:
+        words.extend(rng.sample(SEED_WORDS, min(len(SEED_WORDS), count - len(words))))
+    sentences = []
+    while words:
+        size = rng.randint(5, 12)
+        sentences.append(' '.join(words[:size]).capitalize() + '.')
+        words = words[size:]
+    return ' '.join(sentences)
+
+def _seed_pool(rng, size, make, validate):
+    """Пул заранее проверенных значений: генерация каждой строки заново слишком дорога для 1M записей"""
+    pool = []
+    while len(pool) < size:
+        value = make()
+        if not validate(value):
+            pool.append(value)
+    return pool
+
+@contextmanager
+def _bulk_load_connection(engine):
+    """Соединение для массовой загрузки: в SQLite на время загрузки включаются WAL
+    и synchronous=OFF, после загрузки прежний режим журнала восстанавливается"""
+    with engine.connect() as conn:
+        if engine.dialect.name != 'sqlite':
+            yield conn
+            return
+        journal_mode = conn.exec_driver_sql('PRAGMA journal_mode').scalar()
+        conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+        conn.exec_driver_sql('PRAGMA synchronous=OFF')
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            # Перенос WAL в основной файл тоже без fsync на каждую страницу
+            if journal_mode.lower() != 'wal':
+                conn.exec_driver_sql(f'PRAGMA journal_mode={journal_mode}')
+            conn.exec_driver_sql('PRAGMA synchronous=FULL')
+            conn.commit()
+
+def seed_database(engine, posts, comments, rng, batch_size=50000, progress=None):
+    """Массовая вставка `posts` постов и `comments` комментариев через Core.
+
+    Посты вставляются одной транзакцией, комментарии - транзакциями по
+    `batch_size` строк. Комментарии распределены по постам по закону Парето
+    (у популярных постов их намного больше) и созданы позже своего поста.
+    Все тексты проходят validate_post_data и validate_comment_data. Рейтинг
+    горячих постов новых постов и сводка по авторам пересчитываются после загрузки.
+    """
+    if posts <= 0 and comments > 0:
+        raise ValueError('Комментариям нужен хотя бы один пост')
+    titles = _seed_pool(rng, 500, lambda: _seed_text(rng, 3, 8).rstrip('.')[:200],
+                        lambda title: validate_title(title))
+    contents = _seed_pool(rng, 500, lambda: _seed_text(rng, 30, 400), validate_content)
+    comment_texts = _seed_pool(rng, 5000, lambda: _seed_text(rng, 2, 60), validate_comment_content)
+    authors = [f'{first} {last}' for first in SEED_FIRST_NAMES for last in SEED_LAST_NAMES]
+    
+    now = datetime.utcnow()
+    with _bulk_load_connection(engine) as conn:
+        with conn.begin():
+            first_id = (conn.execute(select(db.func.max(Post.id))).scalar() or 0) + 1
+            post_times = sorted(now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)) for _ in range(posts))
+            conn.execute(insert(Post), [
+                {'id': first_id + i, 'title': rng.choice(titles), 'content': rng.choice(contents),
+                 'created_at': created_at, 'updated_at': created_at}
+                for i, created_at in enumerate(post_times)
+            ])
+        if progress:
+            progress(0, comments)
+        
+        weights = list(itertools.accumulate(rng.paretovariate(1.2) for _ in range(posts)))
+        for offset in range(0, comments, batch_size):
+            size = min(batch_size, comments - offset)
+            indexes = [bisect_left(weights, rng.random() * weights[-1]) for _ in range(size)]
+            with conn.begin():
+                conn.execute(insert(Comment), [
+                    {'post_id': first_id + index, 'content': rng.choice(comment_texts), 'author': rng.choice(authors),
+                     'created_at': post_times[index] + (now - post_times[index]) * rng.random()}
+                    for index in indexes
+                ])
+            if progress:
+                progress(offset + size, comments)
+        if comments:
+            with conn.begin():
+                rebuild_hot_scores(conn, Post.__table__.c.id >= first_id)
+                rebuild_author_stats(conn)
+                rebuild_comment_pages(conn, Post.__table__.c.id >= first_id)
+    return posts, comments
+
+@app.cli.command('seed')
+@click.option('--posts', default=1000, show_default=True, help='Число постов')
+@click.option('--comments', default=50000, show_default=True, help='Число комментариев')
+@click.option('--seed', 'seed_value', type=int, default=None, help='Зерно генератора для воспроизводимых данных')
+@click.option('--batch-size', default=50000, show_default=True, help='Комментариев в одной транзакции')
+def seed_command(posts, comments, seed_value, batch_size):
+    """Заполнить базу синтетическими постами и комментариями"""
+    db.create_all()
+    started = time.perf_counter()
+    
+    def progress(done, total):
+        if total:
+            click.echo(f'Комментарии: {done}/{total}')
+    
+    seed_database(db.engine, posts, comments, random.Random(seed_value), batch_size, progress)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Заполнение базы: {posts} постов, {comments} комментариев за {elapsed:.1f} с")
+    click.echo(f'Добавлено {posts} постов и {comments} комментариев за {elapsed:.1f} с')
+
+@app.cli.command('hot-scores')
+def hot_scores_command():
+    """Пересчитать рейтинг горячих постов по всем живым комментариям"""
+    started = time.perf_counter()
+    with db.engine.begin() as conn:
+        posts = rebuild_hot_scores(conn)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Пересчет рейтинга горячих постов: {posts} постов за {elapsed:.1f} с")
+    click.echo(f'Пересчитан рейтинг {posts} постов за {elapsed:.1f} с')
+
+@app.cli.command('author-stats')
+def author_stats_command():
+    """Пересчитать сводку по авторам комментариев"""
+    started = time.perf_counter()
+    with db.engine.begin() as conn:
+        authors = rebuild_author_stats(conn)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Пересчет сводки по авторам: {authors} авторов за {elapsed:.1f} с")
+    click.echo(f'Пересчитана сводка {authors} авторов за {elapsed:.1f} с')
+
+@app.cli.command('comment-pages')
+def comment_pages_command():
+    """Построить готовые первые страницы комментариев всех постов заново"""
+    started = time.perf_counter()
+    with db.engine.begin() as conn:
+        pages = rebuild_comment_pages(conn)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Построение страниц комментариев: {pages} страниц за {elapsed:.1f} с")
+    click.echo(f'Построено {pages} страниц комментариев за {elapsed:.1f} с')
+
 # Создание таблиц выполняется при запуске приложения в блоке __main__
 
 if __name__ == '__main__':
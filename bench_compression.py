@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сжатия ответов: степень сжатия и затраты CPU по уровням gzip и brotli
+на реальных телах GET /posts и GET /posts/<id>/comments.
+
+Для каждого уровня выводятся размер после сжатия, коэффициент, время сжатия
+одного ответа и скорость в МБ/с. Время передачи по сети в замер не входит:
+выбирайте уровень, при котором выигрыш в байтах оправдывает CPU воркера.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_compression_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from app import app, db, logger, seed_database, brotli, Comment, _BrotliStream, _GzipStream
+
+GZIP_LEVELS = (1, 3, 6, 9)
+BROTLI_LEVELS = (1, 4, 6, 9, 11)
+
+
+def time_compression(make, body, iterations, seconds=1.0):
+    """Размер сжатого тела и среднее время сжатия, мкс; медленные уровни
+    повторяются меньше `iterations` раз - замер прекращается через `seconds`"""
+    started = time.perf_counter()
+    done = 0
+    while done < iterations and (done == 0 or time.perf_counter() - started < seconds):
+        compressed = make().compress_all(body)
+        done += 1
+    return len(compressed), (time.perf_counter() - started) / done * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=500, help='постов в базе')
+    parser.add_argument('--comments', type=int, default=25000, help='комментариев в базе')
+    parser.add_argument('--iterations', type=int, default=20, help='повторов сжатия на уровень')
+    parser.add_argument('--json', help='сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        seed_database(db.engine, args.posts, args.comments, random.Random(42))
+        hot_post = db.session.query(Comment.post_id).group_by(Comment.post_id) \
+            .order_by(db.func.count(Comment.id).desc()).first()[0]
+
+    app.config['COMPRESSION_ENABLED'] = False
+    with app.test_client() as client:
+        bodies = {'GET /posts': client.get('/posts').data,
+                  'GET /posts/<id>/comments': client.get(f'/posts/{hot_post}/comments').data}
+    app.config['COMPRESSION_ENABLED'] = True
+
+    codecs = [('gzip', level, lambda level=level: _GzipStream(level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [('br', level, lambda level=level: _BrotliStream(level)) for level in BROTLI_LEVELS]
+    else:
+        print('Пакет brotli не установлен, замеряется только gzip')
+
+    results = []
+    for name, body in bodies.items():
+        print(f"\n{name}: {len(body)} байт")
+        print(f"{'кодек':>6} {'уровень':>8} {'байт':>10} {'коэфф.':>7} {'мкс':>9} {'МБ/с':>8}")
+        for encoding, level, make in codecs:
+            size, micros = time_compression(make, body, args.iterations)
+            result = {'route': name, 'encoding': encoding, 'level': level, 'original_bytes': len(body),
+                      'compressed_bytes': size, 'ratio': round(len(body) / size, 2),
+                      'compress_us': round(micros, 1), 'mb_per_s': round(len(body) / micros, 1)}
+            results.append(result)
+            print(f"{encoding:>6} {level:>8} {size:>10} {result['ratio']:>7} {result['compress_us']:>9} "
+                  f"{result['mb_per_s']:>8}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
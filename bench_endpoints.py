@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк всех маршрутов app.py на заполненных базах разного размера.
+
+Для каждого масштаба (число комментариев) создается отдельная база и отдельный
+процесс: движок SQLAlchemy создается при импорте app, поэтому база задается
+переменной DATABASE_URL до импорта. Данные генерирует seed_database (та же
+функция, что у flask seed). Маршруты вызываются через app.test_client(), для
+каждого считаются пропускная способность, p50 и p99. Результаты пишутся в
+JSON; при указании --baseline они сравниваются с сохраненными, и рост p50 или p99
+сверх порога завершает бенчмарк с кодом 1.
+
+    python bench_endpoints.py --scales 1k,100k --json results.json
+    python bench_endpoints.py --scales 1k,100k --baseline bench_baseline.json
+    python bench_endpoints.py --scales 1k,100k,1m --json bench_baseline.json   # новый базовый уровень
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+# В среднем комментариев на пост; распределение по постам неравномерное
+COMMENTS_PER_POST = 50
+ADMIN_TOKEN = 'bench-admin'
+PROFILING_SECRET = 'bench-profile'
+
+
+def percentile(values, p):
+    """Процентиль по списку значений"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def route_specs(post_id, comment_id):
+    """Запросы по маршрутам: endpoint -> (метод, URL, тело, подготовка).
+
+    Подготовка получает клиент, выполняется до замера и может вернуть URL - для
+    маршрутов, которым на каждую итерацию нужен свежий объект.
+    """
+    from app import app, db, Post, Comment
+
+    def fresh_post(client):
+        post = Post(title='Пост для удаления', content='Содержимое поста для удаления.')
+        db.session.add(post)
+        db.session.flush()
+        db.session.add_all(Comment(post_id=post.id, content=f'Комментарий номер {i}', author='Бенчмарк')
+                           for i in range(COMMENTS_PER_POST))
+        db.session.commit()
+        return f'/posts/{post.id}'
+
+    def fresh_comment(client):
+        comment = Comment(post_id=post_id, content='Комментарий для удаления', author='Бенчмарк')
+        db.session.add(comment)
+        db.session.commit()
+        return f'/comments/{comment.id}'
+
+    def spam_comments(client):
+        db.session.execute(Comment.__table__.insert(), [
+            {'post_id': post_id, 'content': f'Спам номер {i}', 'author': 'Спамер'} for i in range(COMMENTS_PER_POST)
+        ])
+        db.session.commit()
+        return None
+
+    def author_comments(client):
+        return f'/authors/{db.session.get(Comment, comment_id).author}/comments'
+
+    def saved_profile(client):
+        response = client.get('/', headers={'X-Profile': PROFILING_SECRET})
+        return f"/profiles/{response.headers['X-Profile-Id']}"
+
+    def memory_snapshot(client):
+        client.post('/admin/memory/start', headers={'X-Admin-Token': ADMIN_TOKEN})
+        response = client.post('/admin/memory/snapshots', headers={'X-Admin-Token': ADMIN_TOKEN})
+        return f"/admin/memory/snapshots/{response.get_json()['data']['id']}"
+
+    return {
+        'index': ('GET', '/', None, None),
+        'prometheus_metrics': ('GET', '/metrics', None, None),
+        'get_profile': ('GET', None, None, saved_profile),
+        'get_posts': ('GET', '/posts', None, None),
+        'get_hot_posts': ('GET', '/posts/hot', None, None),
+        'get_post': ('GET', f'/posts/{post_id}', None, None),
+        'create_post': ('POST', '/posts', {'title': 'Новый пост', 'content': 'Содержимое нового поста.'}, None),
+        'update_post': ('PUT', f'/posts/{post_id}', {'title': 'Обновленный заголовок'}, None),
+        'delete_post': ('DELETE', None, None, fresh_post),
+        'get_comments': ('GET', f'/posts/{post_id}/comments', None, None),
+        # Поток завершается сразу после пропущенных событий (SSE_MAX_STREAM_SECONDS=0)
+        'stream_comments': ('GET', f'/posts/{post_id}/comments/stream?last_event_id=0', None, None),
+        'create_comment': ('POST', f'/posts/{post_id}/comments',
+                           {'content': 'Новый комментарий', 'author': 'Бенчмарк'}, None),
+        'get_comment': ('GET', f'/comments/{comment_id}', None, None),
+        'get_comments_by_ids': ('GET', '/comments?ids=' + ','.join(str(comment_id + i) for i in range(20)),
+                                None, None),
+        'update_comment': ('PUT', f'/comments/{comment_id}', {'content': 'Обновленный комментарий'}, None),
+        'delete_comment': ('DELETE', None, None, fresh_comment),
+        'get_author_comments': ('GET', None, None, author_comments),
+        'bulk_delete_comments': ('DELETE', '/comments?author=Спамер', None, spam_comments),
+        'get_changes': ('GET', '/changes?since=0&limit=100', None, None),
+        'export_data': ('GET', '/export', None, None),
+        'batch': ('POST', '/batch', {'operations': [
+            {'method': 'GET', 'path': f'/posts/{post_id}'},
+            {'method': 'GET', 'path': f'/posts/{post_id}/comments'},
+            {'method': 'POST', 'path': f'/posts/{post_id}/comments',
+             'body': {'content': 'Комментарий из пакета', 'author': 'Бенчмарк'}},
+        ]}, None),
+        'memory_status': ('GET', '/admin/memory', None, None),
+        'start_memory_tracing': ('POST', '/admin/memory/start', None, None),
+        'stop_memory_tracing': ('POST', '/admin/memory/stop', None, None),
+        'take_memory_snapshot': ('POST', '/admin/memory/snapshots', None,
+                                 lambda client: memory_snapshot(client) and None),
+        'get_memory_snapshot': ('GET', None, None, memory_snapshot),
+        'diff_memory_snapshots': ('GET', '/admin/memory/diff', None,
+                                  lambda client: memory_snapshot(client) and memory_snapshot(client) and None),
+    }
+
+
+def run_scale(comments, iterations, seconds, seed_value):
+    """Заполнение базы и замер всех маршрутов; вызывается в отдельном процессе"""
+    from app import app, db, logger, memory_profiler, seed_database, Comment
+
+    logger.setLevel(logging.WARNING)
+    app.config.update(ADMIN_TOKEN=ADMIN_TOKEN, PROFILING_ENABLED=True, PROFILING_SECRET=PROFILING_SECRET,
+                      PROFILING_DIR=tempfile.mkdtemp(prefix='bench_profiles_'), SSE_MAX_STREAM_SECONDS=0)
+    rng = random.Random(seed_value)
+    with app.app_context():
+        db.create_all()
+        seed_started = time.perf_counter()
+        posts = max(10, comments // COMMENTS_PER_POST)
+        seed_database(db.engine, posts, comments, rng)
+        seed_seconds = time.perf_counter() - seed_started
+        # Пост с медианным числом комментариев
+        counts = sorted(db.session.query(db.func.count(Comment.id), Comment.post_id).group_by(Comment.post_id).all())
+        comments_on_post, post_id = counts[len(counts) // 2]
+        comment_id = db.session.query(Comment.id).filter_by(post_id=post_id).first()[0]
+
+    specs = route_specs(post_id, comment_id)
+    missing = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'} - set(specs)
+    if missing:
+        raise SystemExit(f"Маршруты без сценария бенчмарка: {', '.join(sorted(missing))}")
+
+    # Секрет профилирования нужен только для чтения профиля, остальные запросы не профилируются
+    headers = {'X-Admin-Token': ADMIN_TOKEN}
+    profile_headers = dict(headers, **{'X-Profile': PROFILING_SECRET})
+    results = {}
+    with app.test_client() as client, app.app_context():
+        for endpoint, (method, url, body, prepare) in specs.items():
+            latencies = []
+            deadline = time.perf_counter() + seconds
+            # Профилирование и трассировка памяти не должны искажать замеры других маршрутов
+            memory_profiler.stop()
+            memory_profiler.reset()
+            while len(latencies) < iterations and (len(latencies) < 10 or time.perf_counter() < deadline):
+                target = (prepare(client) if prepare else None) or url
+                started = time.perf_counter()
+                response = client.open(target, method=method, json=body,
+                                       headers=profile_headers if endpoint == 'get_profile' else headers)
+                # Потоковые ответы генерируются при чтении тела
+                response.get_data()
+                response.close()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    raise SystemExit(f"{endpoint}: {method} {target} вернул {response.status_code}")
+            memory_profiler.stop()
+            results[endpoint] = {
+                'method': method,
+                'requests': len(latencies),
+                'throughput_rps': round(len(latencies) / sum(latencies), 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            }
+    return {'comments': comments, 'posts': posts, 'comments_on_post': comments_on_post,
+            'seed_seconds': round(seed_seconds, 2), 'routes': results}
+
+
+def compare(results, baseline, threshold, p99_threshold, min_delta_ms):
+    """Регрессии относительно базового уровня: список строк с описанием"""
+    regressions = []
+    for scale, current in results.items():
+        previous = baseline.get(scale)
+        if previous is None:
+            continue
+        for endpoint, stats in current['routes'].items():
+            before = previous['routes'].get(endpoint)
+            if before is None:
+                continue
+            for key, limit in (('p50_ms', threshold), ('p99_ms', p99_threshold)):
+                # Доли миллисекунды на быстрых маршрутах - шум, а не регрессия
+                if stats[key] > before[key] * (1 + limit) and stats[key] - before[key] > min_delta_ms:
+                    regressions.append(f"{scale} {endpoint} {key}: {before[key]} -> {stats[key]} "
+                                       f"(+{(stats[key] / before[key] - 1) * 100:.0f}%, порог {limit * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1k,100k', help=f"масштабы через запятую: {', '.join(SCALES)}")
+    parser.add_argument('--iterations', type=int, default=200, help='максимум запросов на маршрут')
+    parser.add_argument('--seconds', type=float, default=3.0,
+                        help='максимум времени на маршрут (не меньше 10 запросов)')
+    parser.add_argument('--seed', type=int, default=42, help='зерно генератора данных')
+    parser.add_argument('--json', help='сохранить результаты в JSON файл')
+    parser.add_argument('--baseline', help='JSON с базовым уровнем для сравнения')
+    parser.add_argument('--threshold', type=float, default=0.25, help='допустимый рост p50 (доля)')
+    parser.add_argument('--p99-threshold', type=float, default=0.5, help='допустимый рост p99 (доля)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help='рост меньше этого значения (мс) регрессией не считается')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        json.dump(run_scale(args.worker, args.iterations, args.seconds, args.seed), sys.stdout)
+        return 0
+
+    results = {}
+    for scale in args.scales.split(','):
+        scale = scale.strip().lower()
+        if scale not in SCALES:
+            parser.error(f"неизвестный масштаб: {scale}")
+        tmpdir = tempfile.mkdtemp(prefix=f'bench_endpoints_{scale}_')
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', str(SCALES[scale]),
+             '--iterations', str(args.iterations), '--seconds', str(args.seconds), '--seed', str(args.seed)],
+            env=env, cwd=tmpdir, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results[scale] = json.loads(output)
+
+        current = results[scale]
+        print(f"\n{scale}: {current['comments']} комментариев, {current['posts']} постов "
+              f"(заполнение {current['seed_seconds']} с, у замеряемого поста {current['comments_on_post']})")
+        print(f"{'маршрут':<24} {'метод':>6} {'запросов':>9} {'RPS':>9} {'p50, мс':>9} {'p99, мс':>9}")
+        for endpoint, stats in current['routes'].items():
+            print(f"{endpoint:<24} {stats['method']:>6} {stats['requests']:>9} {stats['throughput_rps']:>9} "
+                  f"{stats['p50_ms']:>9} {stats['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.p99_threshold,
+                                  args.min_delta_ms)
+        if regressions:
+            print('\nРегрессии относительно базового уровня:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('\nРегрессий относительно базового уровня нет')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк групповой фиксации комментариев: пропускная способность и задержки
+при разных окнах группировки
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# База данных бенчмарка не должна пересекаться с рабочей blog.db
+_tmpdir = tempfile.mkdtemp(prefix='bench_group_commit_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from app import app, db, logger, Post, comment_committer
+
+
+def percentile(values, p):
+    """Процентиль по списку значений"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def run(window_ms, clients, per_client, post_id):
+    """Прогон: `clients` потоков отправляют по `per_client` комментариев"""
+    if window_ms is None:
+        app.config['COMMENT_GROUP_COMMIT'] = False
+    else:
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        app.config['COMMENT_GROUP_COMMIT_WINDOW_MS'] = window_ms
+    comment_committer.stop()
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    body = json.dumps({"content": "Комментарий для бенчмарка", "author": "Бенчмарк"})
+
+    def worker():
+        local = []
+        with app.test_client() as client:
+            for _ in range(per_client):
+                started = time.perf_counter()
+                response = client.post(f'/posts/{post_id}/comments', data=body,
+                                       content_type='application/json')
+                local.append(time.perf_counter() - started)
+                if response.status_code != 201:
+                    with lock:
+                        errors.append(response.status_code)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    comment_committer.stop()
+
+    return {
+        'window_ms': window_ms,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16, help='число параллельных клиентов')
+    parser.add_argument('--per-client', type=int, default=50, help='комментариев на клиента')
+    parser.add_argument('--windows', default='off,1,2,5,10',
+                        help='окна группировки в мс через запятую; off - без группировки')
+    parser.add_argument('--json', help='сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        post = Post(title='Пост для бенчмарка', content='Содержимое поста для бенчмарка комментариев.')
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+
+    results = []
+    print(f"{'окно, мс':>10} {'запросов':>9} {'ошибок':>7} {'RPS':>9} {'p50, мс':>9} {'p99, мс':>9}")
+    for raw in args.windows.split(','):
+        window = None if raw.strip() == 'off' else float(raw)
+        result = run(window, args.clients, args.per_client, post_id)
+        results.append(result)
+        label = 'off' if window is None else f'{window:g}'
+        print(f"{label:>10} {result['requests']:>9} {result['errors']:>7} {result['throughput_rps']:>9} "
+              f"{result['p50_ms']:>9} {result['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
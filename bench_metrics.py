@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Замер накладных расходов сбора метрик на один запрос к маршрутам с обращением к БД.
+
+Базовая линия - METRICS_ENABLED=0 и отключенные хуки событий движка SQLAlchemy;
+сравнение - полный сбор метрик (хуки before/after_request, учет каждого
+SQL-выражения в after_cursor_execute, гистограммы). Прогоны чередуются
+раундами, итог - медиана по раундам, чтобы шум тестового клиента усреднялся.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_metrics_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import (app, db, logger, metrics, Post, Comment,
+                 _before_cursor_execute, _after_cursor_execute,
+                 start_request_metrics, record_request_metrics, finish_request_metrics)
+
+CURSOR_HOOKS = (('before_cursor_execute', _before_cursor_execute),
+                ('after_cursor_execute', _after_cursor_execute))
+
+
+def set_instrumentation(enabled):
+    """Включить или выключить сбор метрик вместе с хуками SQL-выражений"""
+    app.config['METRICS_ENABLED'] = enabled
+    for name, hook in CURSOR_HOOKS:
+        if enabled and not event.contains(Engine, name, hook):
+            event.listen(Engine, name, hook)
+        elif not enabled and event.contains(Engine, name, hook):
+            event.remove(Engine, name, hook)
+
+
+def time_route(client, url, iterations):
+    """Среднее время запроса, мкс"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        client.get(url)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+class _FakeExecutionContext:
+    _query_started = 0.0
+
+
+def time_hooks(url, statements, iterations):
+    """Время только кода метрик на запрос с `statements` SQL-выражениями, мкс.
+
+    Вызываются те же хуки, что и при реальном запросе, но без маршрутизации,
+    представления и SQLite, поэтому замер не тонет в шуме тестового клиента.
+    """
+    app.config['METRICS_ENABLED'] = True
+    context = _FakeExecutionContext()
+    response = app.response_class('{}', status=200)
+    with app.test_request_context(url):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            start_request_metrics()
+            for _ in range(statements):
+                _before_cursor_execute(None, None, 'SELECT 1', (), context, False)
+                _after_cursor_execute(None, None, 'SELECT 1', (), context, False)
+            record_request_metrics(response)
+            finish_request_metrics(None)
+        return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000, help='запросов в раунде')
+    parser.add_argument('--rounds', type=int, default=10, help='число чередующихся раундов')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        post = Post(title='Пост для бенчмарка', content='Содержимое поста для бенчмарка метрик.')
+        db.session.add(post)
+        db.session.commit()
+        for i in range(20):
+            db.session.add(Comment(post_id=post.id, content=f'Комментарий номер {i}', author='Бенчмарк'))
+        db.session.commit()
+        post_id = post.id
+
+    routes = [(f'/posts/{post_id}', 1), (f'/posts/{post_id}/comments', 2)]
+    for url, statements in routes:
+        print(f"GET {url}: код метрик ({statements} SQL) - "
+              f"{time_hooks(url, statements, args.iterations * 10):.2f} мкс на запрос")
+
+    with app.test_client() as client:
+        for url, _ in routes:
+            off, on = [], []
+            for enabled in (False, True):
+                set_instrumentation(enabled)
+                time_route(client, url, 200)
+            for _ in range(args.rounds):
+                for enabled, results in ((False, off), (True, on)):
+                    set_instrumentation(enabled)
+                    results.append(time_route(client, url, args.iterations))
+            off_median, on_median = statistics.median(off), statistics.median(on)
+            print(f"GET {url}: без метрик {off_median:.1f} мкс, с метриками {on_median:.1f} мкс, "
+                  f"накладные расходы {on_median - off_median:.1f} мкс на запрос")
+    set_instrumentation(True)
+    metrics.reset()
+
+
+if __name__ == '__main__':
+    main()
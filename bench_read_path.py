@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пути чтения списков: ORM-объекты с to_dict() против кортежей столбцов
+через SQLAlchemy Core (как в get_posts и get_comments).
+
+Для каждого варианта замеряются медианное время построения ответа (выборка,
+словари и JSON) и пик памяти по tracemalloc; ответы вариантов сверяются побайтно.
+По умолчанию - 10 000 постов и пост с 10 000 комментариев.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_read_path_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from flask import jsonify
+from sqlalchemy import insert, select
+
+from app import (app, db, logger, seed_database, Post, Comment, POST_COLUMNS, COMMENT_COLUMNS,
+                 post_rows_to_dicts, comment_rows_to_dicts)
+
+
+def orm_posts():
+    posts = Post.query.filter(Post.deleted_at.is_(None)).all()
+    return jsonify({'success': True, 'data': [post.to_dict() for post in posts], 'count': len(posts)})
+
+
+def core_posts():
+    posts = post_rows_to_dicts(db.session.execute(select(*POST_COLUMNS).where(Post.__table__.c.deleted_at.is_(None))))
+    return jsonify({'success': True, 'data': posts, 'count': len(posts)})
+
+
+def orm_comments(post_id):
+    comments = Comment.query.filter(Comment.post_id == post_id, Comment.deleted_at.is_(None)) \
+        .order_by(Comment.created_at.desc()).all()
+    return jsonify({'success': True, 'data': [comment.to_dict() for comment in comments],
+                    'count': len(comments), 'post_id': post_id})
+
+
+def core_comments(post_id):
+    comments_table = Comment.__table__
+    comments = comment_rows_to_dicts(db.session.execute(
+        select(*COMMENT_COLUMNS).where(comments_table.c.post_id == post_id, comments_table.c.deleted_at.is_(None))
+        .order_by(comments_table.c.created_at.desc())))
+    return jsonify({'success': True, 'data': comments, 'count': len(comments), 'post_id': post_id})
+
+
+def measure(build, rounds):
+    """Тело ответа, медианное время (мс) и пик памяти (КБ) на один ответ"""
+    times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = build().get_data()
+        times.append((time.perf_counter() - started) * 1000)
+        db.session.remove()
+    tracemalloc.start()
+    build().get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+    return body, statistics.median(times), peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000, help='постов и комментариев у замеряемого поста')
+    parser.add_argument('--rounds', type=int, default=15, help='повторов на вариант')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        seed_database(db.engine, args.rows, 0, random.Random(42))
+        post_id = db.session.execute(select(Post.id).limit(1)).scalar()
+        db.session.execute(insert(Comment), [
+            {'post_id': post_id, 'content': f'Комментарий номер {i} для бенчмарка пути чтения', 'author': 'Бенчмарк'}
+            for i in range(args.rows)
+        ])
+        db.session.commit()
+
+        print(f"{'маршрут':<26} {'вариант':>8} {'мс':>8} {'пик, КБ':>9}")
+        for name, orm, core in (('GET /posts', orm_posts, core_posts),
+                                ('GET /posts/<id>/comments', lambda: orm_comments(post_id),
+                                 lambda: core_comments(post_id))):
+            results = {}
+            for variant, build in (('orm', orm), ('core', core)):
+                results[variant] = measure(build, args.rounds)
+                _, millis, peak = results[variant]
+                print(f"{name:<26} {variant:>8} {millis:>8.1f} {peak:>9.0f}")
+            if results['orm'][0] != results['core'][0]:
+                raise SystemExit(f"{name}: ответы ORM и Core различаются")
+            print(f"{name:<26} {'выигрыш':>8} {results['orm'][1] / results['core'][1]:>7.2f}x "
+                  f"{results['orm'][2] / results['core'][2]:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк горячих выборок: выражение, которое строится заново в каждом вызове,
+против готового выражения с именованными параметрами (как в get_live_post,
+get_live_comment и live_comment_rows).
+
+Варианты:
+  без кэша   - выражение строится и компилируется в каждом вызове (compiled_cache=None);
+  построение - выражение строится в каждом вызове, компиляция берется из кэша
+               движка по ключу, который вычисляется обходом выражения (прежний код);
+  lambda     - lambda_stmt: выражение строится один раз на код лямбды, но в каждом
+               вызове создаются лямбда-элемент и параметры из замыкания;
+  готовое    - выражение и его ключ кэша вычислены один раз при импорте (текущий код).
+
+Время - медиана по раундам на один вызов, мкс, вместе с выполнением запроса в SQLite:
+разница вариантов - это экономия на запрос в установившемся режиме.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix='bench_statement_cache_')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import lambda_stmt, select
+
+from app import (app, db, logger, seed_database, Post, Comment, COMMENT_COLUMNS,
+                 get_live_post, get_live_comment, live_comment_rows)
+
+
+def built_post(post_id, execution_options=None):
+    return db.session.execute(
+        select(Post).where(Post.id == post_id, Post.deleted_at.is_(None)), execution_options=execution_options
+    ).scalar_one_or_none()
+
+
+def built_comment(comment_id, execution_options=None):
+    return db.session.execute(
+        select(Comment).join(Post, Comment.post_id == Post.id)
+        .where(Comment.id == comment_id, Comment.deleted_at.is_(None), Post.deleted_at.is_(None)),
+        execution_options=execution_options
+    ).scalar_one_or_none()
+
+
+def built_comment_rows(post_id, execution_options=None):
+    comments_table = Comment.__table__
+    return db.session.execute(
+        select(*COMMENT_COLUMNS)
+        .where(comments_table.c.post_id == post_id, comments_table.c.deleted_at.is_(None))
+        .order_by(comments_table.c.created_at.desc()),
+        execution_options=execution_options
+    )
+
+
+def lambda_post(post_id):
+    return db.session.execute(lambda_stmt(
+        lambda: select(Post).where(Post.id == post_id, Post.deleted_at.is_(None))
+    )).scalar_one_or_none()
+
+
+def lambda_comment(comment_id):
+    return db.session.execute(lambda_stmt(
+        lambda: select(Comment).join(Post, Comment.post_id == Post.id)
+        .where(Comment.id == comment_id, Comment.deleted_at.is_(None), Post.deleted_at.is_(None))
+    )).scalar_one_or_none()
+
+
+def lambda_comment_rows(post_id):
+    return db.session.execute(lambda_stmt(
+        lambda: select(*COMMENT_COLUMNS)
+        .where(Comment.__table__.c.post_id == post_id, Comment.__table__.c.deleted_at.is_(None))
+        .order_by(Comment.__table__.c.created_at.desc())
+    ))
+
+
+def time_lookup(lookup, ids, iterations):
+    """Среднее время одного вызова, мкс; сессия очищается, чтобы объекты не брались из identity map"""
+    started = time.perf_counter()
+    for i in range(iterations):
+        result = lookup(ids[i % len(ids)])
+        if hasattr(result, 'all'):
+            result.all()
+        db.session.expunge_all()
+    elapsed = time.perf_counter() - started
+    db.session.remove()
+    return elapsed / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000, help='вызовов в раунде')
+    parser.add_argument('--rounds', type=int, default=7, help='число чередующихся раундов')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+        seed_database(db.engine, 200, 2000, random.Random(42))
+        post_ids = [row[0] for row in db.session.execute(select(Post.id))]
+        comment_ids = [row[0] for row in db.session.execute(select(Comment.id))]
+        db.session.remove()
+
+        lookups = (
+            ('get_live_post', post_ids, built_post, lambda_post, get_live_post),
+            ('get_live_comment', comment_ids, built_comment, lambda_comment, get_live_comment),
+            ('live_comment_rows', post_ids, built_comment_rows, lambda_comment_rows, live_comment_rows),
+        )
+        print(f"{'выборка':<18} {'без кэша':>10} {'построение':>11} {'lambda':>9} {'готовое':>9} {'экономия':>9}")
+        for name, ids, built, with_lambda, prebuilt in lookups:
+            variants = (('uncached', lambda value, built=built: built(value, {'compiled_cache': None})),
+                        ('built', built), ('lambda', with_lambda), ('prebuilt', prebuilt))
+            results = {variant: [] for variant, _ in variants}
+            for variant, lookup in variants:
+                time_lookup(lookup, ids, 200)
+            for _ in range(args.rounds):
+                for variant, lookup in variants:
+                    results[variant].append(time_lookup(lookup, ids, args.iterations))
+            medians = {variant: statistics.median(times) for variant, times in results.items()}
+            print(f"{name:<18} {medians['uncached']:>10.1f} {medians['built']:>11.1f} {medians['lambda']:>9.1f} "
+                  f"{medians['prebuilt']:>9.1f} {medians['built'] - medians['prebuilt']:>9.1f}")
+        print('\nВремя одного вызова, мкс; экономия - построение минус готовое выражение')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест настоящего серверного процесса на localhost.
+
+Харнесс заполняет временную базу, запускает сервер (встроенный сервер Flask
+с потоками или gunicorn) и нагружает его из множества параллельных клиентов
+заданной смесью операций. Каждый клиент использует свой генератор случайных
+чисел с зерном из --seed, поэтому последовательность запросов воспроизводима.
+В отчете - пропускная способность, процентили задержек по операциям и ошибки,
+в том числе блокировки SQLite ("database is locked") из журнала сервера.
+
+    python load_test.py --clients 32 --requests 200 --mix get_post=90,create_comment=10
+    python load_test.py --server gunicorn --workers 4 --duration 30 --json load.json
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Операция -> (метод, шаблон URL, тело)
+OPERATIONS = {
+    'get_post': ('GET', '/posts/{post_id}', None),
+    'get_posts': ('GET', '/posts', None),
+    'get_comments': ('GET', '/posts/{post_id}/comments', None),
+    'create_comment': ('POST', '/posts/{post_id}/comments',
+                       {'content': 'Комментарий из нагрузочного теста', 'author': 'Нагрузка'}),
+    'create_post': ('POST', '/posts', {'title': 'Пост из нагрузочного теста',
+                                       'content': 'Содержимое поста из нагрузочного теста.'}),
+    'update_post': ('PUT', '/posts/{post_id}', {'title': 'Обновлено нагрузочным тестом'}),
+}
+
+
+def percentile(values, p):
+    """Процентиль по списку значений"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def parse_mix(text):
+    """'get_post=90,create_comment=10' -> [(операция, вес)]"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"неизвестная операция: {name}; доступны: {', '.join(OPERATIONS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(args, env, workdir):
+    """Заполнение базы командой flask seed до запуска сервера"""
+    subprocess.run([sys.executable, '-m', 'flask', '--app', os.path.join(basedir, 'app.py'), 'seed',
+                    '--posts', str(args.posts), '--comments', str(args.comments), '--seed', str(args.seed)],
+                   env=env, cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+
+
+def start_server(args, port, env, workdir):
+    """Запуск сервера; stderr пишется в файл, чтобы искать в нем ошибки SQLite"""
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(args.workers), '--threads', str(args.threads), '--chdir', basedir, 'app:app']
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', os.path.join(basedir, 'app.py'), 'run',
+                   '--host', '127.0.0.1', '--port', str(port), '--with-threads', '--no-reload', '--no-debugger']
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(command, env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Сервер завершился с кодом {process.returncode}, см. {log.name}")
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process, log
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit('Сервер не ответил за 30 секунд')
+
+
+def run_client(index, args, mix, posts, base_url, deadline, results, lock):
+    """Клиент в замкнутом цикле: следующий запрос - после ответа на предыдущий"""
+    rng = random.Random(args.seed * 1000 + index)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    # Чтения и записи концентрируются на популярных постах
+    post_weights = [1 / (rank + 1) for rank in range(posts)]
+    local = []
+    session = requests.Session()
+    for _ in range(args.requests):
+        if deadline and time.monotonic() > deadline:
+            break
+        name = rng.choices(names, weights)[0]
+        method, template, body = OPERATIONS[name]
+        url = base_url + template.format(post_id=rng.choices(range(1, posts + 1), post_weights)[0])
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, json=body, timeout=args.timeout)
+            outcome = response.status_code
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        local.append((name, time.perf_counter() - started, outcome))
+    with lock:
+        results.extend(local)
+
+
+def report(results, elapsed, locked_errors):
+    """Сводка по операциям; возвращает словарь для JSON"""
+    summary = {'elapsed_seconds': round(elapsed, 2), 'requests': len(results),
+               'throughput_rps': round(len(results) / elapsed, 1), 'database_locked': locked_errors,
+               'operations': {}}
+    print(f"{'операция':<16} {'запросов':>9} {'ошибок':>7} {'p50, мс':>9} {'p90, мс':>9} "
+          f"{'p99, мс':>9} {'макс, мс':>9}")
+    for name in sorted({name for name, _, _ in results}):
+        latencies = [latency for op, latency, _ in results if op == name]
+        outcomes = Counter(str(outcome) for op, _, outcome in results if op == name)
+        errors = sum(count for outcome, count in outcomes.items() if not outcome.startswith(('2', '3')))
+        stats = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'outcomes': dict(outcomes),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p90_ms': round(percentile(latencies, 90) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+        }
+        summary['operations'][name] = stats
+        print(f"{name:<16} {stats['requests']:>9} {errors:>7} {stats['p50_ms']:>9} {stats['p90_ms']:>9} "
+              f"{stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    total_errors = sum(stats['errors'] for stats in summary['operations'].values())
+    summary['error_rate'] = round(total_errors / len(results), 4) if results else 0
+    print(f"\nВсего {len(results)} запросов за {elapsed:.1f} с: {summary['throughput_rps']} RPS, "
+          f"ошибок {total_errors} ({summary['error_rate'] * 100:.2f}%), "
+          f"'database is locked' в журнале сервера: {locked_errors}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32, help='число параллельных клиентов')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на клиента')
+    parser.add_argument('--duration', type=float, help='ограничение по времени, с (прерывает прогон раньше)')
+    parser.add_argument('--mix', default='get_post=90,create_comment=10',
+                        help=f"смесь операций с весами; доступны: {', '.join(OPERATIONS)}")
+    parser.add_argument('--posts', type=int, default=200, help='постов в заполненной базе')
+    parser.add_argument('--comments', type=int, default=10000, help='комментариев в заполненной базе')
+    parser.add_argument('--seed', type=int, default=42, help='зерно данных и последовательности запросов')
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask', help='WSGI сервер')
+    parser.add_argument('--workers', type=int, default=4, help='процессов gunicorn')
+    parser.add_argument('--threads', type=int, default=4, help='потоков на процесс gunicorn')
+    parser.add_argument('--timeout', type=float, default=30, help='тайм-аут запроса, с')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='переменные окружения сервера, например COMMENT_GROUP_COMMIT=1')
+    parser.add_argument('--json', help='сохранить сводку в JSON файл')
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    database_url = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONPATH=basedir)
+    env.update(item.split('=', 1) for item in args.env)
+    seed(args, env, workdir)
+    posts = args.posts
+    port = free_port()
+    server, log = start_server(args, port, env, workdir)
+    print(f"Сервер {args.server} на порту {port}, база {workdir}/load.db: {posts} постов, "
+          f"{args.comments} комментариев")
+
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    clients = [threading.Thread(target=run_client,
+                                args=(i, args, mix, posts, f'http://127.0.0.1:{port}', deadline, results, lock))
+               for i in range(args.clients)]
+    try:
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        log.close()
+
+    with open(log.name, errors='replace') as f:
+        locked_errors = sum('database is locked' in line for line in f)
+    summary = report(results, elapsed, locked_errors)
+    summary.update(server=args.server, clients=args.clients, mix=args.mix, seed=args.seed,
+                   server_log=log.name)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""ON DELETE CASCADE для comments.post_id и индекс по post_id
+
+Каскад выполняет сама база одним выражением вместо загрузки комментариев
+в ORM; без индекса каждое удаление поста просматривало бы всю таблицу.
+В SQLite ограничение меняется пересозданием таблицы (batch). Исходный
+внешний ключ безымянный, поэтому при отражении ему дается имя по шаблону.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def upgrade():
+    with op.batch_alter_table('comments', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint('fk_comments_post_id_posts', type_='foreignkey')
+        batch_op.create_foreign_key('fk_comments_post_id_posts', 'posts', ['post_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_index('ix_comments_post_id', ['post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comments', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_index('ix_comments_post_id')
+        batch_op.drop_constraint('fk_comments_post_id_posts', type_='foreignkey')
+        batch_op.create_foreign_key('fk_comments_post_id_posts', 'posts', ['post_id'], ['id'])
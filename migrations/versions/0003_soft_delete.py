@@ -0,0 +1,41 @@
+"""Мягкое удаление: deleted_at у постов и комментариев и частичные индексы
+
+Живые комментарии поста читаются по индексу (post_id, created_at) с условием
+deleted_at IS NULL; компактор находит отметки по индексам с условием
+deleted_at IS NOT NULL, которые не растут вместе с живыми строками.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 09:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('comments', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_posts_deleted_at', 'posts', ['deleted_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_comments_deleted_at', 'comments', ['deleted_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_comments_post_id_live', 'comments', ['post_id', 'created_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_live', table_name='comments')
+    op.drop_index('ix_comments_deleted_at', table_name='comments')
+    op.drop_index('ix_posts_deleted_at', table_name='posts')
+    with op.batch_alter_table('comments') as batch_op:
+        batch_op.drop_column('deleted_at')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,37 @@
+"""Журнал изменений для синхронизации клиентов
+
+Записи пишутся в той же транзакции, что и изменение поста или комментария;
+AUTOINCREMENT не дает повторно использовать номера seq.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 11:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'changes',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=True),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('data', sa.Text(), nullable=True),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True
+    )
+
+def downgrade():
+    op.drop_table('changes')
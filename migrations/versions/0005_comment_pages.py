@@ -0,0 +1,33 @@
+"""Готовая первая страница комментариев поста
+
+Строка создается при первом чтении GET /posts/<id>/comments и обновляется в
+транзакциях записи комментариев; удаляется вместе с постом.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 15:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'comment_pages',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('items', sa.Text(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], name='fk_comment_pages_post_id_posts', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('post_id')
+    )
+
+def downgrade():
+    op.drop_table('comment_pages')
@@ -0,0 +1,33 @@
+"""Рейтинг горячих постов: hot_score у постов и частичный индекс по нему
+
+hot_score - логарифм по основанию 2 суммы весов живых комментариев поста,
+отсчитанный от HOT_EPOCH; поддерживается при записи комментариев. Миграция
+только добавляет колонку: существующие посты получают рейтинг командой
+flask hot-scores.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 17:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('hot_score', sa.Float(), nullable=True))
+    op.create_index('ix_posts_hot_score', 'posts', ['hot_score'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NULL AND hot_score IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_posts_hot_score', table_name='posts')
+    with op.batch_alter_table('posts') as batch_op:
+        batch_op.drop_column('hot_score')
@@ -0,0 +1,46 @@
+"""Комментарии автора: индекс по (author, created_at) и сводка по авторам
+
+Индекс живых комментариев автора обслуживает GET /authors/<author>/comments
+и массовое удаление по автору. Сводка author_stats заполняется по
+существующим комментариям и дальше поддерживается при записи комментариев.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 19:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_comments_author_live', 'comments', ['author', 'created_at'], unique=False,
+                    sqlite_where=sa.text('deleted_at IS NULL'))
+    op.create_table(
+        'author_stats',
+        sa.Column('author', sa.String(length=100), nullable=False),
+        sa.Column('comment_count', sa.Integer(), nullable=False),
+        sa.Column('first_seen', sa.DateTime(), nullable=True),
+        sa.Column('last_seen', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('author')
+    )
+    # Живые комментарии к живым постам; первое и последнее появление - по всем строкам
+    op.execute(
+        'INSERT INTO author_stats (author, comment_count, first_seen, last_seen) '
+        'SELECT comments.author, '
+        'sum(CASE WHEN comments.deleted_at IS NULL AND posts.deleted_at IS NULL THEN 1 ELSE 0 END), '
+        'min(comments.created_at), max(comments.created_at) '
+        'FROM comments JOIN posts ON comments.post_id = posts.id GROUP BY comments.author'
+    )
+
+
+def downgrade():
+    op.drop_table('author_stats')
+    op.drop_index('ix_comments_author_live', table_name='comments')
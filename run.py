@@ -24,15 +24,34 @@ if __name__ == '__main__':
     print("\n🔗 Доступные эндпоинты:")
     print("\n📄 Посты:")
     print("  GET    /posts                    - получить все посты")
+    print("  GET    /posts?ids=1,2,3         - получить посты по списку ID")
+    print("  GET    /posts/hot?limit=10       - горячие посты по активности комментариев")
     print("  GET    /posts/{id}              - получить пост по ID")
     print("  POST   /posts                   - создать новый пост")
     print("  PUT    /posts/{id}              - обновить пост")
     print("  DELETE /posts/{id}              - удалить пост")
     print("\n💬 Комментарии:")
     print("  GET    /posts/{id}/comments     - получить комментарии к посту")
+    print("  GET    /posts/{id}/comments?limit=20&before={id} - страница комментариев (новые первыми)")
+    print("  GET    /posts/{id}/comments/stream - поток событий комментариев (SSE, Last-Event-ID)")
     print("  POST   /posts/{id}/comments     - создать комментарий к посту")
+    print("  GET    /comments?ids=1,2,3      - получить комментарии по списку ID")
     print("  GET    /comments/{id}           - получить комментарий по ID")
     print("  PUT    /comments/{id}           - обновить комментарий")
     print("  DELETE /comments/{id}           - удалить комментарий")
+    print("  GET    /authors/{author}/comments?limit=20&before={id} - комментарии автора и сводка по нему")
+    print("  DELETE /comments?author=&post_id=&before=&after=&dry_run=1 - массовое удаление (X-Admin-Token)")
+    print("\n🔄 Синхронизация:")
+    print("  GET    /changes?since=&limit=   - изменения постов и комментариев после номера since")
+    print("\n📦 Пакеты:")
+    print("  POST   /batch                   - несколько операций в одном запросе (atomic - одной транзакцией)")
+    print("\n🛠  Служебные:")
+    print("  GET    /metrics                 - метрики в формате Prometheus")
+    print("  GET    /profiles/{id}           - сохраненный профиль запроса (X-Profile)")
+    print("  GET    /admin/memory            - трассировка памяти и пики по маршрутам (X-Admin-Token)")
+    print("  POST   /admin/memory/start|stop - запуск и остановка tracemalloc")
+    print("  POST   /admin/memory/snapshots  - снимок памяти")
+    print("  GET    /admin/memory/diff       - разница двух снимков")
+    print("  GET    /export                  - выгрузка снимка базы в NDJSON/CSV (X-Admin-Token)")
     
     app.run(debug=True, host='0.0.0.0', port=5050)
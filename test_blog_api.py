@@ -4,16 +4,41 @@
 """
 
 import pytest
+import csv
+import gzip
+import io
 import json
 import os
 import tempfile
-from app import app, db, Post, Comment
+import threading
+import queue
+import subprocess
+import sys
+import random
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+from flask import jsonify
+from sqlalchemy import create_engine, delete, event, insert, text
+from sqlalchemy.exc import IntegrityError
+from app import (app, db, Post, Comment, Change, CommentPage, AuthorStats, comment_committer, comment_events, admission, TokenBucketLimiter, metrics,
+                 query_budget, QueryBudgetExceeded, slow_query_logger, memory_profiler,
+                 validate_post_data, validate_comment_data, compress_response, brotli,
+                 seed_database, compactor, export_stream, backup_database, backup_scheduler,
+                 rebuild_hot_scores, rebuild_author_stats, rebuild_comment_pages)
+
+def route_budget(endpoint):
+    """Бюджет SQL-запросов, объявленный маршрутом через @query_budget"""
+    return getattr(app.view_functions[endpoint], 'query_budget', None)
 
 @pytest.fixture
 def client():
     """Создание тестового клиента"""
     app.config['TESTING'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['QUERY_BUDGET_MODE'] = 'raise'
+    # Компактор в тестах запускается вручную: фоновый поток делил бы соединение in-memory базы
+    app.config['COMPACTION_ENABLED'] = False
     
     with app.test_client() as client:
         with app.app_context():
@@ -203,6 +228,1735 @@ class TestCommentsAPI:
         response = client.get(f'/comments/{sample_comment.id}')
         assert response.status_code == 404
 
+class TestGroupCommit:
+    """Тесты групповой фиксации комментариев"""
+    
+    @pytest.fixture
+    def group_commit(self):
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        app.config['COMMENT_GROUP_COMMIT_WINDOW_MS'] = 200
+        comment_committer.batches = 0
+        yield
+        comment_committer.stop()
+        app.config['COMMENT_GROUP_COMMIT'] = False
+    
+    def send_comments(self, post_id, count, extra=None):
+        """Параллельно отправить `count` комментариев; `extra` выполняется в отдельном потоке"""
+        responses = []
+        
+        def send(i):
+            with app.test_client() as thread_client:
+                response = thread_client.post(f'/posts/{post_id}/comments',
+                                              data=json.dumps({"content": f"Комментарий номер {i}", "author": "Алексей"}),
+                                              content_type='application/json')
+                responses.append((response.status_code, json.loads(response.data)))
+        
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(count)]
+        if extra is not None:
+            threads.append(threading.Thread(target=extra))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+    
+    def test_concurrent_comments_get_own_ids(self, client, sample_post, group_commit):
+        """Параллельные комментарии фиксируются вместе, но каждый получает свой ID"""
+        responses = self.send_comments(sample_post.id, 8)
+        
+        assert [status for status, _ in responses] == [201] * 8
+        ids = {data['data']['id'] for _, data in responses}
+        assert len(ids) == 8
+        # Комментарии действительно собраны в группы
+        assert comment_committer.batches < 8
+        
+        # Каждая строка зафиксирована и видна через обычный API
+        for _, data in responses:
+            response = client.get(f"/comments/{data['data']['id']}")
+            assert response.status_code == 200
+            assert json.loads(response.data)['data'] == data['data']
+    
+    def test_bad_row_retried_alone(self, client, sample_post, group_commit):
+        """Ошибочная строка не мешает остальным строкам группы"""
+        post_id = sample_post.id
+        errors = []
+        
+        def submit_bad_row():
+            try:
+                comment_committer.submit({'post_id': post_id, 'content': None, 'author': 'Алексей',
+                                          'created_at': datetime.utcnow()})
+            except Exception as e:
+                errors.append(e)
+        
+        # Поток должен быть запущен до отправки ошибочной строки
+        comment_committer.start(db.engine, 200, 100)
+        responses = self.send_comments(post_id, 4, extra=submit_bad_row)
+        
+        assert [status for status, _ in responses] == [201] * 4
+        assert len(errors) == 1
+        assert Comment.query.filter_by(post_id=post_id).count() == 4
+    
+    def test_deleted_post_returns_404(self, client, sample_post, group_commit):
+        """Пост, удаленный до фиксации, не получает сиротский комментарий"""
+        post_id = sample_post.id
+        comment_committer.start(db.engine, 0, 100)
+        db.session.delete(sample_post)
+        db.session.commit()
+        comment_id = comment_committer.submit({'post_id': post_id, 'content': 'Комментарий', 'author': 'Алексей',
+                                               'created_at': datetime.utcnow()})
+        assert comment_id is None
+        assert Comment.query.filter_by(post_id=post_id).count() == 0
+
+class TestAdmissionControl:
+    """Тесты лимитов запросов и предела параллельности"""
+    
+    @pytest.fixture
+    def admission_control(self):
+        app.config['ADMISSION_CONTROL_ENABLED'] = True
+        app.config['RATE_LIMIT_READ_BURST'] = 2
+        app.config['MAX_CONCURRENT_REQUESTS'] = 1
+        admission.reset(app.config)
+        yield
+        app.config['ADMISSION_CONTROL_ENABLED'] = False
+        app.config['RATE_LIMIT_READ_BURST'] = 40
+        app.config['MAX_CONCURRENT_REQUESTS'] = 64
+        admission.reset(app.config)
+    
+    def test_rate_limit_returns_429(self, client, admission_control):
+        """Превышение лимита чтения дает 429 с Retry-After"""
+        assert client.get('/posts').status_code == 200
+        assert client.get('/posts').status_code == 200
+        response = client.get('/posts')
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert json.loads(response.data)['success'] == False
+        
+        # Лимиты чтения и записи независимы
+        response = client.post('/posts', data=json.dumps({"title": "Новый пост", "content": "Содержимое нового поста."}),
+                               content_type='application/json')
+        assert response.status_code == 201
+    
+    def test_concurrency_cap_returns_503(self, client, admission_control):
+        """Если все слоты заняты, запрос отклоняется до обращения к БД"""
+        assert admission.acquire_slot()
+        try:
+            response = client.get('/posts')
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '1'
+        finally:
+            admission.release_slot()
+        assert client.get('/posts').status_code == 200
+    
+    def test_idle_buckets_evicted(self):
+        """Простаивающие корзины вытесняются"""
+        limiter = TokenBucketLimiter(rate=1, burst=2, idle_seconds=10)
+        limiter.acquire('a', now=0)
+        limiter.acquire('b', now=5)
+        assert len(limiter) == 2
+        limiter.acquire('c', now=12)
+        assert len(limiter) == 2
+        limiter.acquire('c', now=30)
+        assert len(limiter) == 1
+        
+        assert limiter.acquire('d', now=100) == 0
+        assert limiter.acquire('d', now=100) == 0
+        assert limiter.acquire('d', now=100) == pytest.approx(1.0)
+
+class TestMetrics:
+    """Тесты эндпоинта метрик"""
+    
+    def test_metrics_count_requests(self, client, sample_post):
+        """Счетчики, гистограммы и время БД по маршрутам"""
+        metrics.reset()
+        client.get(f'/posts/{sample_post.id}')
+        client.get(f'/posts/{sample_post.id}')
+        client.get('/posts/999')
+        
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        text = response.data.decode('utf-8')
+        assert 'blog_api_requests_total{endpoint="get_post",method="GET",status="200"} 2' in text
+        assert 'blog_api_requests_total{endpoint="get_post",method="GET",status="404"} 1' in text
+        assert 'blog_api_request_duration_seconds_count{endpoint="get_post",method="GET"} 3' in text
+        assert 'blog_api_request_duration_seconds_bucket{endpoint="get_post",method="GET",le="+Inf"} 3' in text
+        assert 'blog_api_request_db_seconds_count{endpoint="get_post",method="GET"} 3' in text
+        # Сам запрос /metrics еще в обработке
+        assert 'blog_api_requests_in_flight 1' in text
+    
+    def fake_snapshot(self, count, in_flight):
+        return {
+            'requests': [['get_posts', 'GET', 200, count]],
+            'latency': [['get_posts', 'GET', [count] + [0] * len(metrics.buckets), 0.001 * count, count]],
+            'db_time': [['get_posts', 'GET', [count] + [0] * len(metrics.buckets), 0.0002 * count, count]],
+            'in_flight': in_flight
+        }
+    
+    @pytest.fixture
+    def multiproc_dir(self, tmp_path):
+        metrics.reset()
+        app.config['METRICS_MULTIPROC_DIR'] = str(tmp_path)
+        app.config['METRICS_FLUSH_INTERVAL'] = 0
+        yield tmp_path
+        app.config['METRICS_MULTIPROC_DIR'] = None
+        app.config['METRICS_FLUSH_INTERVAL'] = 5
+    
+    def test_metrics_aggregate_live_process(self, client, multiproc_dir):
+        """Снимки живых процессов суммируются вместе с их запросами в обработке"""
+        worker = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        try:
+            (multiproc_dir / f'{worker.pid}.json').write_text(json.dumps(self.fake_snapshot(5, 2)))
+            client.get('/posts')
+            
+            # Снимок текущего процесса записан после завершения запроса
+            own = json.loads((multiproc_dir / f'{os.getpid()}.json').read_text())
+            assert own['in_flight'] == 0
+            
+            text = client.get('/metrics').data.decode('utf-8')
+        finally:
+            worker.kill()
+            worker.wait()
+        assert 'blog_api_requests_total{endpoint="get_posts",method="GET",status="200"} 6' in text
+        assert 'blog_api_request_duration_seconds_count{endpoint="get_posts",method="GET"} 6' in text
+        # 2 запроса живого воркера + сам запрос /metrics
+        assert 'blog_api_requests_in_flight 3' in text
+    
+    def test_dead_process_folded_into_aggregate(self, client, multiproc_dir):
+        """Снимок завершившегося процесса переносится в агрегат, счетчики не теряются"""
+        # PID заведомо несуществующего процесса
+        (multiproc_dir / '999999999.json').write_text(json.dumps(self.fake_snapshot(5, 3)))
+        text = client.get('/metrics').data.decode('utf-8')
+        assert not (multiproc_dir / '999999999.json').exists()
+        assert (multiproc_dir / 'aggregate.json').exists()
+        assert 'blog_api_requests_total{endpoint="get_posts",method="GET",status="200"} 5' in text
+        assert 'blog_api_requests_in_flight 1' in text
+        
+        # Повторно использованный PID не затирает счетчики прежнего процесса
+        (multiproc_dir / '999999999.json').write_text(json.dumps(self.fake_snapshot(2, 0)))
+        text = client.get('/metrics').data.decode('utf-8')
+        assert 'blog_api_requests_total{endpoint="get_posts",method="GET",status="200"} 7' in text
+
+    def test_reused_pid_file_folded_on_first_flush(self, client, multiproc_dir):
+        """Файл с тем же PID от прежнего процесса не перезаписывается при первом сбросе"""
+        (multiproc_dir / f'{os.getpid()}.json').write_text(json.dumps(self.fake_snapshot(4, 1)))
+        metrics._last_flush = 0.0
+        client.get('/posts')
+        aggregate = json.loads((multiproc_dir / 'aggregate.json').read_text())
+        assert aggregate['requests'] == [['get_posts', 'GET', 200, 4]]
+        assert aggregate['in_flight'] == 0
+
+class TestSQLInstrumentation:
+    """Тесты счетчиков SQL-запросов и журнала медленных запросов"""
+    
+    @pytest.fixture
+    def debug_headers(self):
+        app.config['SQL_DEBUG_HEADERS'] = True
+        yield
+        app.config['SQL_DEBUG_HEADERS'] = False
+    
+    def test_query_count_header(self, client, sample_post, debug_headers):
+        """Количество запросов и время БД в заголовках ответа"""
+        post_id = sample_post.id
+        db.session.expunge_all()
+        response = client.get(f'/posts/{post_id}/comments')
+        assert response.status_code == 200
+        # Поиск готовой страницы, проверка поста и выборка комментариев
+        assert response.headers['X-DB-Queries'] == '3'
+        assert float(response.headers['X-DB-Time-Ms']) >= 0
+        # Запись комментария строит страницу, дальше - один запрос по ключу
+        client.post(f'/posts/{post_id}/comments', json={'content': 'Первый комментарий', 'author': 'Мария'})
+        assert client.get(f'/posts/{post_id}/comments').headers['X-DB-Queries'] == '1'
+    
+    def test_headers_hidden_outside_debug(self, client, sample_post):
+        """Без режима отладки заголовки не отдаются"""
+        response = client.get(f'/posts/{sample_post.id}')
+        assert 'X-DB-Queries' not in response.headers
+    
+    def test_slow_query_logged_with_plan(self, client, sample_post, caplog):
+        """Медленный запрос попадает в журнал вместе с планом и пометкой о полном просмотре"""
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        try:
+            with caplog.at_level('WARNING', logger='slow_queries'):
+                slow_query_logger.addHandler(caplog.handler)
+                try:
+                    client.get('/posts')
+                finally:
+                    slow_query_logger.removeHandler(caplog.handler)
+        finally:
+            app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+        messages = [record.getMessage() for record in caplog.records if record.name == 'slow_queries']
+        assert any('FROM posts' in message and '[полный просмотр] SCAN posts' in message for message in messages)
+
+    def test_slow_executemany_logged(self, client, sample_post, caplog):
+        """executemany (массовая вставка комментариев) тоже попадает в журнал"""
+        app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+        try:
+            with caplog.at_level('WARNING', logger='slow_queries'):
+                slow_query_logger.addHandler(caplog.handler)
+                try:
+                    seed_database(db.engine, 1, 3, random.Random(1))
+                finally:
+                    slow_query_logger.removeHandler(caplog.handler)
+        finally:
+            app.config['SLOW_QUERY_THRESHOLD_MS'] = 100
+        messages = [record.getMessage() for record in caplog.records if record.name == 'slow_queries']
+        assert any('executemany, 3 наборов параметров' in message and 'INSERT INTO comments' in message
+                   for message in messages)
+
+class TestProfiling:
+    """Тесты профилирования отдельных запросов"""
+    
+    SECRET = 'секрет-профилирования'
+    
+    @pytest.fixture
+    def profiling(self, tmp_path):
+        app.config.update(PROFILING_ENABLED=True, PROFILING_SECRET=self.SECRET, PROFILING_DIR=str(tmp_path))
+        yield tmp_path
+        app.config.update(PROFILING_ENABLED=False, PROFILING_SECRET=None)
+    
+    def test_profile_saved_with_collapsed_stacks(self, client, sample_post, profiling):
+        """Запрос с секретом профилируется, pstats и collapsed stacks сохраняются"""
+        response = client.get('/posts', headers={'X-Profile': self.SECRET})
+        assert response.status_code == 200
+        profile_id = response.headers['X-Profile-Id']
+        assert 'get_posts' in profile_id
+        assert (profiling / f'{profile_id}.pstats').exists()
+        lines = (profiling / f'{profile_id}.collapsed').read_text().splitlines()
+        assert lines
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+        assert any('get_posts (app.py:' in line for line in lines)
+        
+        text = client.get(f'/profiles/{profile_id}', headers={'X-Profile': self.SECRET})
+        assert text.status_code == 200
+        assert 'function calls' in text.data.decode('utf-8')
+        collapsed = client.get(f'/profiles/{profile_id}?format=collapsed', headers={'X-Profile': self.SECRET})
+        assert collapsed.data.decode('utf-8').splitlines() == lines
+    
+    def test_wrong_secret_not_profiled(self, client, sample_post, profiling):
+        """Без верного секрета запрос не профилируется, а профили не отдаются"""
+        response = client.get('/posts', headers={'X-Profile': 'неверно'})
+        assert 'X-Profile-Id' not in response.headers
+        assert list(profiling.iterdir()) == []
+        assert client.get('/profiles/any', headers={'X-Profile': 'неверно'}).status_code == 404
+    
+    def test_disabled_ignores_header(self, client, sample_post, profiling):
+        """При выключенном профилировании заголовок игнорируется"""
+        app.config['PROFILING_ENABLED'] = False
+        response = client.get('/posts', headers={'X-Profile': self.SECRET})
+        assert 'X-Profile-Id' not in response.headers
+    
+    def test_profile_id_validated(self, client, profiling):
+        """Идентификатор профиля не может указывать за пределы каталога"""
+        response = client.get('/profiles/..%2Fblog', headers={'X-Profile': self.SECRET})
+        assert response.status_code in (400, 404)
+        assert client.get('/profiles/missing', headers={'X-Profile': self.SECRET}).status_code == 404
+
+class TestMemoryProfiling:
+    """Тесты служебных эндпоинтов профилирования памяти"""
+    
+    TOKEN = 'токен-администратора'
+    
+    @pytest.fixture
+    def admin(self):
+        app.config['ADMIN_TOKEN'] = self.TOKEN
+        memory_profiler.reset()
+        yield {'X-Admin-Token': self.TOKEN}
+        memory_profiler.stop()
+        memory_profiler.reset()
+        app.config['ADMIN_TOKEN'] = None
+    
+    def test_requires_admin_token(self, client, admin):
+        """Без верного токена эндпоинты не видны"""
+        assert client.get('/admin/memory').status_code == 404
+        assert client.post('/admin/memory/start', headers={'X-Admin-Token': 'неверно'}).status_code == 404
+        app.config['ADMIN_TOKEN'] = None
+        assert client.get('/admin/memory', headers=admin).status_code == 404
+    
+    def test_snapshot_diff_shows_growth(self, client, admin):
+        """Разница снимков указывает на место роста памяти"""
+        assert client.post('/admin/memory/snapshots', headers=admin).status_code == 400
+        assert client.post('/admin/memory/start', headers=admin).get_json()['data']['tracing'] is True
+        
+        first = client.post('/admin/memory/snapshots', headers=admin)
+        assert first.status_code == 201
+        leak = [bytearray(1024) for _ in range(1000)]
+        second = client.post('/admin/memory/snapshots?limit=5', headers=admin).get_json()['data']
+        assert len(second['top']) <= 5
+        
+        diff = client.get('/admin/memory/diff', headers=admin).get_json()['data']
+        assert diff['base'] == first.get_json()['data']['id']
+        assert diff['compare'] == second['id']
+        grown = diff['top'][0]
+        assert grown['size_diff_bytes'] >= 1000 * 1024
+        assert grown['site'][-1].startswith(__file__)
+        assert len(leak) == 1000
+        
+        snapshot = client.get(f"/admin/memory/snapshots/{second['id']}?group_by=filename", headers=admin)
+        assert snapshot.status_code == 200
+        assert client.get('/admin/memory/snapshots/999', headers=admin).status_code == 404
+    
+    def test_snapshots_bounded(self, client, admin):
+        """Хранится не больше MEMORY_SNAPSHOTS_LIMIT снимков"""
+        app.config['MEMORY_SNAPSHOTS_LIMIT'] = 2
+        try:
+            client.post('/admin/memory/start', headers=admin)
+            for _ in range(3):
+                client.post('/admin/memory/snapshots', headers=admin)
+        finally:
+            app.config['MEMORY_SNAPSHOTS_LIMIT'] = 10
+        snapshots = client.get('/admin/memory', headers=admin).get_json()['data']['snapshots']
+        assert [snapshot['id'] for snapshot in snapshots] == [2, 3]
+    
+    def test_endpoint_peaks(self, client, sample_post, admin):
+        """Пиковая память считается по маршрутам только во время трассировки"""
+        client.get('/posts')
+        client.post('/admin/memory/start', headers=admin)
+        for i in range(3):
+            db.session.add(Comment(post_id=sample_post.id, content=f"Комментарий номер {i}", author="Алексей"))
+        db.session.commit()
+        client.get('/posts')
+        client.get('/posts')
+        client.get(f'/posts/{sample_post.id}/comments')
+        
+        status = client.get('/admin/memory', headers=admin).get_json()['data']
+        assert status['tracing'] is True
+        assert status['max_rss_bytes'] > 0
+        endpoints = {(item['endpoint'], item['method']): item for item in status['endpoints']}
+        assert endpoints[('get_posts', 'GET')]['requests'] == 2
+        assert endpoints[('get_posts', 'GET')]['peak_bytes'] > 0
+        assert endpoints[('get_comments', 'GET')]['requests'] == 1
+        
+        client.post('/admin/memory/stop', headers=admin)
+        client.get('/posts')
+        status = client.get('/admin/memory', headers=admin).get_json()['data']
+        assert status['tracing'] is False
+        assert {item['endpoint']: item for item in status['endpoints']}['get_posts']['requests'] == 2
+
+class TestCompression:
+    """Тесты сжатия ответов"""
+    
+    @pytest.fixture
+    def many_posts(self, client):
+        for i in range(30):
+            db.session.add(Post(title=f"Пост номер {i}", content="Содержимое поста для проверки сжатия ответов."))
+        db.session.commit()
+    
+    def test_gzip_above_threshold(self, client, many_posts):
+        """Большой JSON сжимается gzip и распаковывается в исходный ответ"""
+        plain = client.get('/posts')
+        response = client.get('/posts', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data) / 3
+        assert gzip.decompress(response.data) == plain.data
+    
+    def test_small_and_unsupported_not_compressed(self, client, sample_post):
+        """Ответы меньше порога и без поддержки клиентом не сжимаются"""
+        small = client.get(f'/posts/{sample_post.id}', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+        assert 'Accept-Encoding' in small.headers['Vary']
+        identity = client.get('/posts', headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in identity.headers
+        refused = client.get('/posts', headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in refused.headers
+    
+    def test_threshold_configurable(self, client, sample_post):
+        """Порог задается COMPRESSION_MIN_SIZE"""
+        app.config['COMPRESSION_MIN_SIZE'] = 0
+        try:
+            response = client.get(f'/posts/{sample_post.id}', headers={'Accept-Encoding': 'gzip'})
+        finally:
+            app.config['COMPRESSION_MIN_SIZE'] = 1024
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(response.data))['data']['id'] == sample_post.id
+    
+    def test_streamed_response_compressed_incrementally(self, client):
+        """Потоковый ответ сжимается по фрагментам, каждый фрагмент распаковывается сразу"""
+        chunks = [json.dumps({'n': i}) + '\n' for i in range(5)]
+        with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+            response = compress_response(app.response_class(iter(chunks), mimetype='application/x-ndjson'))
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert 'Content-Length' not in response.headers
+            decompressor = zlib.decompressobj(31)
+            received = []
+            for piece in response.response:
+                received.append(decompressor.decompress(piece).decode('utf-8'))
+            # Первый фрагмент доступен клиенту до того, как сгенерирован второй
+            assert received[0] == chunks[0]
+            assert ''.join(received) == ''.join(chunks)
+            assert decompressor.eof
+    
+    def test_precompressed_body_untouched(self, client):
+        """Тело с уже заданным Content-Encoding не сжимается повторно"""
+        body = gzip.compress(b'{"cached": true}' * 200)
+        with app.test_request_context('/', headers={'Accept-Encoding': 'gzip'}):
+            cached = app.response_class(body, mimetype='application/json', headers={'Content-Encoding': 'gzip'})
+            response = compress_response(cached)
+        assert response.get_data() == body
+    
+    @pytest.mark.skipif(brotli is None, reason='пакет brotli не установлен')
+    def test_brotli_preferred(self, client, many_posts):
+        """При поддержке клиентом brotli выбирается он"""
+        plain = client.get('/posts')
+        response = client.get('/posts', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.data) == plain.data
+
+class TestMultiGet:
+    """Тесты выборки постов и комментариев по списку ID"""
+    
+    def test_posts_by_ids_in_request_order(self, client, sample_post):
+        """Посты возвращаются в порядке запроса одним выражением, ненайденные - в missing"""
+        second = Post(title="Второй пост", content="Содержимое второго поста.")
+        db.session.add(second)
+        db.session.commit()
+        first_id, second_id = sample_post.id, second.id
+        with query_budget(1, mode='raise') as budget:
+            response = client.get(f'/posts?ids={second_id},999,{first_id},{second_id}')
+        data = response.get_json()
+        assert response.status_code == 200
+        assert [post['id'] for post in data['data']] == [second_id, first_id]
+        assert data['missing'] == [999]
+        assert data['count'] == 2
+        assert budget.count == 1
+    
+    def test_comments_by_ids_skip_deleted(self, client, sample_comment):
+        """Удаленные комментарии считаются ненайденными"""
+        other = Comment(post_id=sample_comment.post_id, content="Второй комментарий", author="Мария")
+        db.session.add(other)
+        db.session.commit()
+        client.delete(f'/comments/{other.id}')
+        response = client.get(f'/comments?ids={other.id},{sample_comment.id}')
+        data = response.get_json()
+        assert [comment['id'] for comment in data['data']] == [sample_comment.id]
+        assert data['data'][0] == sample_comment.to_dict()
+        assert data['missing'] == [other.id]
+    
+    def test_invalid_ids_rejected(self, client):
+        """Нечисловые ID, пустой список и превышение лимита отклоняются"""
+        assert client.get('/posts?ids=1,abc').status_code == 400
+        assert client.get('/posts?ids=').status_code == 400
+        assert client.get('/comments').status_code == 400
+        app.config['MULTI_GET_MAX_IDS'] = 3
+        try:
+            assert client.get('/comments?ids=1,2,3,4').status_code == 400
+            assert client.get('/comments?ids=1,2,3,3').status_code == 200
+        finally:
+            app.config['MULTI_GET_MAX_IDS'] = 100
+
+class TestBatch:
+    """Тесты пакетных запросов POST /batch"""
+    
+    def test_operations_run_in_order(self, client, sample_post):
+        """Операции выполняются по порядку, у каждой свой код ответа"""
+        post_id = sample_post.id
+        app.config['SQL_DEBUG_HEADERS'] = True
+        try:
+            response = client.post('/batch', json={'operations': [
+                {'method': 'POST', 'path': f'/posts/{post_id}/comments',
+                 'body': {'content': 'Комментарий из пакета', 'author': 'Мария'}},
+                {'method': 'GET', 'path': '/posts/999'},
+                {'method': 'get', 'path': f'/posts/{post_id}/comments'},
+                {'method': 'GET', 'path': f'/posts?ids={post_id}'},
+            ]})
+        finally:
+            app.config['SQL_DEBUG_HEADERS'] = False
+        data = response.get_json()
+        assert response.status_code == 200
+        assert [result['status'] for result in data['data']] == [201, 404, 200, 200]
+        assert data['data'][2]['body']['data'][0]['content'] == 'Комментарий из пакета'
+        assert data['data'][3]['body']['data'][0]['id'] == post_id
+        # SQL-выражения операций учитываются в запросе пакета
+        assert int(response.headers['X-DB-Queries']) >= 6
+    
+    def test_atomic_batch_commits_together(self, client, sample_post):
+        """Атомарный пакет фиксирует все изменения одной транзакцией"""
+        post_id = sample_post.id
+        response = client.post('/batch', json={'atomic': True, 'operations': [
+            {'method': 'POST', 'path': '/posts', 'body': {'title': 'Пост из пакета', 'content': 'Содержимое поста.'}},
+            {'method': 'PUT', 'path': f'/posts/{post_id}', 'body': {'title': 'Обновлен пакетом'}},
+        ]})
+        assert response.status_code == 200
+        assert [result['status'] for result in response.get_json()['data']] == [201, 200]
+        db.session.expire_all()
+        assert Post.query.count() == 2
+        assert db.session.get(Post, post_id).title == 'Обновлен пакетом'
+    
+    def test_atomic_batch_rolls_back_on_failure(self, client, sample_post):
+        """Неудачная операция отменяет атомарный пакет, следующие не выполняются"""
+        post_id = sample_post.id
+        response = client.post('/batch', json={'atomic': True, 'operations': [
+            {'method': 'POST', 'path': '/posts', 'body': {'title': 'Пост из пакета', 'content': 'Содержимое поста.'}},
+            {'method': 'POST', 'path': f'/posts/{post_id}/comments',
+             'body': {'content': 'Комментарий из пакета', 'author': 'Мария'}},
+            {'method': 'PUT', 'path': '/posts/999', 'body': {'title': 'Нет такого поста'}},
+            {'method': 'DELETE', 'path': f'/posts/{post_id}'},
+        ]})
+        data = response.get_json()
+        assert response.status_code == 409
+        assert [result['status'] for result in data['data']] == [201, 201, 404, None]
+        db.session.expire_all()
+        assert Post.query.count() == 1
+        assert Comment.query.count() == 0
+        assert client.get(f'/posts/{post_id}').status_code == 200
+    
+    def test_atomic_batch_bypasses_group_commit(self, client, sample_post):
+        """В атомарном пакете комментарий пишется в транзакцию пакета, а не фоновым потоком"""
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        comment_committer.batches = 0
+        try:
+            response = client.post('/batch', json={'atomic': True, 'operations': [
+                {'method': 'POST', 'path': f'/posts/{sample_post.id}/comments',
+                 'body': {'content': 'Комментарий из пакета', 'author': 'Мария'}},
+            ]})
+        finally:
+            comment_committer.stop()
+            app.config['COMMENT_GROUP_COMMIT'] = False
+        assert response.status_code == 200
+        assert comment_committer.batches == 0
+        assert Comment.query.count() == 1
+    
+    def test_invalid_batches(self, client, sample_post):
+        """Неверный пакет отклоняется целиком, недоступный маршрут - только операция"""
+        assert client.post('/batch', json={'operations': []}).status_code == 400
+        assert client.post('/batch', json={'operations': [{'method': 'PATCH', 'path': '/posts'}]}).status_code == 400
+        assert client.post('/batch', json={'operations': [{'method': 'GET', 'path': 'posts'}]}).status_code == 400
+        assert client.post('/batch', json={'atomic': 'да', 'operations': [{'method': 'GET', 'path': '/'}]}).status_code == 400
+        app.config['BATCH_MAX_OPERATIONS'] = 2
+        try:
+            response = client.post('/batch', json={'operations': [{'method': 'GET', 'path': '/posts'}] * 3})
+            assert response.status_code == 400
+        finally:
+            app.config['BATCH_MAX_OPERATIONS'] = 25
+        response = client.post('/batch', json={'operations': [
+            {'method': 'POST', 'path': '/batch', 'body': {'operations': []}},
+            {'method': 'GET', 'path': '/admin/memory'},
+            {'method': 'GET', 'path': '/нет-такого'},
+            {'method': 'DELETE', 'path': '/posts'},
+        ]})
+        assert [result['status'] for result in response.get_json()['data']] == [400, 400, 404, 405]
+
+class TestChangeFeed:
+    """Тесты журнала изменений GET /changes"""
+    
+    def test_writes_recorded_in_order(self, client):
+        """Записи всех маршрутов изменения попадают в журнал по порядку"""
+        post = client.post('/posts', json={"title": "Пост для синхронизации", "content": "Содержимое поста."}).get_json()['data']
+        client.put(f"/posts/{post['id']}", json={"title": "Новый заголовок"})
+        comment = client.post(f"/posts/{post['id']}/comments",
+                              json={"content": "Первый комментарий", "author": "Мария"}).get_json()['data']
+        client.put(f"/comments/{comment['id']}", json={"content": "Исправленный комментарий"})
+        client.delete(f"/comments/{comment['id']}")
+        client.delete(f"/posts/{post['id']}")
+        
+        changes = client.get('/changes').get_json()['data']
+        assert [(change['entity'], change['op'], change['id']) for change in changes] == [
+            ('post', 'insert', post['id']), ('post', 'update', post['id']),
+            ('comment', 'insert', comment['id']), ('comment', 'update', comment['id']),
+            ('comment', 'delete', comment['id']), ('post', 'delete', post['id']),
+        ]
+        assert [change['seq'] for change in changes] == sorted(change['seq'] for change in changes)
+        assert changes[0]['data'] == post
+        assert changes[1]['data']['title'] == 'Новый заголовок'
+        assert changes[3]['data']['content'] == 'Исправленный комментарий'
+        assert changes[3]['post_id'] == post['id']
+        assert changes[4]['data'] is None
+    
+    def test_paging_with_since(self, client):
+        """Клиент получает только изменения после since, страницами по limit"""
+        for i in range(5):
+            client.post('/posts', json={"title": f"Пост номер {i}", "content": "Содержимое поста."})
+        first = client.get('/changes?limit=3').get_json()
+        assert (first['count'], first['has_more']) == (3, True)
+        second = client.get(f"/changes?since={first['next_since']}&limit=3").get_json()
+        assert (second['count'], second['has_more']) == (2, False)
+        assert [change['data']['title'] for change in first['data'] + second['data']] == \
+            [f"Пост номер {i}" for i in range(5)]
+        empty = client.get(f"/changes?since={second['next_since']}").get_json()
+        assert (empty['count'], empty['next_since']) == (0, second['next_since'])
+    
+    def test_failed_write_leaves_no_change(self, client, sample_post):
+        """Отклоненное изменение не попадает в журнал"""
+        assert client.put(f'/posts/{sample_post.id}', json={"title": ""}).status_code == 400
+        assert client.delete('/posts/999').status_code == 404
+        assert client.post('/batch', json={'atomic': True, 'operations': [
+            {'method': 'POST', 'path': '/posts', 'body': {'title': 'Пост из пакета', 'content': 'Содержимое поста.'}},
+            {'method': 'DELETE', 'path': '/comments/999'},
+        ]}).status_code == 409
+        assert client.get('/changes').get_json()['count'] == 0
+    
+    def test_noop_update_leaves_no_change(self, client, sample_post):
+        """Обновление теми же значениями не пишет в журнал и не сдвигает updated_at"""
+        post = client.get(f'/posts/{sample_post.id}').get_json()['data']
+        comment = client.post(f"/posts/{post['id']}/comments",
+                              json={"content": "Комментарий", "author": "Мария"}).get_json()['data']
+        since = client.get('/changes').get_json()['next_since']
+        with query_budget(2, mode='raise') as budget:
+            response = client.put(f"/posts/{post['id']}", json={"title": post['title']})
+            assert client.put(f"/comments/{comment['id']}", json={"author": "Мария"}).get_json()['data'] == comment
+        assert response.get_json()['data'] == post
+        assert all(statement.startswith('SELECT') for statement in budget.statements)
+        assert client.get(f'/changes?since={since}').get_json()['count'] == 0
+    
+    def test_group_commit_records_change(self, client, sample_post):
+        """Комментарий из групповой фиксации записывается в журнал в той же транзакции"""
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        try:
+            comment = client.post(f'/posts/{sample_post.id}/comments',
+                                  json={"content": "Комментарий группой", "author": "Мария"}).get_json()['data']
+        finally:
+            comment_committer.stop()
+            app.config['COMMENT_GROUP_COMMIT'] = False
+        changes = client.get('/changes').get_json()['data']
+        assert [(change['op'], change['id'], change['data']) for change in changes] == [('insert', comment['id'], comment)]
+    
+    def test_invalid_arguments(self, client):
+        """Неверные since и limit отклоняются"""
+        assert client.get('/changes?since=-1').status_code == 400
+        assert client.get('/changes?since=abc').status_code == 400
+        assert client.get('/changes?limit=0').status_code == 400
+        assert client.get('/changes?limit=100000').status_code == 400
+
+class TestCommentStream:
+    """Тесты потока событий комментариев (SSE)"""
+    
+    @pytest.fixture
+    def sse_config(self):
+        app.config.update(SSE_HEARTBEAT_SECONDS=0.05, SSE_MAX_STREAM_SECONDS=5)
+        yield
+        app.config.update(SSE_HEARTBEAT_SECONDS=15, SSE_MAX_STREAM_SECONDS=300)
+    
+    @staticmethod
+    def open_stream(url, headers=None):
+        """Чтение потока в отдельном потоке, как у настоящего сервера; фрагменты - в очередь"""
+        chunks = queue.Queue()
+        
+        def read():
+            with app.test_client() as stream_client:
+                response = stream_client.get(url, headers=headers, buffered=False)
+                chunks.put(response.status_code)
+                for chunk in response.response:
+                    chunks.put(chunk.decode('utf-8'))
+                response.close()
+            chunks.put(None)
+        
+        threading.Thread(target=read, daemon=True).start()
+        assert chunks.get(timeout=5) == 200
+        assert chunks.get(timeout=5) == 'retry: 3000\n\n'
+        return chunks
+    
+    @staticmethod
+    def next_event(chunks):
+        """Следующее событие потока без пульса; None - поток завершен"""
+        while True:
+            chunk = chunks.get(timeout=5)
+            if chunk is None:
+                return None
+            if not chunk.startswith(':'):
+                fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+                return int(fields['id']), fields['event'], json.loads(fields['data'])
+    
+    def test_live_events(self, client, sample_post, sse_config):
+        """Создание, изменение и удаление комментария и удаление поста приходят событиями"""
+        post_id = sample_post.id
+        chunks = self.open_stream(f'/posts/{post_id}/comments/stream')
+        assert comment_events.subscribers(post_id) == 1
+        
+        comment = client.post(f'/posts/{post_id}/comments',
+                              json={"content": "Живой комментарий", "author": "Мария"}).get_json()['data']
+        seq, name, data = self.next_event(chunks)
+        assert (name, data) == ('comment_created', comment)
+        client.put(f"/comments/{comment['id']}", json={"content": "Исправленный комментарий"})
+        assert self.next_event(chunks)[1:] == ('comment_updated', dict(comment, content='Исправленный комментарий'))
+        client.delete(f"/comments/{comment['id']}")
+        assert self.next_event(chunks)[1:] == ('comment_deleted', {'id': comment['id'], 'post_id': post_id})
+        client.delete(f'/posts/{post_id}')
+        last_seq, name, _ = self.next_event(chunks)
+        assert name == 'post_deleted' and last_seq > seq
+        assert self.next_event(chunks) is None
+        assert comment_events.subscribers(post_id) == 0
+    
+    def test_heartbeat_and_stream_duration(self, client, sample_post, sse_config):
+        """Без событий поток шлет пульс и завершается через SSE_MAX_STREAM_SECONDS"""
+        app.config['SSE_MAX_STREAM_SECONDS'] = 0.3
+        chunks = self.open_stream(f'/posts/{sample_post.id}/comments/stream')
+        received = []
+        while (chunk := chunks.get(timeout=5)) is not None:
+            received.append(chunk)
+        assert received and set(received) == {': keepalive\n\n'}
+    
+    def test_resume_from_last_event_id(self, client, sample_post, sse_config):
+        """С Last-Event-ID сначала приходят пропущенные события из журнала"""
+        post_id = sample_post.id
+        other = client.post('/posts', json={"title": "Другой пост", "content": "Содержимое другого поста."}).get_json()['data']
+        for i in range(3):
+            client.post(f'/posts/{post_id}/comments', json={"content": f"Комментарий номер {i}", "author": "Мария"})
+            client.post(f"/posts/{other['id']}/comments", json={"content": f"Чужой комментарий {i}", "author": "Иван"})
+        first_seq = client.get('/changes').get_json()['data'][1]['seq']
+        
+        chunks = self.open_stream(f'/posts/{post_id}/comments/stream', headers={'Last-Event-ID': str(first_seq)})
+        events = [self.next_event(chunks) for _ in range(2)]
+        assert [data['content'] for _, _, data in events] == ['Комментарий номер 1', 'Комментарий номер 2']
+        assert all(seq > first_seq for seq, _, _ in events)
+        client.post(f'/posts/{post_id}/comments', json={"content": "Новый комментарий", "author": "Мария"})
+        assert self.next_event(chunks)[2]['content'] == 'Новый комментарий'
+        client.delete(f'/posts/{post_id}')
+        assert self.next_event(chunks)[1] == 'post_deleted'
+    
+    def test_open_stream_releases_admission_slot(self, client, sample_post, sse_config):
+        """Открытый поток не держит слот параллельности и не считается запросом в обработке"""
+        app.config.update(ADMISSION_CONTROL_ENABLED=True, MAX_CONCURRENT_REQUESTS=1)
+        admission.reset(app.config)
+        try:
+            self.open_stream(f'/posts/{sample_post.id}/comments/stream')
+            self.open_stream(f'/posts/{sample_post.id}/comments/stream')
+            assert metrics.in_flight == 0
+            assert client.get('/posts').status_code == 200
+        finally:
+            app.config.update(ADMISSION_CONTROL_ENABLED=False, MAX_CONCURRENT_REQUESTS=64)
+            admission.reset(app.config)
+    
+    def test_atomic_batch_publishes_after_commit(self, client, sample_post):
+        """Откаченный пакет не публикует событий, зафиксированный - публикует после фиксации"""
+        post_id = sample_post.id
+        subscriber = comment_events.subscribe(post_id, 10)
+        try:
+            create = {'method': 'POST', 'path': f'/posts/{post_id}/comments',
+                      'body': {'content': 'Комментарий из пакета', 'author': 'Мария'}}
+            assert client.post('/batch', json={'atomic': True, 'operations': [
+                create, {'method': 'DELETE', 'path': '/comments/999'}
+            ]}).status_code == 409
+            assert subscriber.queue.empty()
+            
+            response = client.post('/batch', json={'atomic': True, 'operations': [create]}).get_json()
+            comment = response['data'][0]['body']['data']
+            seq, name, data = subscriber.queue.get_nowait()
+            assert (name, data) == ('comment_created', comment)
+            assert seq == client.get('/changes').get_json()['data'][-1]['seq']
+            assert subscriber.queue.empty()
+        finally:
+            comment_events.unsubscribe(post_id, subscriber)
+    
+    def test_slow_subscriber_dropped(self):
+        """Переполненная очередь отключает подписчика, публикация не блокируется"""
+        subscriber = comment_events.subscribe(42, 1)
+        comment_events.publish(42, ('событие', 1))
+        comment_events.publish(42, ('событие', 2))
+        assert subscriber.overflowed
+        assert comment_events.subscribers(42) == 0
+    
+    def test_invalid_requests(self, client, sample_post):
+        """Несуществующий пост и неверный Last-Event-ID отклоняются"""
+        assert client.get('/posts/999/comments/stream').status_code == 404
+        response = client.get(f'/posts/{sample_post.id}/comments/stream', headers={'Last-Event-ID': 'abc'})
+        assert response.status_code == 400
+
+class TestReadPath:
+    """Тесты быстрого пути чтения списков"""
+    
+    def test_lists_match_orm_serialization(self, client):
+        """Ответы GET /posts и GET /posts/<id>/comments побайтно совпадают с сериализацией через to_dict"""
+        seed_database(db.engine, 20, 600, random.Random(7))
+        client.delete('/posts/3')
+        post_id = db.session.query(Comment.post_id).group_by(Comment.post_id) \
+            .order_by(db.func.count(Comment.id).desc()).first()[0]
+        client.delete(f"/comments/{Comment.query.filter_by(post_id=post_id).first().id}")
+        db.session.expire_all()
+        
+        posts = Post.query.filter(Post.deleted_at.is_(None)).all()
+        expected = jsonify({'success': True, 'data': [post.to_dict() for post in posts], 'count': len(posts)})
+        assert client.get('/posts').data == expected.get_data()
+        
+        comments = Comment.query.filter(Comment.post_id == post_id, Comment.deleted_at.is_(None)) \
+            .order_by(Comment.created_at.desc()).all()
+        expected = jsonify({'success': True, 'data': [comment.to_dict() for comment in comments],
+                            'count': len(comments), 'post_id': post_id})
+        assert client.get(f'/posts/{post_id}/comments').data == expected.get_data()
+    
+    def test_lists_do_not_load_orm_objects(self, client, sample_comment):
+        """Списки не создают ORM-объекты постов и комментариев"""
+        post_id = sample_comment.post_id
+        loaded = []
+        
+        def on_load(target, context):
+            loaded.append(type(target).__name__)
+        
+        event.listen(Post, 'load', on_load)
+        event.listen(Comment, 'load', on_load)
+        try:
+            db.session.expunge_all()
+            assert client.get('/posts').get_json()['count'] == 1
+            assert client.get(f'/posts/{post_id}/comments').get_json()['count'] == 1
+        finally:
+            event.remove(Post, 'load', on_load)
+            event.remove(Comment, 'load', on_load)
+        # Пост загружается только проверкой существования в get_comments
+        assert loaded == ['Post']
+
+class TestStatementCache:
+    """Тесты кэширования горячих выражений"""
+    
+    def test_hot_lookups_skip_building_and_compilation(self, client, monkeypatch):
+        """После первого запроса выражения не строятся и не компилируются заново"""
+        seed_database(db.engine, 3, 30, random.Random(11))
+        comment_ids = [row[0] for row in db.session.execute(text('SELECT id FROM comments ORDER BY id LIMIT 3'))]
+        db.session.remove()
+        app_module = sys.modules['app']
+        
+        def urls(i):
+            return [f'/posts/{i + 1}', f'/posts/{i + 1}/comments', f'/comments/{comment_ids[i]}']
+        
+        for url in urls(0):
+            assert client.get(url).status_code == 200
+        
+        built, compiled = [], []
+        select = app_module.select
+        monkeypatch.setattr(app_module, 'select', lambda *args: built.append(args) or select(*args))
+        dialect = db.engine.dialect
+        
+        class CountingCompiler(dialect.statement_compiler):
+            def __init__(self, *args, **kwargs):
+                compiled.append(str(args[1]))
+                super().__init__(*args, **kwargs)
+        
+        monkeypatch.setattr(dialect, 'statement_compiler', CountingCompiler)
+        for i in (1, 2):
+            post, comments, comment = [client.get(url).get_json()['data'] for url in urls(i)]
+            # Значения параметров берутся из текущего вызова, а не из первого
+            assert post['id'] == i + 1 and comment['id'] == comment_ids[i]
+            assert {row['post_id'] for row in comments} <= {i + 1}
+        assert built == [] and compiled == []
+
+class TestCommentPageCache:
+    """Тесты готовой первой страницы комментариев"""
+    
+    @pytest.fixture
+    def post_id(self, client):
+        """Пост с 30 комментариями, больше размера страницы"""
+        post = Post(title='Пост со страницей', content='Содержимое поста со страницей.')
+        db.session.add(post)
+        db.session.flush()
+        db.session.add_all(Comment(post_id=post.id, content=f'Комментарий номер {i}', author='Алексей',
+                                   created_at=datetime(2026, 1, 1, 12, i)) for i in range(30))
+        db.session.flush()
+        # Комментарии вставлены в обход API: страница строится, как после flask seed
+        rebuild_comment_pages(db.session)
+        db.session.commit()
+        return post.id
+    
+    def uncached(self, client, url):
+        """Тело ответа, построенного из таблицы comments без готовой страницы; страницы затем строятся заново"""
+        db.session.execute(delete(CommentPage))
+        db.session.commit()
+        body = client.get(url).data
+        rebuild_comment_pages(db.session)
+        db.session.commit()
+        return body
+    
+    def cached(self, client, url):
+        """Тело ответа, отданного одним запросом к готовой странице"""
+        with query_budget(1, mode='raise'):
+            return client.get(url).data
+    
+    def test_first_page_is_single_key_lookup(self, client, post_id):
+        url = f'/posts/{post_id}/comments?limit=20'
+        body = client.get(url).data
+        assert self.cached(client, url) == body == self.uncached(client, url)
+        data = json.loads(body)
+        assert data['count'] == 20 and data['has_more'] and data['next_before'] == data['data'][-1]['id']
+        assert data['data'][0]['content'] == 'Комментарий номер 29'
+        page = db.session.get(CommentPage, post_id)
+        assert (page.total, len(page.items.split('\n'))) == (30, app.config['COMMENT_PAGE_SIZE'])
+        # Страница меньшего размера - срез готовой
+        assert self.cached(client, f'/posts/{post_id}/comments?limit=5') == \
+            self.uncached(client, f'/posts/{post_id}/comments?limit=5')
+    
+    def test_get_without_page_is_read_only(self, client, post_id):
+        """Без готовой страницы ответ читается из comments, а страница при чтении не пишется"""
+        db.session.execute(delete(CommentPage))
+        db.session.commit()
+        for url in (f'/posts/{post_id}/comments?limit=20', f'/posts/{post_id}/comments'):
+            with query_budget(route_budget('get_comments'), mode='raise') as budget:
+                assert client.get(url).status_code == 200
+            assert all(statement.startswith('SELECT') for statement in budget.statements)
+        assert db.session.get(CommentPage, post_id) is None
+        # Первая же запись комментария строит страницу целиком
+        client.post(f'/posts/{post_id}/comments', json={'content': 'Свежий комментарий', 'author': 'Мария'})
+        page = db.session.get(CommentPage, post_id)
+        assert (page.total, len(page.items.split('\n'))) == (31, app.config['COMMENT_PAGE_SIZE'])
+        assert self.cached(client, f'/posts/{post_id}/comments?limit=20') == \
+            self.uncached(client, f'/posts/{post_id}/comments?limit=20')
+    
+    def test_writes_update_page_in_place(self, client, post_id):
+        """Создание, изменение и удаление комментария правят страницу без перестроения"""
+        url = f'/posts/{post_id}/comments?limit=20'
+        created = client.post(f'/posts/{post_id}/comments',
+                              json={'content': 'Свежий комментарий', 'author': 'Мария'}).get_json()['data']
+        second = json.loads(self.cached(client, url))['data'][1]
+        client.put(f"/comments/{second['id']}", json={'content': 'Исправленный комментарий'})
+        client.delete(f"/comments/{created['id']}")
+        data = json.loads(self.cached(client, f'/posts/{post_id}/comments?limit=10'))
+        assert data['data'][0]['content'] == 'Исправленный комментарий'
+        assert created['id'] not in [comment['id'] for comment in data['data']]
+        page = db.session.get(CommentPage, post_id)
+        # Место удаленного комментария занял следующий по возрасту
+        assert (page.total, len(page.items.split('\n'))) == (30, app.config['COMMENT_PAGE_SIZE'])
+        body = self.cached(client, url)
+        assert json.loads(body)['count'] == 20
+        assert body == self.uncached(client, url)
+    
+    def test_full_list_served_from_complete_page(self, client, sample_comment):
+        """Весь список поста, который помещается в страницу, тоже отдается из нее"""
+        url = f'/posts/{sample_comment.post_id}/comments'
+        client.post(url, json={'content': 'Второй комментарий', 'author': 'Мария'})
+        body = self.cached(client, url)
+        assert json.loads(body)['count'] == 2 and 'has_more' not in json.loads(body)
+        assert body == self.uncached(client, url)
+    
+    def test_debug_response_matches_jsonify(self, client, post_id):
+        """В режиме отладки ответ из готовой страницы с отступами, как у jsonify"""
+        url = f'/posts/{post_id}/comments?limit=5'
+        compact = client.get(url).data
+        app.debug = True
+        try:
+            body = client.get(url).data
+            with app.test_request_context():
+                expected = jsonify(json.loads(compact)).data
+        finally:
+            app.debug = False
+        assert body == expected and body != compact
+    
+    def test_pagination_with_before(self, client, post_id):
+        """Страницы по курсору before проходят все комментарии по одному разу"""
+        url = f'/posts/{post_id}/comments'
+        seen, before = [], None
+        while True:
+            data = client.get(f'{url}?limit=7' + (f'&before={before}' if before else '')).get_json()
+            seen += data['data']
+            if not data['has_more']:
+                break
+            before = data['next_before']
+        assert seen == client.get(url).get_json()['data']
+        assert len(seen) == 30
+        assert client.get(f'{url}?limit=0').status_code == 400
+        assert client.get(f'{url}?before=abc').status_code == 400
+        assert client.get(f'/posts/999/comments?limit=5').status_code == 404
+        assert client.get(f'/posts/999/comments?before=1').status_code == 404
+    
+    def test_group_commit_and_bulk_delete_keep_page_fresh(self, client, post_id):
+        url = f'/posts/{post_id}/comments?limit=20'
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        try:
+            client.post(f'/posts/{post_id}/comments', json={'content': 'Комментарий группой', 'author': 'Спамер'})
+        finally:
+            comment_committer.stop()
+            app.config['COMMENT_GROUP_COMMIT'] = False
+        assert json.loads(self.cached(client, url))['data'][0]['content'] == 'Комментарий группой'
+        
+        app.config['ADMIN_TOKEN'] = 'админ'
+        try:
+            client.delete('/comments?author=Спамер', headers={'X-Admin-Token': 'админ'})
+        finally:
+            app.config['ADMIN_TOKEN'] = None
+        # Массовое удаление строит страницы затронутых постов заново
+        assert db.session.get(CommentPage, post_id).total == 30
+        assert self.cached(client, url) == self.uncached(client, url)
+
+class TestHotPosts:
+    """Тесты рейтинга горячих постов"""
+    
+    def make_posts(self, count):
+        posts = [Post(title=f'Пост {i}', content=f'Содержимое поста {i}.') for i in range(count)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return [post.id for post in posts]
+    
+    def scores(self, client, url='/posts/hot'):
+        return [(post['id'], post['hot_score']) for post in client.get(url).get_json()['data']]
+    
+    def test_comments_update_score_incrementally(self, client):
+        first, second, quiet = self.make_posts(3)
+        for post_id, count in ((first, 1), (second, 3)):
+            for i in range(count):
+                client.post(f'/posts/{post_id}/comments', json={'content': f'Комментарий {i}', 'author': 'Мария'})
+        ranking = self.scores(client)
+        # Посты без комментариев в рейтинг не попадают, свежий комментарий дает около 1
+        assert [post_id for post_id, _ in ranking] == [second, first]
+        assert ranking[0][1] == pytest.approx(3, abs=1e-3) and ranking[1][1] == pytest.approx(1, abs=1e-3)
+        
+        for comment in client.get(f'/posts/{second}/comments').get_json()['data'][:2]:
+            client.delete(f"/comments/{comment['id']}")
+        client.delete(f'/posts/{first}')
+        assert [post_id for post_id, _ in self.scores(client)] == [second]
+        # Инкрементальное значение совпадает с полным пересчетом с точностью julianday (около миллисекунды)
+        incremental = db.session.get(Post, second).hot_score
+        rebuild_hot_scores(db.session)
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(Post, second).hot_score == pytest.approx(incremental, abs=1e-6)
+    
+    def test_older_activity_decays(self, client):
+        """Три комментария двухдневной давности весят меньше одного свежего"""
+        old, fresh, yesterday = self.make_posts(3)
+        now = datetime.utcnow()
+        db.session.add_all([Comment(post_id=old, content=f'Старый {i}', author='Иван', created_at=now - timedelta(hours=48))
+                            for i in range(3)])
+        db.session.add(Comment(post_id=fresh, content='Свежий', author='Иван', created_at=now))
+        db.session.add(Comment(post_id=yesterday, content='Вчерашний', author='Иван', created_at=now - timedelta(hours=24)))
+        db.session.commit()
+        rebuild_hot_scores(db.session)
+        db.session.commit()
+        ranking = self.scores(client)
+        assert [post_id for post_id, _ in ranking] == [fresh, old, yesterday]
+        assert [score for _, score in ranking] == pytest.approx([1, 0.75, 0.5], abs=1e-3)
+        assert self.scores(client, '/posts/hot?limit=1') == ranking[:1]
+        assert client.get('/posts/hot?limit=0').status_code == 400
+    
+    def test_ranking_reads_index_only(self, client):
+        """Рейтинг читается по индексу hot_score, без просмотра комментариев"""
+        self.make_posts(1)
+        with query_budget(1, mode='raise') as budget:
+            assert client.get('/posts/hot').status_code == 200
+        assert 'comments' not in budget.statements[0]
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT * FROM posts WHERE deleted_at IS NULL AND hot_score IS NOT NULL '
+            'ORDER BY hot_score DESC LIMIT 10'
+        )).all()
+        assert any('ix_posts_hot_score' in row[-1] for row in plan)
+    
+    def test_hot_scores_command(self, client):
+        post_id, = self.make_posts(1)
+        db.session.add(Comment(post_id=post_id, content='Комментарий', author='Иван'))
+        db.session.commit()
+        assert self.scores(client) == []
+        result = app.test_cli_runner().invoke(args=['hot-scores'])
+        assert result.exit_code == 0, result.output
+        assert 'Пересчитан рейтинг 1 постов' in result.output
+        assert [post_id for post_id, _ in self.scores(client)] == [post_id]
+
+class TestAuthorComments:
+    """Тесты комментариев автора и сводки по автору"""
+    
+    @pytest.fixture
+    def post_ids(self, client):
+        posts = [Post(title=f'Пост {i}', content=f'Содержимое поста {i}.') for i in range(2)]
+        db.session.add_all(posts)
+        db.session.commit()
+        return [post.id for post in posts]
+    
+    def comment(self, client, post_id, author, content='Комментарий'):
+        return client.post(f'/posts/{post_id}/comments', json={'content': content, 'author': author}).get_json()['data']
+    
+    def stats(self, author):
+        db.session.expire_all()
+        stats = db.session.get(AuthorStats, author)
+        return stats and (stats.comment_count, stats.first_seen, stats.last_seen)
+    
+    def test_pages_of_author_comments(self, client, post_ids):
+        created = [self.comment(client, post_ids[i % 2], 'Мария', f'Комментарий {i}') for i in range(25)]
+        self.comment(client, post_ids[0], 'Иван')
+        url = '/authors/Мария/comments'
+        
+        data = client.get(url).get_json()
+        assert data['author'] == {'author': 'Мария', 'comment_count': 25,
+                                  'first_seen': created[0]['created_at'], 'last_seen': created[-1]['created_at']}
+        assert data['count'] == 20 and data['has_more']
+        # Страницы по курсору без пропусков и повторов, новые первыми
+        seen = []
+        page = client.get(f'{url}?limit=10').get_json()
+        while True:
+            seen += page['data']
+            if not page['has_more']:
+                break
+            page = client.get(f"{url}?limit=10&before={page['next_before']}").get_json()
+        assert seen == created[::-1]
+        assert page['next_before'] is None
+        
+        assert client.get('/authors/Никто/comments').status_code == 404
+        assert client.get(f'{url}?limit=0').status_code == 400
+        assert client.get(f'{url}?before=abc').status_code == 400
+    
+    def test_stats_follow_comment_writes(self, client, post_ids):
+        """Сводка правится при создании, смене автора, удалении комментария и поста и групповой фиксации"""
+        first = self.comment(client, post_ids[0], 'Мария')
+        second = self.comment(client, post_ids[1], 'Мария')
+        moved = self.comment(client, post_ids[0], 'Мария')
+        app.config['COMMENT_GROUP_COMMIT'] = True
+        try:
+            grouped = self.comment(client, post_ids[1], 'Мария')
+        finally:
+            comment_committer.stop()
+            app.config['COMMENT_GROUP_COMMIT'] = False
+        first_seen, last_seen = datetime.fromisoformat(first['created_at']), datetime.fromisoformat(grouped['created_at'])
+        assert self.stats('Мария') == (4, first_seen, last_seen)
+        
+        client.put(f"/comments/{moved['id']}", json={'author': 'Иван'})
+        assert self.stats('Иван') == (1, datetime.fromisoformat(moved['created_at']),
+                                      datetime.fromisoformat(moved['created_at']))
+        # Первое и последнее появление не сдвигаются при удалении
+        client.delete(f"/comments/{first['id']}")
+        assert self.stats('Мария') == (2, first_seen, last_seen)
+        client.delete(f'/posts/{post_ids[1]}')
+        assert self.stats('Мария') == (0, first_seen, last_seen)
+        assert self.stats('Иван')[0] == 1
+        assert client.get('/authors/Мария/comments').get_json()['data'] == []
+        assert [c['id'] for c in client.get('/authors/Иван/comments').get_json()['data']] == [moved['id']]
+        
+        incremental = {stats.author: stats.comment_count for stats in AuthorStats.query.all()}
+        rebuild_author_stats(db.session)
+        db.session.commit()
+        assert {stats.author: stats.comment_count for stats in AuthorStats.query.all()} == incremental
+        assert second['id'] not in [c['id'] for c in client.get('/authors/Мария/comments').get_json()['data']]
+    
+    def test_page_reads_author_index(self, client, post_ids):
+        """Страница автора читается по индексу автора, пост - по первичному ключу"""
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT comments.id FROM comments JOIN posts ON comments.post_id = posts.id "
+            "WHERE comments.author = 'Мария' AND comments.deleted_at IS NULL AND posts.deleted_at IS NULL "
+            "ORDER BY comments.created_at DESC, comments.id DESC LIMIT 21"
+        )).all()
+        details = [row[-1] for row in plan]
+        assert any('ix_comments_author_live' in detail for detail in details)
+        assert not any('TEMP B-TREE' in detail for detail in details)
+    
+    def test_seed_and_author_stats_command(self, client):
+        runner = app.test_cli_runner()
+        assert runner.invoke(args=['seed', '--posts', '5', '--comments', '200', '--seed', '3']).exit_code == 0
+        expected = dict(db.session.query(Comment.author, db.func.count()).group_by(Comment.author).all())
+        assert {stats.author: stats.comment_count for stats in AuthorStats.query.all()} == expected
+        
+        db.session.execute(delete(AuthorStats))
+        db.session.commit()
+        result = runner.invoke(args=['author-stats'])
+        assert result.exit_code == 0, result.output
+        assert f'Пересчитана сводка {len(expected)} авторов' in result.output
+        assert {stats.author: stats.comment_count for stats in AuthorStats.query.all()} == expected
+
+class TestExport:
+    """Тесты выгрузки данных"""
+    
+    ADMIN = {'X-Admin-Token': 'токен-выгрузки'}
+    
+    @pytest.fixture
+    def data(self, client):
+        app.config['ADMIN_TOKEN'] = self.ADMIN['X-Admin-Token']
+        seed_database(db.engine, 5, 40, random.Random(3))
+        client.delete('/posts/2')
+        yield
+        app.config['ADMIN_TOKEN'] = None
+    
+    def test_ndjson_gzip(self, client, data):
+        """NDJSON в gzip: живые посты, затем их комментарии в формате ответов API"""
+        response = client.get('/export', headers=self.ADMIN)
+        assert response.mimetype == 'application/gzip'
+        assert '.ndjson.gz' in response.headers['Content-Disposition']
+        records = [json.loads(line) for line in gzip.decompress(response.data).decode('utf-8').splitlines()]
+        posts = [record for record in records if record.pop('type') == 'post']
+        comments = records[len(posts):]
+        assert posts == client.get('/posts').get_json()['data']
+        assert 2 not in {comment['post_id'] for comment in comments}
+        assert len(comments) == Comment.query.filter(Comment.post_id != 2).count()
+        assert comments[0] == client.get(f"/comments/{comments[0]['id']}").get_json()['data']
+    
+    def test_csv_without_gzip(self, client, data):
+        """CSV без сжатия: заголовок и по строке на пост и комментарий"""
+        response = client.get('/export?format=csv&gzip=0', headers=self.ADMIN)
+        assert response.mimetype == 'text/csv'
+        rows = list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))
+        assert [row['type'] for row in rows].count('post') == 4
+        assert rows[0]['title'] and rows[0]['updated_at'] and not rows[0]['author']
+        assert rows[-1]['type'] == 'comment' and rows[-1]['author']
+    
+    def test_requires_admin_and_known_format(self, client, data):
+        assert client.get('/export').status_code == 404
+        assert client.get('/export?format=xml', headers=self.ADMIN).status_code == 400
+    
+    @pytest.mark.parametrize('journal_mode', ['wal', 'delete'])
+    def test_snapshot_does_not_block_writers(self, client, tmp_path, journal_mode):
+        """Запись во время выгрузки не блокируется и не попадает в выгрузку"""
+        path = str(tmp_path / 'export.db')
+        engine = create_engine(f'sqlite:///{path}')
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'PRAGMA journal_mode={journal_mode}')
+            conn.execute(insert(Post.__table__), [{'title': f'Пост {i}', 'content': 'Содержимое'} for i in range(3)])
+            conn.execute(insert(Comment.__table__), [{'post_id': 1, 'content': 'Комментарий', 'author': 'Мария'}])
+        
+        stream = export_stream(engine, 'ndjson', False, 1, 6)
+        first = json.loads(next(stream))
+        # Писатель без ожидания блокировки: при блокировке получил бы "database is locked"
+        writer = sqlite3.connect(path, timeout=0)
+        writer.execute("INSERT INTO comments (post_id, content, author, created_at) "
+                       "VALUES (1, 'Новый комментарий', 'Иван', '2026-01-01 00:00:00')")
+        writer.commit()
+        writer.close()
+        records = [first] + [json.loads(line) for line in stream]
+        engine.dispose()
+        assert [record['type'] for record in records] == ['post'] * 3 + ['comment']
+        assert records[-1]['content'] == 'Комментарий'
+    
+    def test_copy_without_wal_is_paged(self, client, tmp_path, monkeypatch):
+        """Без WAL снимок копируется по шагам backup_database, а не одним шагом"""
+        path = str(tmp_path / 'export.db')
+        engine = create_engine(f'sqlite:///{path}')
+        db.metadata.create_all(engine)
+        seed_database(engine, 10, 300, random.Random(4))
+        copies = []
+        
+        def recording_backup(*args, **kwargs):
+            copies.append(backup_database(*args, **kwargs))
+            return copies[-1]
+        
+        monkeypatch.setattr(sys.modules['app'], 'backup_database', recording_backup)
+        monkeypatch.setitem(app.config, 'BACKUP_PAGES_PER_STEP', 2)
+        monkeypatch.setitem(app.config, 'BACKUP_STEP_PAUSE_MS', 0)
+        records = [json.loads(line) for line in export_stream(engine, 'ndjson', False, 100, 6)]
+        engine.dispose()
+        assert len(records) == 310
+        assert len(copies) == 1 and copies[0].steps == -(-copies[0].pages // 2)
+    
+    def test_export_command(self, client, data, tmp_path):
+        """flask export пишет файл и сообщает число строк"""
+        output = str(tmp_path / 'export.csv.gz')
+        result = app.test_cli_runner().invoke(args=['export', '--format', 'csv', '--output', output])
+        assert result.exit_code == 0, result.output
+        assert f'Выгружено 4 постов и ' in result.output
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(open(output, 'rb').read()).decode('utf-8'))))
+        assert len(rows) == 4 + Comment.query.filter(Comment.post_id != 2).count()
+
+class TestBackup:
+    """Тесты горячего резервного копирования"""
+    
+    @pytest.fixture
+    def file_engine(self, tmp_path):
+        """База в файле на несколько десятков страниц"""
+        path = str(tmp_path / 'blog.db')
+        engine = create_engine(f'sqlite:///{path}')
+        db.metadata.create_all(engine)
+        seed_database(engine, 20, 500, random.Random(5))
+        yield engine, path
+        engine.dispose()
+    
+    def test_writers_proceed_between_steps(self, file_engine, tmp_path):
+        """Между шагами источник не заблокирован, изменение перезапускает копирование"""
+        engine, path = file_engine
+        writes = []
+        
+        def progress(copied, total):
+            if not writes:
+                # Без ожидания блокировки: при блокировке был бы "database is locked"
+                writer = sqlite3.connect(path, timeout=0)
+                writer.execute("UPDATE posts SET title = 'Изменен во время копии' WHERE id = 1")
+                writer.commit()
+                writer.close()
+                writes.append(copied)
+        
+        result = backup_database(engine, str(tmp_path / 'copy.db'), 5, 1, progress)
+        assert writes and result.steps > 1 and result.restarts == 1
+        copy = sqlite3.connect(result.path)
+        assert copy.execute('SELECT title FROM posts WHERE id = 1').fetchone() == ('Изменен во время копии',)
+        assert copy.execute('SELECT count(*) FROM comments').fetchone() == (500,)
+        copy.close()
+        # Временный файл копии переименован, а не оставлен рядом
+        assert sorted(os.listdir(tmp_path)) == ['blog.db', 'copy.db']
+    
+    def test_restart_limit_falls_back_to_single_step(self, file_engine, tmp_path):
+        """Запись после каждого шага не дает копии зациклиться"""
+        engine, path = file_engine
+        writer = sqlite3.connect(path, timeout=0)
+        
+        def progress(copied, total):
+            writer.execute("INSERT INTO comments (post_id, content, author, created_at) "
+                           "VALUES (1, 'Комментарий во время копии', 'Иван', '2026-01-01 00:00:00')")
+            writer.commit()
+        
+        result = backup_database(engine, str(tmp_path / 'copy.db'), 5, 0, progress, max_restarts=2)
+        writer.close()
+        assert result.restarts == 3
+        copy = sqlite3.connect(result.path)
+        assert copy.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+        # В копию попали записи до последнего шага, сделанного одним куском
+        assert copy.execute('SELECT count(*) FROM comments').fetchone() == (500 + 4,)
+        copy.close()
+    
+    def test_scheduler_rotates_backups(self, file_engine, tmp_path):
+        engine, _ = file_engine
+        directory = tmp_path / 'backups'
+        directory.mkdir()
+        for name in ('blog-20200101-000000.db', 'blog-20200102-000000.db', 'notes.txt'):
+            (directory / name).write_text('старое')
+        result = backup_scheduler.run_once(engine, str(directory), 2, 100, 0)
+        assert sorted(os.listdir(directory)) == ['blog-20200102-000000.db', os.path.basename(result.path), 'notes.txt']
+        assert backup_scheduler.last_result == result
+    
+    def test_backup_command(self, client, sample_comment, tmp_path):
+        """flask backup копирует рабочую базу с отчетом о ходе и проверкой"""
+        output = str(tmp_path / 'blog-backup.db')
+        result = app.test_cli_runner().invoke(args=['backup', '--output', output, '--pages', '1', '--pause-ms', '0'])
+        assert result.exit_code == 0, result.output
+        assert 'Скопировано 100%' in result.output and 'целостность проверена' in result.output
+        copy = sqlite3.connect(output)
+        assert copy.execute('SELECT content FROM comments').fetchall() == [(sample_comment.content,)]
+        copy.close()
+
+class TestSoftDelete:
+    """Тесты мягкого удаления и компактора"""
+    
+    @pytest.fixture
+    def commented_post(self, client, sample_post):
+        db.session.execute(insert(Comment), [
+            {'post_id': sample_post.id, 'content': f'Комментарий номер {i}', 'author': 'Алексей'} for i in range(1200)
+        ])
+        db.session.commit()
+        post_id = sample_post.id
+        db.session.expunge_all()
+        return post_id
+    
+    def test_delete_post_is_single_update(self, client, commented_post):
+        """Удаление поста - одна пометка, запись журнала, удаление готовой страницы комментариев
+        и вычитание из сводок авторов; пост и его комментарии сразу скрыты"""
+        comment_id = Comment.query.filter_by(post_id=commented_post).first().id
+        db.session.expunge_all()
+        with query_budget(4, mode='raise') as budget:
+            assert client.delete(f'/posts/{commented_post}').status_code == 200
+        assert budget.statements[0].startswith('UPDATE posts SET') and 'deleted_at' in budget.statements[0]
+        assert budget.statements[1].startswith('INSERT INTO changes')
+        assert budget.statements[2].startswith('DELETE FROM comment_pages')
+        assert budget.statements[3].startswith('UPDATE author_stats SET')
+        
+        assert client.get(f'/posts/{commented_post}').status_code == 404
+        assert client.get('/posts').get_json()['count'] == 0
+        assert client.get(f'/posts/{commented_post}/comments').status_code == 404
+        assert client.get(f'/comments/{comment_id}').status_code == 404
+        assert client.post(f'/posts/{commented_post}/comments',
+                           json={"content": "Новый комментарий", "author": "Мария"}).status_code == 404
+        assert client.delete(f'/posts/{commented_post}').status_code == 404
+        # Строки физически на месте до компактора
+        assert Comment.query.filter_by(post_id=commented_post).count() == 1200
+    
+    def test_delete_comment_hides_it(self, client, commented_post):
+        """Удаленный комментарий пропадает из списка, повторное удаление - 404"""
+        comment_id = Comment.query.filter_by(post_id=commented_post).first().id
+        assert client.delete(f'/comments/{comment_id}').status_code == 200
+        assert client.get(f'/comments/{comment_id}').status_code == 404
+        assert client.put(f'/comments/{comment_id}', json={"content": "Обновленный комментарий"}).status_code == 404
+        assert client.delete(f'/comments/{comment_id}').status_code == 404
+        assert client.get(f'/posts/{commented_post}/comments').get_json()['count'] == 1199
+    
+    def test_compactor_purges_in_batches(self, client, commented_post, sample_comment):
+        """Компактор удаляет комментарии удаленного поста пачками, затем сам пост"""
+        live_comment = sample_comment.id
+        other = Post(title="Другой пост", content="Содержимое другого поста.")
+        db.session.add(other)
+        db.session.commit()
+        doomed = Comment(post_id=other.id, content="Комментарий на удаление", author="Алексей")
+        db.session.add(doomed)
+        db.session.commit()
+        doomed_id = doomed.id
+        client.delete(f'/comments/{doomed_id}')
+        client.delete(f'/posts/{commented_post}')
+        
+        purged = compactor.run_once(db.engine, batch_size=500, vacuum_pages=100)
+        assert purged == {'comments_of_deleted_posts': 1201, 'comments': 1, 'posts': 1}
+        db.session.expire_all()
+        assert db.session.get(Post, commented_post) is None
+        assert db.session.get(Comment, doomed_id) is None
+        assert db.session.get(Comment, live_comment) is None
+        assert db.session.get(Post, other.id) is not None
+        assert compactor.run_once(db.engine, batch_size=500, vacuum_pages=100) == {
+            'comments_of_deleted_posts': 0, 'comments': 0, 'posts': 0}
+    
+    def test_compactor_returns_free_pages(self, client, tmp_path):
+        """После очистки incremental_vacuum возвращает все свободные страницы, а не одну"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'compact.db'}")
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(Post.__table__), {'id': 1, 'title': 'Удаленный пост', 'content': 'Содержимое поста.',
+                                                  'deleted_at': datetime.utcnow()})
+            conn.execute(insert(Comment.__table__), [{'post_id': 1, 'content': 'к' * 1000, 'author': 'Алексей'}
+                                                     for _ in range(500)])
+        purged = compactor.run_once(engine, batch_size=500, vacuum_pages=100000)
+        assert purged == {'comments_of_deleted_posts': 500, 'comments': 0, 'posts': 1}
+        with engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA freelist_count').scalar() == 0
+        engine.dispose()
+    
+    def test_compactor_yields_to_traffic(self, client, commented_post):
+        """Пока идут запросы, компактор ничего не удаляет"""
+        client.delete(f'/posts/{commented_post}')
+        compactor.note_activity()
+        purged = compactor.run_once(db.engine, batch_size=500, vacuum_pages=100, idle_seconds=60)
+        assert purged == {'comments_of_deleted_posts': 0, 'comments': 0, 'posts': 0}
+        assert Comment.query.filter_by(post_id=commented_post).count() == 1200
+    
+    def test_live_comments_use_partial_index(self, client):
+        """Список комментариев поста читается по частичному индексу живых строк"""
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT * FROM comments WHERE post_id = 1 AND deleted_at IS NULL ORDER BY created_at DESC'
+        )).all()
+        assert any('ix_comments_post_id_live' in row[-1] for row in plan)
+
+class TestCascadeDeletes:
+    """Тесты каскадного удаления комментариев средствами базы"""
+    
+    def test_delete_heavily_commented_post(self, client, sample_post):
+        """Пост с тысячами комментариев удаляется без загрузки комментариев, база удаляет их каскадом"""
+        other = Post(title="Другой пост", content="Содержимое другого поста.")
+        db.session.add(other)
+        db.session.commit()
+        post_id, other_id = sample_post.id, other.id
+        db.session.execute(insert(Comment), [
+            {'post_id': post_id if i % 10 else other_id, 'content': f'Комментарий номер {i}', 'author': 'Алексей'}
+            for i in range(20000)
+        ])
+        db.session.commit()
+        db.session.expunge_all()
+        
+        with query_budget(1, name='cascade', mode='raise') as budget:
+            db.session.execute(delete(Post).where(Post.id == post_id))
+            db.session.commit()
+        assert [statement.split()[0] for statement in budget.statements] == ['DELETE']
+        assert Comment.query.filter_by(post_id=post_id).count() == 0
+        assert Comment.query.filter_by(post_id=other_id).count() == 2000
+    
+    def test_foreign_keys_enforced(self, client):
+        """SQLite проверяет внешние ключи на каждом соединении"""
+        assert db.session.execute(text('PRAGMA foreign_keys')).scalar() == 1
+        db.session.add(Comment(post_id=999, content="Комментарий без поста", author="Алексей"))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+    
+    def test_migrations_add_cascade(self, tmp_path):
+        """Миграции переводят старую схему на каскадное удаление без потери данных"""
+        database = tmp_path / 'migrated.db'
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}')
+        command = [sys.executable, '-m', 'flask', '--app', os.path.join(os.path.dirname(__file__), 'app.py'), 'db']
+        subprocess.run(command + ['upgrade', '0001'], env=env, cwd=tmp_path, check=True, capture_output=True)
+        connection = sqlite3.connect(database)
+        connection.execute("INSERT INTO posts (id, title, content) VALUES (1, 'Пост', 'Содержимое поста')")
+        connection.execute("INSERT INTO comments (post_id, content, author) VALUES (1, 'Комментарий', 'Алексей')")
+        connection.commit()
+        
+        subprocess.run(command + ['upgrade'], env=env, cwd=tmp_path, check=True, capture_output=True)
+        assert connection.execute('SELECT count(*) FROM comments').fetchone()[0] == 1
+        # Сводка по авторам заполняется миграцией 0007
+        assert connection.execute('SELECT author, comment_count FROM author_stats').fetchall() == [('Алексей', 1)]
+        connection.execute('PRAGMA foreign_keys=ON')
+        connection.execute('DELETE FROM posts WHERE id = 1')
+        assert connection.execute('SELECT count(*) FROM comments').fetchone()[0] == 0
+        connection.close()
+
+class TestBulkDelete:
+    """Тесты массового удаления комментариев"""
+    
+    ADMIN = {'X-Admin-Token': 'токен-модератора'}
+    
+    @pytest.fixture
+    def spam(self, client, sample_post):
+        app.config['ADMIN_TOKEN'] = self.ADMIN['X-Admin-Token']
+        other = Post(title="Другой пост", content="Содержимое другого поста.")
+        db.session.add(other)
+        db.session.commit()
+        rows = []
+        for i in range(250):
+            rows.append({'post_id': sample_post.id if i % 2 else other.id, 'content': f'Спам номер {i}',
+                         'author': 'Спамер', 'created_at': datetime(2024, 1, 1 + i % 20)})
+        for i in range(10):
+            rows.append({'post_id': sample_post.id, 'content': f'Комментарий номер {i}', 'author': 'Алексей',
+                         'created_at': datetime(2024, 1, 1)})
+        db.session.execute(insert(Comment), rows)
+        db.session.commit()
+        yield sample_post.id, other.id
+        app.config['ADMIN_TOKEN'] = None
+    
+    def test_dry_run_counts_without_deleting(self, client, spam):
+        """Режим dry_run только считает совпадения"""
+        response = client.delete('/comments?author=Спамер&dry_run=1', headers=self.ADMIN)
+        assert response.status_code == 200
+        assert response.get_json()['data'] == {'dry_run': True, 'matched': 250, 'filters': {'author': 'Спамер'}}
+        assert Comment.query.count() == 260
+    
+    def test_delete_by_author_in_chunks(self, client, spam):
+        """Удаление по автору пачками, по восемь выражений на пачку"""
+        rebuild_author_stats(db.session)
+        db.session.commit()
+        app.config['BULK_DELETE_CHUNK_SIZE'] = 100
+        try:
+            with query_budget(route_budget('bulk_delete_comments'), mode='raise') as budget:
+                response = client.delete('/comments?author=Спамер', headers=self.ADMIN)
+        finally:
+            app.config['BULK_DELETE_CHUNK_SIZE'] = 1000
+        data = response.get_json()['data']
+        assert (data['deleted'], data['chunks']) == (250, 3)
+        assert budget.count == 24
+        assert Change.query.filter_by(entity='comment', op='delete').count() == 250
+        assert Comment.query.filter_by(author='Спамер').count() == 0
+        assert Comment.query.filter_by(author='Алексей').count() == 10
+        assert db.session.get(AuthorStats, 'Спамер').comment_count == 0
+        assert db.session.get(AuthorStats, 'Алексей').comment_count == 10
+    
+    def test_delete_by_post_and_time_range(self, client, spam):
+        """Фильтры по посту и времени объединяются через AND"""
+        post_id, _ = spam
+        before = Comment.query.filter(Comment.post_id == post_id, Comment.created_at < datetime(2024, 1, 5)).count()
+        response = client.delete(f'/comments?post_id={post_id}&before=2024-01-05T00:00:00Z', headers=self.ADMIN)
+        assert response.get_json()['data']['deleted'] == before
+        assert Comment.query.filter(Comment.post_id == post_id, Comment.created_at < datetime(2024, 1, 5)).count() == 0
+        assert Comment.query.filter(Comment.post_id == post_id).count() > 0
+    
+    def test_skips_tombstoned_comments_and_deleted_posts(self, client, spam):
+        """Помеченные удаленными комментарии и комментарии удаленных постов не удаляются повторно"""
+        post_id, other_id = spam
+        tombstoned = Comment.query.filter_by(author='Алексей').first().id
+        assert client.delete(f'/comments/{tombstoned}').status_code == 200
+        assert client.delete(f'/posts/{other_id}').status_code == 200
+        
+        dry_run = client.delete('/comments?author=Алексей&dry_run=1', headers=self.ADMIN).get_json()['data']
+        assert dry_run['matched'] == 9
+        assert client.delete('/comments?author=Спамер&dry_run=1', headers=self.ADMIN).get_json()['data']['matched'] == 125
+        assert client.delete('/comments?author=Алексей', headers=self.ADMIN).get_json()['data']['deleted'] == 9
+        # Одна запись журнала на комментарий
+        assert Change.query.filter_by(entity='comment', op='delete', entity_id=tombstoned).count() == 1
+    
+    def test_requires_filter_and_admin(self, client, spam):
+        """Без фильтров, с неверными параметрами или без токена ничего не удаляется"""
+        assert client.delete('/comments', headers=self.ADMIN).status_code == 400
+        assert client.delete('/comments?post_id=abc', headers=self.ADMIN).status_code == 400
+        assert client.delete('/comments?before=вчера', headers=self.ADMIN).status_code == 400
+        assert client.delete('/comments?author=Спамер').status_code == 404
+        assert Comment.query.count() == 260
+
+class TestSeedCommand:
+    """Тесты команды flask seed"""
+    
+    def test_seed_generates_valid_data(self, client):
+        """Сгенерированные посты и комментарии проходят валидацию"""
+        result = app.test_cli_runner().invoke(args=['seed', '--posts', '20', '--comments', '500',
+                                                     '--seed', '1', '--batch-size', '200'])
+        assert result.exit_code == 0, result.output
+        assert 'Добавлено 20 постов и 500 комментариев' in result.output
+        
+        posts = {post.id: post for post in Post.query.all()}
+        comments = Comment.query.all()
+        assert len(posts) == 20
+        assert len(comments) == 500
+        for post in posts.values():
+            assert validate_post_data({'title': post.title, 'content': post.content}) == []
+        for comment in comments:
+            assert validate_comment_data({'content': comment.content, 'author': comment.author}) == []
+            assert comment.created_at >= posts[comment.post_id].created_at
+        # Популярные посты получают заметно больше комментариев
+        per_post = sorted(db.session.query(db.func.count(Comment.id)).group_by(Comment.post_id).all())
+        assert per_post[-1][0] > 500 / 20 * 2
+    
+    def test_seed_is_reproducible_and_appends(self, client, sample_post):
+        """Одинаковое зерно дает одинаковые тексты; посты добавляются после существующих"""
+        runner = app.test_cli_runner()
+        runner.invoke(args=['seed', '--posts', '3', '--comments', '10', '--seed', '7'])
+        runner.invoke(args=['seed', '--posts', '3', '--comments', '10', '--seed', '7'])
+        posts = Post.query.order_by(Post.id).all()
+        assert [post.id for post in posts] == list(range(sample_post.id, sample_post.id + 7))
+        assert [post.title for post in posts[1:4]] == [post.title for post in posts[4:7]]
+        comments = Comment.query.order_by(Comment.id).all()
+        assert [c.content for c in comments[:10]] == [c.content for c in comments[10:]]
+
+class TestQueryBudgets:
+    """Тесты бюджетов SQL-запросов"""
+    
+    def test_every_route_declares_budget(self, client):
+        """Каждый маршрут объявляет бюджет SQL-запросов"""
+        missing = [rule.endpoint for rule in app.url_map.iter_rules()
+                   if rule.endpoint != 'static' and route_budget(rule.endpoint) is None]
+        assert missing == []
+    
+    def test_endpoints_within_budget(self, client, sample_post, tmp_path):
+        """Маршруты укладываются в бюджет на посте с несколькими комментариями"""
+        app.config.update(PROFILING_ENABLED=True, PROFILING_SECRET='секрет', PROFILING_DIR=str(tmp_path))
+        profile_id = client.get('/', headers={'X-Profile': 'секрет'}).headers['X-Profile-Id']
+        post_id = sample_post.id
+        for i in range(5):
+            db.session.add(Comment(post_id=post_id, content=f"Комментарий номер {i}", author="Алексей"))
+        db.session.commit()
+        comment_id = Comment.query.filter_by(post_id=post_id).first().id
+        
+        calls = [
+            ('index', 'GET', '/', None),
+            ('get_posts', 'GET', '/posts', None),
+            ('get_posts', 'GET', f'/posts?ids={post_id},{post_id + 1}', None),
+            ('get_hot_posts', 'GET', '/posts/hot', None),
+            ('get_post', 'GET', f'/posts/{post_id}', None),
+            ('create_post', 'POST', '/posts', {"title": "Новый пост", "content": "Содержимое нового поста."}),
+            ('update_post', 'PUT', f'/posts/{post_id}', {"title": "Обновленный заголовок"}),
+            ('get_comments', 'GET', f'/posts/{post_id}/comments', None),
+            ('stream_comments', 'GET', f'/posts/{post_id}/comments/stream', None),
+            ('create_comment', 'POST', f'/posts/{post_id}/comments', {"content": "Новый комментарий", "author": "Мария"}),
+            ('get_author_comments', 'GET', '/authors/Мария/comments', None),
+            ('get_comment', 'GET', f'/comments/{comment_id}', None),
+            ('get_comments_by_ids', 'GET', f'/comments?ids={comment_id},{comment_id + 1}', None),
+            ('update_comment', 'PUT', f'/comments/{comment_id}', {"content": "Обновленный комментарий", "author": "Мария"}),
+            ('delete_comment', 'DELETE', f'/comments/{comment_id}', None),
+            ('delete_post', 'DELETE', f'/posts/{post_id}', None),
+            ('prometheus_metrics', 'GET', '/metrics', None),
+            ('get_profile', 'GET', f'/profiles/{profile_id}', None),
+            ('start_memory_tracing', 'POST', '/admin/memory/start', None),
+            ('take_memory_snapshot', 'POST', '/admin/memory/snapshots', None),
+            ('take_memory_snapshot', 'POST', '/admin/memory/snapshots', None),
+            ('get_memory_snapshot', 'GET', '/admin/memory/snapshots/1', None),
+            ('diff_memory_snapshots', 'GET', '/admin/memory/diff', None),
+            ('memory_status', 'GET', '/admin/memory', None),
+            ('stop_memory_tracing', 'POST', '/admin/memory/stop', None),
+            ('bulk_delete_comments', 'DELETE', '/comments?author=Алексей&dry_run=1', None),
+            ('export_data', 'GET', '/export', None),
+            ('get_changes', 'GET', '/changes?since=0&limit=5', None),
+            ('batch', 'POST', '/batch', {'operations': [
+                {'method': 'POST', 'path': '/posts', 'body': {"title": "Пост из пакета", "content": "Содержимое поста."}},
+                {'method': 'GET', 'path': '/posts'},
+            ]}),
+        ]
+        app.config['ADMIN_TOKEN'] = 'админ'
+        memory_profiler.reset()
+        admin_headers = {'X-Admin-Token': 'админ'}
+        headers = {'get_profile': {'X-Profile': 'секрет'}}
+        # Каждый маршрут приложения должен быть проверен
+        assert {call[0] for call in calls} == {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+        # Выгрузка выполняет выражения при отдаче потока, вне бюджета маршрута, а тестовый клиент
+        # читает первый фрагмент ответа внутри блока: режим журнала, BEGIN снимка WAL и две выборки
+        streamed = {'export_data': 4}
+        for endpoint, method, url, body in calls:
+            # Пустая сессия: объекты не берутся из identity map предыдущих запросов
+            db.session.expunge_all()
+            with query_budget(route_budget(endpoint) + streamed.get(endpoint, 0), name=endpoint, mode='raise'):
+                response = client.open(url, method=method, json=body, headers=headers.get(endpoint, admin_headers))
+            assert response.status_code < 400, endpoint
+            # Потоковый ответ держит контекст запроса до закрытия
+            response.close()
+        app.config.update(PROFILING_ENABLED=False, PROFILING_SECRET=None, ADMIN_TOKEN=None)
+        memory_profiler.reset()
+    
+    def test_lazy_loading_exceeds_budget(self, client, sample_comment):
+        """Ленивая загрузка Post.comments в цикле ловится бюджетом"""
+        db.session.add(Post(title="Второй пост", content="Содержимое второго поста."))
+        db.session.commit()
+        db.session.expunge_all()
+        with pytest.raises(QueryBudgetExceeded) as error:
+            with query_budget(1, name='N+1', mode='raise'):
+                [len(post.comments) for post in Post.query.all()]
+        assert len(error.value.statements) == 3
+    
+    def test_budget_off_mode_collects_nothing(self, client, sample_post):
+        """В режиме off выражения не собираются"""
+        with query_budget(0, mode='off') as budget:
+            Post.query.all()
+        assert budget.count == 0
+    
+    def test_budget_log_mode(self, client, sample_post, caplog):
+        """В режиме log превышение только пишется в журнал"""
+        with caplog.at_level('WARNING'):
+            with query_budget(0, name='проверка', mode='log'):
+                Post.query.all()
+        assert 'Превышен бюджет SQL-запросов' in caplog.text
+
 class TestValidation:
     """Тесты валидации данных"""
     
@@ -5,9 +5,35 @@
 
 import requests
 import json
+from werkzeug.exceptions import HTTPException
+
+from app import app
 
 BASE_URL = "http://localhost:5050"
 
+# Бюджеты SQL-запросов объявлены маршрутами в app.py (@query_budget);
+# сервер в режиме отладки возвращает фактическое число запросов в X-DB-Queries
+url_adapter = app.url_map.bind('localhost')
+budget_violations = []
+
+def check_query_budget(response, *args, **kwargs):
+    """Сравнение X-DB-Queries с бюджетом маршрута"""
+    queries = response.headers.get('X-DB-Queries')
+    if queries is None:
+        return
+    path = requests.utils.urlparse(response.url).path
+    try:
+        endpoint, _ = url_adapter.match(path, response.request.method)
+    except HTTPException:
+        return
+    budget = getattr(app.view_functions[endpoint], 'query_budget', None)
+    if budget is not None and int(queries) > budget:
+        budget_violations.append(f"{response.request.method} {path}: {queries} SQL-запросов при бюджете {budget}")
+        print(f"   ⚠️ Превышен бюджет SQL-запросов: {queries} > {budget}")
+
+session = requests.Session()
+session.hooks['response'].append(check_query_budget)
+
 def test_comments_api():
     """Тестирование всех операций с комментариями"""
     
@@ -22,7 +48,7 @@ def test_comments_api():
     }
     
     try:
-        response = requests.post(f"{BASE_URL}/posts", json=test_post)
+        response = session.post(f"{BASE_URL}/posts", json=test_post)
         print(f"   Статус: {response.status_code}")
         result = response.json()
         print(f"   Ответ: {result}")
@@ -40,7 +66,7 @@ def test_comments_api():
     # 2. Получение комментариев к посту (должно быть пусто)
     print(f"\n2. Получение комментариев к посту {post_id}...")
     try:
-        response = requests.get(f"{BASE_URL}/posts/{post_id}/comments")
+        response = session.get(f"{BASE_URL}/posts/{post_id}/comments")
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -53,7 +79,7 @@ def test_comments_api():
         "author": "Алексей"
     }
     try:
-        response = requests.post(f"{BASE_URL}/posts/{post_id}/comments", json=comment1)
+        response = session.post(f"{BASE_URL}/posts/{post_id}/comments", json=comment1)
         print(f"   Статус: {response.status_code}")
         result = response.json()
         print(f"   Ответ: {result}")
@@ -69,7 +95,7 @@ def test_comments_api():
         "author": "Мария"
     }
     try:
-        response = requests.post(f"{BASE_URL}/posts/{post_id}/comments", json=comment2)
+        response = session.post(f"{BASE_URL}/posts/{post_id}/comments", json=comment2)
         print(f"   Статус: {response.status_code}")
         result = response.json()
         print(f"   Ответ: {result}")
@@ -81,7 +107,7 @@ def test_comments_api():
     # 5. Получение всех комментариев к посту
     print(f"\n5. Получение всех комментариев к посту {post_id}...")
     try:
-        response = requests.get(f"{BASE_URL}/posts/{post_id}/comments")
+        response = session.get(f"{BASE_URL}/posts/{post_id}/comments")
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -91,7 +117,7 @@ def test_comments_api():
     if comment1_id:
         print(f"\n6. Получение комментария с ID {comment1_id}...")
         try:
-            response = requests.get(f"{BASE_URL}/comments/{comment1_id}")
+            response = session.get(f"{BASE_URL}/comments/{comment1_id}")
             print(f"   Статус: {response.status_code}")
             print(f"   Ответ: {response.json()}")
         except Exception as e:
@@ -105,7 +131,7 @@ def test_comments_api():
             "author": "Алексей Петров"
         }
         try:
-            response = requests.put(f"{BASE_URL}/comments/{comment1_id}", json=updated_comment)
+            response = session.put(f"{BASE_URL}/comments/{comment1_id}", json=updated_comment)
             print(f"   Статус: {response.status_code}")
             print(f"   Ответ: {response.json()}")
         except Exception as e:
@@ -114,7 +140,7 @@ def test_comments_api():
     # 8. Тест создания комментария к несуществующему посту
     print(f"\n8. Тест создания комментария к несуществующему посту...")
     try:
-        response = requests.post(f"{BASE_URL}/posts/999/comments", json=comment1)
+        response = session.post(f"{BASE_URL}/posts/999/comments", json=comment1)
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -127,7 +153,7 @@ def test_comments_api():
         "author": "A"     # Слишком короткое имя
     }
     try:
-        response = requests.post(f"{BASE_URL}/posts/{post_id}/comments", json=invalid_comment)
+        response = session.post(f"{BASE_URL}/posts/{post_id}/comments", json=invalid_comment)
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -137,7 +163,7 @@ def test_comments_api():
     if comment2_id:
         print(f"\n10. Удаление комментария с ID {comment2_id}...")
         try:
-            response = requests.delete(f"{BASE_URL}/comments/{comment2_id}")
+            response = session.delete(f"{BASE_URL}/comments/{comment2_id}")
             print(f"   Статус: {response.status_code}")
             print(f"   Ответ: {response.json()}")
         except Exception as e:
@@ -146,7 +172,7 @@ def test_comments_api():
     # 11. Проверка удаления
     print(f"\n11. Проверка удаления комментария...")
     try:
-        response = requests.get(f"{BASE_URL}/posts/{post_id}/comments")
+        response = session.get(f"{BASE_URL}/posts/{post_id}/comments")
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -155,7 +181,7 @@ def test_comments_api():
     # 12. Удаление поста (комментарии должны удалиться автоматически)
     print(f"\n12. Удаление поста (комментарии должны удалиться автоматически)...")
     try:
-        response = requests.delete(f"{BASE_URL}/posts/{post_id}")
+        response = session.delete(f"{BASE_URL}/posts/{post_id}")
         print(f"   Статус: {response.status_code}")
         print(f"   Ответ: {response.json()}")
     except Exception as e:
@@ -165,14 +191,19 @@ def test_comments_api():
     if comment1_id:
         print(f"\n13. Проверка, что комментарии удалились вместе с постом...")
         try:
-            response = requests.get(f"{BASE_URL}/comments/{comment1_id}")
+            response = session.get(f"{BASE_URL}/comments/{comment1_id}")
             print(f"   Статус: {response.status_code}")
             print(f"   Ответ: {response.json()}")
         except Exception as e:
             print(f"   Ошибка: {e}")
     
     print("\n" + "=" * 60)
+    if budget_violations:
+        print("⚠️ Превышены бюджеты SQL-запросов:")
+        for violation in budget_violations:
+            print(f"   {violation}")
     print("✅ Тестирование комментариев завершено!")
+    assert not budget_violations
 
 if __name__ == "__main__":
     test_comments_api()